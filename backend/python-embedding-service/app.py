@@ -13,12 +13,25 @@ TasteInsight 嵌入服务
 - app.py: Flask 应用入口
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+import functools
 import logging
+import time
 import traceback
 
 from config import Config
-from services import EmbeddingService
+from services import EmbeddingService, AdmissionController, DeadlineExceeded
+from services import metrics
+from services.admission import admission_limit, parse_deadline
+from services.degradation import (
+    DEGRADE_HEADER, STEP_TEXT_FALLBACK, DegradationPlan, DegradationPolicy, parse_policy, resolve_mode,
+)
+from services.profiling import ProfileDenied, RequestProfile, resolve_profile_mode
+from services.priority_scheduler import PRIORITY_BULK, PRIORITY_HEADER, PRIORITY_INTERACTIVE, resolve_priority
+from services.serialization import (
+    FORMAT_NDJSON, negotiate_format, negotiate_stream_format, resolve_dtype,
+    build_embedding_response, encode_multi_embeddings, resolve_output_format, iter_ndjson, encode_stream_chunk, encode_stream_end,
+)
 
 # 配置日志
 logging.basicConfig(
@@ -33,6 +46,19 @@ app = Flask(__name__)
 # 全局嵌入服务实例
 embedding_service: EmbeddingService = None
 
+# 准入控制（每个 worker 进程独立计数，上限低于 worker 线程数，超出的请求才能及时收到 429）
+admission = AdmissionController(
+    max_in_flight=admission_limit(Config.MAX_IN_FLIGHT, Config.WORKER_THREADS),
+    retry_after=Config.RETRY_AFTER_SECONDS,
+)
+
+# 过载降级策略
+degradation = DegradationPolicy(
+    parse_policy(Config.DEGRADATION_POLICY),
+    enabled=Config.DEGRADATION_ENABLED,
+    truncate_chars=Config.DEGRADATION_TRUNCATE_CHARS,
+)
+
 
 def init_service():
     """初始化嵌入服务"""
@@ -53,13 +79,31 @@ def init_service():
         text_model_name=Config.TEXT_MODEL,
         device=Config.DEVICE,
         model_dir=Config.MODEL_DIR,
-        default_version=Config.DEFAULT_VERSION
+        default_version=Config.DEFAULT_VERSION,
+        micro_batch_enabled=Config.MICRO_BATCH_ENABLED,
+        micro_batch_max_size=Config.MICRO_BATCH_MAX_SIZE,
+        micro_batch_max_wait_ms=Config.MICRO_BATCH_MAX_WAIT_MS,
+        inference_concurrency=Config.INFERENCE_CONCURRENCY,
+        bulk_chunk_size=Config.BULK_CHUNK_SIZE,
+        text_cache_mb=Config.TEXT_CACHE_MB,
+        text_store_dir=Config.TEXT_STORE_DIR or None,
+        text_store_max_mb=Config.TEXT_STORE_MAX_MB,
+        text_precision=Config.TEXT_PRECISION,
+        text_backend=Config.TEXT_BACKEND,
+        onnx_dir=Config.ONNX_DIR,
+        onnx_threads=Config.ONNX_THREADS,
+        text_student_dir=Config.TEXT_STUDENT_DIR or None,
+        text_fast_layers=Config.TEXT_FAST_LAYERS,
+        text_fallback_engine=Config.DEGRADATION_TEXT_ENGINE if Config.DEGRADATION_ENABLED else '',
+        model_precision=Config.MODEL_PRECISION,
+        pca_dims=Config.PCA_DIMS,
     )
     
     # 预加载模型
     if Config.PRELOAD_MODELS:
         logger.info(f"Preloading models: {Config.PRELOAD_MODELS}")
         embedding_service.preload_models(Config.PRELOAD_MODELS)
+        embedding_service.warmup()
     
     logger.info("=" * 60)
     logger.info("Service ready!")
@@ -74,12 +118,16 @@ except Exception as e:
     # 若启动期预加载失败，记录错误并在请求时重试
     logger.warning(f"Deferred initialization due to startup error: {e}")
 
+# 存活/就绪探针只读状态，不触发初始化
+_PROBE_ENDPOINTS = ('liveness_probe', 'readiness_probe')
+
+
 # 使用中间件模式确保服务初始化
 @app.before_request
 def ensure_service_initialized():
     """确保服务在请求前已初始化"""
     global embedding_service
-    if embedding_service is None:
+    if embedding_service is None and request.endpoint not in _PROBE_ENDPOINTS:
         try:
             init_service()
         except Exception as e:
@@ -87,6 +135,87 @@ def ensure_service_initialized():
             # 让健康检查接口返回503，其他接口返回500
 
 
+@app.before_request
+def limit_body_size():
+    """拒绝超过大小上限的请求体（流式接口除外）"""
+    if request.endpoint == 'embed_stream':
+        return None
+    if request.content_length is not None and request.content_length > Config.MAX_BODY_BYTES:
+        metrics.record_rejected('too_large')
+        return jsonify({
+            'error': f'Request body too large: {request.content_length} bytes',
+            'max_body_bytes': Config.MAX_BODY_BYTES,
+        }), 413
+
+
+@app.after_request
+def record_request_metrics(response):
+    """按端点和状态码计数（未匹配路由的请求不计，避免标签基数失控）"""
+    if request.url_rule is not None and request.endpoint != 'prometheus_metrics':
+        metrics.record_request(request.url_rule.rule.lstrip('/'), response.status_code)
+    return response
+
+
+def _admit():
+    """
+    准入检查：解析截止时间并占用在途名额
+    
+    成功时返回 None（调用方负责 admission.release()），否则返回错误响应。
+    """
+    try:
+        g.deadline = parse_deadline(request.headers)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if g.deadline is not None and time.monotonic() >= g.deadline:
+        return _deadline_exceeded_response()
+    
+    if not admission.try_acquire():
+        response = jsonify({'error': 'Service overloaded, please retry later'})
+        response.headers['Retry-After'] = str(admission.retry_after)
+        return response, 429
+    
+    return None
+
+
+def _deadline_exceeded_response():
+    admission.record_expired()
+    return jsonify({'error': 'Request deadline exceeded'}), 504
+
+
+def admission_controlled(view):
+    """推理接口装饰器：过载时返回 429，截止时间已过时返回 504"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        rejected = _admit()
+        if rejected is not None:
+            return rejected
+        try:
+            return view(*args, **kwargs)
+        except DeadlineExceeded:
+            return _deadline_exceeded_response()
+        finally:
+            admission.release()
+    return wrapper
+
+
+def _degradation_plan(version: str, priority: str = PRIORITY_INTERACTIVE) -> DegradationPlan:
+    """
+    根据当前排队延迟为请求选择降级方案
+    
+    批量刷新请求的结果会被写入存储，不做降级。
+    
+    Raises:
+        ValueError: X-Embedding-Degrade 取值非法
+    """
+    used_version = version or embedding_service.model_manager.default_version
+    mode = resolve_mode(request.headers.get(DEGRADE_HEADER))
+    if priority != PRIORITY_INTERACTIVE:
+        return DegradationPlan(version=used_version)
+    return degradation.plan(embedding_service.queue_delay_ms(), used_version, mode,
+                            text_fallback=embedding_service.fallback_text_encoder is not None)
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查"""
@@ -102,8 +231,11 @@ def health_check():
         
         return jsonify({
             'status': 'healthy',
+            'ready': embedding_service.is_ready(),
             'service': 'TasteInsight Embedding Service',
             'config': Config.get_info(),
+            'admission': admission.get_stats(),
+            'degradation': degradation.get_stats(),
             **service_info
         }), 200
     except Exception as e:
@@ -114,7 +246,42 @@ def health_check():
         }), 503
 
 
+@app.route('/health/live', methods=['GET'])
+def liveness_probe():
+    """存活探针：进程能处理请求即返回 200"""
+    return jsonify({'status': 'alive'}), 200
+
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_probe():
+    """就绪探针：服务已初始化且预加载的模型已完成预热时返回 200，否则 503"""
+    if embedding_service is None:
+        return jsonify({'status': 'initializing'}), 503
+    if not embedding_service.is_ready():
+        return jsonify({'status': 'warming_up'}), 503
+    return jsonify({'status': 'ready'}), 200
+
+
+@app.route('/models/status', methods=['GET'])
+def models_status():
+    """模型注册表状态：各版本加载状态、加载耗时、检查点和预热情况"""
+    if embedding_service is None:
+        return jsonify({'status': 'initializing'}), 503
+    return jsonify(embedding_service.get_model_status()), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 指标（多 worker 部署需设置 PROMETHEUS_MULTIPROC_DIR）"""
+    try:
+        body, content_type = metrics.render_metrics()
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+    return Response(body, content_type=content_type)
+
+
 @app.route('/embed', methods=['POST'])
+@admission_controlled
 def embed_single():
     """
     生成单个嵌入
@@ -131,18 +298,24 @@ def embed_single():
             "averageRating": 4.5,
             "reviewCount": 128
         },
-        "version": "v3"  // 可选，默认使用配置的默认版本
+        "version": "v3",  // 可选，默认使用配置的默认版本
+        "output_format": "int8"  // 可选：float32（默认）/ float16 / int8
     }
     
-    响应：
+    响应（默认 JSON，可通过 Accept 选择 octet-stream / x-npy / msgpack）：
     {
         "embedding": [...],
         "dimension": 256,
-        "version": "v3"
+        "version": "v3",
+        "degradation": "none",  // 过载降级时为使用的步骤，如 "version_fallback"
+        "fingerprint": "3f9a...",  // 嵌入指纹，保存后可用 /check_stale 判断是否需要重新计算
+        "output_format": "int8", "scale": 0.0061, "zero_point": -3  // 仅 output_format 非 float32 时
     }
     """
     try:
         data = request.get_json()
+        fmt = negotiate_format(request.accept_mimetypes)
+        dtype = resolve_dtype(request.headers)
         
         # 验证必需字段
         if not data or 'text' not in data:
@@ -151,6 +324,7 @@ def embed_single():
         text = data['text']
         features = data.get('features', {})
         version = data.get('version')  # None 使用默认版本
+        output_format = resolve_output_format(data.get('output_format'), fmt, batch=False)
         
         # 验证版本
         if version and not embedding_service.validate_version(version):
@@ -159,24 +333,39 @@ def embed_single():
                 'supported_versions': embedding_service.model_manager.get_supported_versions()
             }), 400
         
-        # 生成嵌入
-        embedding = embedding_service.generate_embedding(text, features, version)
+        # 过载时降级（plan.version 为实际使用的版本）
+        plan = _degradation_plan(version)
         
-        # 使用的版本
-        used_version = version or embedding_service.model_manager.default_version
+        # 生成嵌入（并发请求经微批调度合并推理；text_fallback 降级时不排队）
+        text = plan.apply_text(text)
+        if plan.text_fallback:
+            embeddings, fallback = embedding_service.generate_embeddings_fallback(
+                [text], [features], plan.version, g.deadline)
+            embedding = embeddings[0]
+            if fallback:
+                plan.mark_applied(STEP_TEXT_FALLBACK)
+        else:
+            embedding = embedding_service.generate_embedding_batched(text, features, plan.version, g.deadline)
         
-        return jsonify({
-            'embedding': embedding.tolist(),
+        return build_embedding_response(embedding, 'embedding', {
             'dimension': len(embedding),
-            'version': used_version,
-        }), 200
+            'version': plan.version,
+            'degradation': plan.label,
+            'fingerprint': embedding_service.fingerprints([text], [features], plan.version,
+                                                          plan.text_fallback_applied)[0],
+        }, fmt=fmt, dtype=dtype, output_format=output_format)
         
+    except DeadlineExceeded:
+        raise
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Embedding generation failed: {e}\n{traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/embed_batch', methods=['POST'])
+@admission_controlled
 def embed_batch():
     """
     批量生成嵌入
@@ -193,19 +382,31 @@ def embed_batch():
                 "features": {...}
             }
         ],
-        "version": "v3"
+        "version": "v3",
+        "priority": "bulk",  // 可选，也可用 X-Embedding-Priority 头；未指定时按条数判断
+        "output_format": "int8"  // 可选：float32（默认）/ float16 / int8（int8 需 JSON 或 msgpack 响应）
     }
     
-    响应：
+    性能分析（需配置 PYTHON_EMBEDDING_ADMIN_TOKEN）：
+        X-Embedding-Profile: timing | torch | cprofile
+        X-Admin-Token: <token>
+    分阶段耗时通过 Server-Timing 响应头返回，torch / cprofile 模式另将 trace 写入 PROFILE_DIR。
+    
+    响应（默认 JSON，可通过 Accept 选择 octet-stream / x-npy / msgpack）：
     {
         "embeddings": [[...], [...]],
         "count": 2,
         "dimension": 256,
-        "version": "v3"
+        "version": "v3",
+        "degradation": "none",
+        "fingerprints": ["3f9a...", "c01d..."],  // 仅 JSON / msgpack 响应包含
+        "output_format": "int8", "scales": [...], "zero_points": [...]  // 仅 output_format 非 float32 时
     }
     """
     try:
         data = request.get_json()
+        fmt = negotiate_format(request.accept_mimetypes)
+        dtype = resolve_dtype(request.headers)
         
         # 验证必需字段
         if not data or 'items' not in data:
@@ -213,10 +414,18 @@ def embed_batch():
         
         items = data['items']
         version = data.get('version')
+        output_format = resolve_output_format(data.get('output_format'), fmt, batch=True)
         
         if not isinstance(items, list) or not items:
             return jsonify({'error': 'items must be a non-empty list'}), 400
         
+        if len(items) > Config.MAX_BATCH_ITEMS:
+            metrics.record_rejected('too_large')
+            return jsonify({
+                'error': f'Too many items: {len(items)}',
+                'max_batch_items': Config.MAX_BATCH_ITEMS,
+            }), 413
+        
         # 验证版本
         if version and not embedding_service.validate_version(version):
             return jsonify({
@@ -224,29 +433,391 @@ def embed_batch():
                 'supported_versions': embedding_service.model_manager.get_supported_versions()
             }), 400
         
+        priority = resolve_priority(
+            request.headers.get(PRIORITY_HEADER) or data.get('priority'),
+            len(items),
+            Config.PRIORITY_BULK_THRESHOLD,
+        )
+        
+        profile_mode = resolve_profile_mode(request.headers, Config.ADMIN_TOKEN)
+        plan = _degradation_plan(version, priority)
+        
         # 提取文本和特征
-        texts = [item.get('text', '') for item in items]
+        texts = plan.apply_texts([item.get('text', '') for item in items])
         features_list = [item.get('features', {}) for item in items]
         
-        # 批量生成嵌入
-        embeddings = embedding_service.generate_embeddings_batch(texts, features_list, version)
+        if profile_mode is None:
+            # 批量生成嵌入
+            if plan.text_fallback:
+                embeddings, fallback = embedding_service.generate_embeddings_fallback(
+                    texts, features_list, plan.version, g.deadline
+                )
+                if fallback:
+                    plan.mark_applied(STEP_TEXT_FALLBACK)
+            else:
+                embeddings = embedding_service.generate_embeddings_batch(
+                    texts, features_list, plan.version, g.deadline, priority
+                )
+            
+            return build_embedding_response(embeddings, 'embeddings', {
+                'count': len(embeddings),
+                'dimension': embeddings.shape[1],
+                'version': plan.version,
+                'degradation': plan.label,
+                'fingerprints': embedding_service.fingerprints(texts, features_list, plan.version,
+                                                               plan.text_fallback_applied),
+            }, fmt=fmt, dtype=dtype, output_format=output_format)
+        
+        # 性能分析：分阶段耗时通过 Server-Timing 头返回
+        profile = RequestProfile(profile_mode, Config.PROFILE_DIR)
+        embeddings = embedding_service.generate_embeddings_profiled(
+            texts, features_list, plan.version, g.deadline, priority, profile
+        )
+        with profile.stage('serialize'):
+            response = build_embedding_response(embeddings, 'embeddings', {
+                'count': len(embeddings),
+                'dimension': embeddings.shape[1],
+                'version': plan.version,
+                'degradation': plan.label,
+                'fingerprints': embedding_service.fingerprints(texts, features_list, plan.version),
+            }, fmt=fmt, dtype=dtype, output_format=output_format)
+        response.headers.update(profile.response_headers())
+        profile.save_summary()
+        return response
         
-        # 使用的版本
+    except DeadlineExceeded:
+        raise
+    except ProfileDenied as e:
+        return jsonify({'error': str(e)}), 403
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Batch embedding generation failed: {e}\n{traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/embed_features', methods=['POST'])
+@admission_controlled
+def embed_features():
+    """
+    只更新数值特征的批量刷新（文本未变化，跳过文本编码器）
+    
+    请求体：
+    {
+        "items": [
+            {
+                "text_embedding": [...],  // 之前计算的文本向量（768 维）
+                "features": {...}
+            },
+            {
+                "text": "宫保鸡丁",  // 或直接给文本：从文本缓存 / 持久化存储取向量
+                "features": {...}
+            }
+        ],
+        "version": "v3",
+        "priority": "bulk"  // 可选，仅影响缓存未命中需要重新编码的文本
+    }
+    
+    响应（默认 JSON，可通过 Accept 选择 octet-stream / x-npy / msgpack）：
+    {
+        "embeddings": [[...], [...]],
+        "count": 2,
+        "dimension": 256,
+        "version": "v3",
+        "text_encoded": 0,  // 缓存和存储都未命中、重新编码的文本数
+        "fingerprints": [null, "c01d..."]  // 只提供 text_embedding 的条目没有指纹
+    }
+    """
+    try:
+        data = request.get_json()
+        fmt = negotiate_format(request.accept_mimetypes)
+        dtype = resolve_dtype(request.headers)
+        
+        if not data or 'items' not in data:
+            return jsonify({'error': 'Missing required field: items'}), 400
+        
+        items = data['items']
+        version = data.get('version')
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items must be a non-empty list'}), 400
+        
+        if len(items) > Config.MAX_BATCH_ITEMS:
+            metrics.record_rejected('too_large')
+            return jsonify({
+                'error': f'Too many items: {len(items)}',
+                'max_batch_items': Config.MAX_BATCH_ITEMS,
+            }), 413
+        
+        if version and not embedding_service.validate_version(version):
+            return jsonify({
+                'error': f'Invalid version: {version}',
+                'supported_versions': embedding_service.model_manager.get_supported_versions()
+            }), 400
+        
+        priority = resolve_priority(
+            request.headers.get(PRIORITY_HEADER) or data.get('priority'),
+            len(items),
+            Config.PRIORITY_BULK_THRESHOLD,
+        )
         used_version = version or embedding_service.model_manager.default_version
+        features_list = [item.get('features', {}) for item in items]
+        texts = [item.get('text') for item in items]
         
-        return jsonify({
-            'embeddings': embeddings.tolist(),
+        embeddings, text_encoded = embedding_service.refresh_features(
+            features_list,
+            [item.get('text_embedding') for item in items],
+            texts,
+            used_version, g.deadline, priority,
+        )
+        
+        return build_embedding_response(embeddings, 'embeddings', {
             'count': len(embeddings),
             'dimension': embeddings.shape[1],
             'version': used_version,
+            'text_encoded': text_encoded,
+            'fingerprints': embedding_service.fingerprints(texts, features_list, used_version),
+        }, fmt=fmt, dtype=dtype)
+        
+    except DeadlineExceeded:
+        raise
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Feature refresh failed: {e}\n{traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/embed_multi', methods=['POST'])
+@admission_controlled
+def embed_multi():
+    """
+    同一批输入同时生成多个版本的嵌入（文本编码和数值编码只做一次）
+    
+    请求体：
+    {
+        "items": [
+            {"text": "宫保鸡丁", "features": {...}}
+        ],
+        "versions": ["v2", "v3"],
+        "priority": "bulk"  // 可选，规则同 /embed_batch
+    }
+    
+    响应（JSON，Accept: application/msgpack 时为 msgpack）：
+    {
+        "embeddings": {"v2": [[...]], "v3": [[...]]},
+        "count": 1,
+        "dimensions": {"v2": 788, "v3": 256},
+        "versions": ["v2", "v3"],
+        "fingerprints": {"v2": ["..."], "v3": ["..."]}
+    }
+    """
+    try:
+        data = request.get_json()
+        fmt = negotiate_format(request.accept_mimetypes)
+        dtype = resolve_dtype(request.headers)
+        
+        if not data or 'items' not in data or 'versions' not in data:
+            return jsonify({'error': 'Missing required field: items, versions'}), 400
+        
+        items = data['items']
+        versions = data['versions']
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items must be a non-empty list'}), 400
+        if not isinstance(versions, list) or not versions:
+            return jsonify({'error': 'versions must be a non-empty list'}), 400
+        
+        if len(items) > Config.MAX_BATCH_ITEMS:
+            metrics.record_rejected('too_large')
+            return jsonify({
+                'error': f'Too many items: {len(items)}',
+                'max_batch_items': Config.MAX_BATCH_ITEMS,
+            }), 413
+        
+        versions = list(dict.fromkeys(versions))
+        for version in versions:
+            if not isinstance(version, str) or not embedding_service.validate_version(version):
+                return jsonify({
+                    'error': f'Invalid version: {version}',
+                    'supported_versions': embedding_service.model_manager.get_supported_versions()
+                }), 400
+        
+        priority = resolve_priority(
+            request.headers.get(PRIORITY_HEADER) or data.get('priority'),
+            len(items),
+            Config.PRIORITY_BULK_THRESHOLD,
+        )
+        
+        texts = [item.get('text', '') for item in items]
+        features_list = [item.get('features', {}) for item in items]
+        embeddings = embedding_service.generate_embeddings_multi(
+            texts, features_list, versions, g.deadline, priority
+        )
+        
+        body, mimetype, headers = encode_multi_embeddings(embeddings, {
+            'count': len(items),
+            'dimensions': {version: array.shape[1] for version, array in embeddings.items()},
+            'versions': versions,
+            'fingerprints': embedding_service.fingerprints_multi(texts, features_list, versions),
+        }, fmt=fmt, dtype=dtype)
+        return Response(body, mimetype=mimetype, headers=headers)
+        
+    except DeadlineExceeded:
+        raise
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Multi-version embedding failed: {e}\n{traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/check_stale', methods=['POST'])
+def check_stale():
+    """
+    批量判断哪些条目需要重新计算嵌入（不做推理，只做数值编码和哈希）
+    
+    请求体：
+    {
+        "items": [
+            {
+                "id": "dish-1",
+                "fingerprint": "3f9a...",  // 上次嵌入响应中的指纹，没有旧嵌入时为 null
+                "text": "宫保鸡丁",
+                "features": {...}
+            }
+        ],
+        "version": "v3"
+    }
+    
+    响应：
+    {
+        "stale": ["dish-1"],  // 嵌入会发生变化的条目 ID，保持请求顺序
+        "checked": 1,
+        "version": "v3"
+    }
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or 'items' not in data:
+            return jsonify({'error': 'Missing required field: items'}), 400
+        
+        items = data['items']
+        version = data.get('version')
+        
+        if not isinstance(items, list):
+            return jsonify({'error': 'items must be a list'}), 400
+        
+        if len(items) > Config.MAX_CHECK_ITEMS:
+            metrics.record_rejected('too_large')
+            return jsonify({
+                'error': f'Too many items: {len(items)}',
+                'max_check_items': Config.MAX_CHECK_ITEMS,
+            }), 413
+        
+        if version and not embedding_service.validate_version(version):
+            return jsonify({
+                'error': f'Invalid version: {version}',
+                'supported_versions': embedding_service.model_manager.get_supported_versions()
+            }), 400
+        used_version = version or embedding_service.model_manager.default_version
+        
+        stale = embedding_service.stale_ids(
+            [item.get('id') for item in items],
+            [item.get('fingerprint') for item in items],
+            [item.get('text', '') for item in items],
+            [item.get('features', {}) for item in items],
+            used_version,
+        )
+        
+        return jsonify({
+            'stale': stale,
+            'checked': len(items),
+            'version': used_version,
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Batch embedding generation failed: {e}\n{traceback.format_exc()}")
+        logger.error(f"Stale check failed: {e}\n{traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/embed_stream', methods=['POST'])
+def embed_stream():
+    """
+    流式批量生成嵌入（适用于全量重建等超大批次）
+    
+    请求体为 NDJSON（可使用 chunked 传输），每行一个条目：
+        {"text": "宫保鸡丁", "features": {...}}
+        {"text": "麻婆豆腐", "features": {...}}
+    
+    查询参数：
+        version: 模型版本（可选）
+        priority: 优先级（可选，默认 bulk，也可用 X-Embedding-Priority 头）
+    
+    响应按块流式返回，每处理完 STREAM_CHUNK_SIZE 条输出一次：
+    - application/x-ndjson（默认）：每行 {"index": 0, "embedding": [...]}，
+      最后一行为 {"done": true, "count": n}，出错时为 {"error": "...", "count": n}
+    - application/octet-stream：二进制帧序列，以 rows=0 的结束帧收尾，见 services/serialization.py
+    """
+    try:
+        version = request.args.get('version')
+        fmt = negotiate_stream_format(request.accept_mimetypes)
+        dtype = resolve_dtype(request.headers)
+        priority = resolve_priority(
+            request.headers.get(PRIORITY_HEADER) or request.args.get('priority') or PRIORITY_BULK
+        )
+        
+        if version and not embedding_service.validate_version(version):
+            return jsonify({
+                'error': f'Invalid version: {version}',
+                'supported_versions': embedding_service.model_manager.get_supported_versions()
+            }), 400
+        
+        used_version = version or embedding_service.model_manager.default_version
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 流式响应在整个流结束后才释放在途名额
+    rejected = _admit()
+    if rejected is not None:
+        return rejected
+    deadline = g.deadline
+    
+    def generate():
+        items = iter_ndjson(request.stream)
+        count, error = 0, None
+        try:
+            for start_index, embeddings in embedding_service.generate_embeddings_stream(
+                    items, version, chunk_size=Config.STREAM_CHUNK_SIZE, deadline=deadline, priority=priority):
+                yield encode_stream_chunk(start_index, embeddings, fmt=fmt, dtype=dtype, version=used_version)
+                count += len(embeddings)
+        except DeadlineExceeded as e:
+            admission.record_expired()
+            error = str(e)
+        except ValueError as e:
+            logger.warning(f"Invalid stream input: {e}")
+            error = str(e)
+        except Exception as e:
+            logger.error(f"Stream embedding failed: {e}\n{traceback.format_exc()}")
+            error = str(e)
+        
+        # 响应头已发送，处理结果（条数或错误）只能放在流的结束记录中
+        yield encode_stream_end(count, fmt, error)
+    
+    headers = {'X-Embedding-Version': used_version}
+    if fmt != FORMAT_NDJSON:
+        headers['X-Embedding-Dtype'] = dtype
+    
+    response = Response(stream_with_context(generate()), mimetype=fmt, headers=headers)
+    response.call_on_close(admission.release)
+    return response
+
+
 @app.route('/convert_version', methods=['POST'])
+@admission_controlled
 def convert_version():
     """
     转换嵌入版本
@@ -285,7 +856,7 @@ def convert_version():
             return jsonify({'error': 'Missing from_version or to_version'}), 400
         
         # 转换
-        embedding = embedding_service.convert_version(text, features, from_version, to_version)
+        embedding = embedding_service.convert_version(text, features, from_version, to_version, g.deadline)
         
         return jsonify({
             'embedding': embedding.tolist(),
@@ -294,6 +865,8 @@ def convert_version():
             'to_version': to_version,
         }), 200
         
+    except DeadlineExceeded:
+        raise
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
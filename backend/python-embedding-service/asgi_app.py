@@ -0,0 +1,873 @@
+"""
+TasteInsight 嵌入服务 - 异步（ASGI）入口
+
+与 app.py 提供相同的路由（/embed, /embed_batch, /embed_stream, /convert_version, /models, /health 等），
+区别在于：
+- 事件循环只负责 I/O 和请求解析
+- 模型推理在有界的推理线程池中执行，健康检查不会排在慢批次后面
+- 少量 worker 即可保持大量并发连接
+
+启动：
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5001 --workers 2
+"""
+
+import asyncio
+import functools
+import logging
+import time
+import traceback
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from config import Config
+from services import EmbeddingService, AdmissionController, DeadlineExceeded
+from services import metrics
+from services.admission import parse_deadline
+from services.degradation import (
+    DEGRADE_HEADER, STEP_TEXT_FALLBACK, DegradationPlan, DegradationPolicy, parse_policy, resolve_mode,
+)
+from services.profiling import ProfileDenied, RequestProfile, resolve_profile_mode
+from services.priority_scheduler import PRIORITY_BULK, PRIORITY_HEADER, PRIORITY_INTERACTIVE, resolve_priority
+from services.inference_executor import InferenceExecutor
+from services.serialization import (
+    FORMAT_NDJSON, negotiate_format, negotiate_stream_format, resolve_dtype, encode_embeddings,
+    encode_multi_embeddings, resolve_output_format,
+    parse_ndjson_line, encode_stream_chunk, encode_stream_end,
+)
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 全局嵌入服务实例（在后台线程中初始化，初始化期间健康检查返回 503）
+embedding_service: EmbeddingService = None
+executor = InferenceExecutor(max_workers=Config.INFERENCE_WORKERS)
+admission = AdmissionController(
+    max_in_flight=Config.MAX_IN_FLIGHT,
+    retry_after=Config.RETRY_AFTER_SECONDS,
+)
+
+# 过载降级策略
+degradation = DegradationPolicy(
+    parse_policy(Config.DEGRADATION_POLICY),
+    enabled=Config.DEGRADATION_ENABLED,
+    truncate_chars=Config.DEGRADATION_TRUNCATE_CHARS,
+)
+
+
+def init_service() -> EmbeddingService:
+    """初始化嵌入服务（阻塞，在推理线程池中执行）"""
+    global embedding_service
+
+    logger.info("=" * 60)
+    logger.info("TasteInsight Embedding Service (ASGI)")
+    logger.info("=" * 60)
+    logger.info(f"Configuration: {Config.get_info()}")
+
+    service = EmbeddingService(
+        text_model_name=Config.TEXT_MODEL,
+        device=Config.DEVICE,
+        model_dir=Config.MODEL_DIR,
+        default_version=Config.DEFAULT_VERSION,
+        micro_batch_enabled=Config.MICRO_BATCH_ENABLED,
+        micro_batch_max_size=Config.MICRO_BATCH_MAX_SIZE,
+        micro_batch_max_wait_ms=Config.MICRO_BATCH_MAX_WAIT_MS,
+        inference_concurrency=Config.INFERENCE_CONCURRENCY,
+        bulk_chunk_size=Config.BULK_CHUNK_SIZE,
+        text_cache_mb=Config.TEXT_CACHE_MB,
+        text_store_dir=Config.TEXT_STORE_DIR or None,
+        text_store_max_mb=Config.TEXT_STORE_MAX_MB,
+        text_precision=Config.TEXT_PRECISION,
+        text_backend=Config.TEXT_BACKEND,
+        onnx_dir=Config.ONNX_DIR,
+        onnx_threads=Config.ONNX_THREADS,
+        text_student_dir=Config.TEXT_STUDENT_DIR or None,
+        text_fast_layers=Config.TEXT_FAST_LAYERS,
+        text_fallback_engine=Config.DEGRADATION_TEXT_ENGINE if Config.DEGRADATION_ENABLED else '',
+        model_precision=Config.MODEL_PRECISION,
+        pca_dims=Config.PCA_DIMS,
+    )
+
+    if Config.PRELOAD_MODELS:
+        logger.info(f"Preloading models: {Config.PRELOAD_MODELS}")
+        service.preload_models(Config.PRELOAD_MODELS)
+        service.warmup()
+
+    embedding_service = service
+
+    logger.info("=" * 60)
+    logger.info("Service ready!")
+    logger.info("=" * 60)
+    return service
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """启动时在后台加载模型，不阻塞事件循环"""
+    init_task = asyncio.ensure_future(executor.run(init_service))
+    init_task.add_done_callback(_log_init_result)
+    yield
+    executor.shutdown()
+
+
+def _log_init_result(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Failed to initialize service: {task.exception()}")
+
+
+def _not_ready() -> JSONResponse:
+    return JSONResponse({'error': 'Service is still initializing'}, status_code=503)
+
+
+def _accept(request: Request) -> MIMEAccept:
+    return parse_accept_header(request.headers.get('accept'), MIMEAccept)
+
+
+def _embedding_response(array, field: str, metadata: dict, request: Request, output_format: str = 'float32') -> Response:
+    """按 Accept 头编码嵌入响应，output_format 见 resolve_output_format"""
+    fmt = negotiate_format(_accept(request))
+    dtype = resolve_dtype(request.headers)
+    body, mimetype, headers = encode_embeddings(array, field, metadata, fmt=fmt, dtype=dtype,
+                                                output_format=output_format)
+    return Response(body, media_type=mimetype, headers=headers)
+
+
+async def _read_json(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def _deadline_exceeded_response() -> JSONResponse:
+    admission.record_expired()
+    return JSONResponse({'error': 'Request deadline exceeded'}, status_code=504)
+
+
+def _admit(request: Request, limit_body: bool = True):
+    """
+    准入检查：校验请求体大小、解析截止时间并占用在途名额
+    
+    Returns:
+        (deadline, None) 表示准入成功，调用方负责 admission.release()；
+        (None, 错误响应) 表示被拒绝
+    """
+    if limit_body:
+        content_length = request.headers.get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > Config.MAX_BODY_BYTES:
+            metrics.record_rejected('too_large')
+            return None, JSONResponse({
+                'error': f'Request body too large: {content_length} bytes',
+                'max_body_bytes': Config.MAX_BODY_BYTES,
+            }, status_code=413)
+
+    try:
+        deadline = parse_deadline(request.headers)
+    except ValueError as e:
+        return None, JSONResponse({'error': str(e)}, status_code=400)
+
+    if deadline is not None and time.monotonic() >= deadline:
+        return None, _deadline_exceeded_response()
+
+    if not admission.try_acquire():
+        return None, JSONResponse(
+            {'error': 'Service overloaded, please retry later'},
+            status_code=429,
+            headers={'Retry-After': str(admission.retry_after)},
+        )
+
+    return deadline, None
+
+
+def admission_controlled(handler):
+    """
+    推理接口装饰器
+    
+    - 请求体超过上限返回 413
+    - 在途请求已满返回 429 + Retry-After
+    - 截止时间已过返回 504；客户端断开时放弃排队中的工作
+    
+    被装饰的处理函数签名为 handler(request, deadline)。
+    """
+    @functools.wraps(handler)
+    async def wrapper(request: Request) -> Response:
+        deadline, rejected = _admit(request)
+        if rejected is not None:
+            return rejected
+
+        try:
+            return await handler(request, deadline)
+        except DeadlineExceeded:
+            return _deadline_exceeded_response()
+        except ClientDisconnect:
+            # 客户端已断开，响应不会被读取
+            return Response(status_code=499)
+        finally:
+            admission.release()
+
+    return wrapper
+
+
+async def _wait_disconnect(request: Request):
+    """请求体读完后，下一条 ASGI 消息只会是 http.disconnect"""
+    while True:
+        message = await request.receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _await_inference(request: Request, work: asyncio.Future, deadline: float = None):
+    """
+    等待推理结果，截止时间已过或客户端断开时取消仍在排队的工作
+    
+    Raises:
+        DeadlineExceeded: 截止时间前未完成
+        ClientDisconnect: 客户端已断开
+    """
+    disconnect = asyncio.ensure_future(_wait_disconnect(request))
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        done, _ = await asyncio.wait({work, disconnect}, timeout=timeout,
+                                     return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+
+    if work in done:
+        return work.result()
+
+    work.cancel()
+    if disconnect in done:
+        raise ClientDisconnect()
+    raise DeadlineExceeded()
+
+
+def _run_inference(request: Request, deadline: float, fn, *args, priority: str = PRIORITY_INTERACTIVE):
+    """在推理线程池中执行 fn(*args, deadline)"""
+    work = asyncio.ensure_future(executor.run(fn, *args, deadline, priority=priority))
+    return _await_inference(request, work, deadline)
+
+
+async def _run_fallback(request: Request, deadline: float, plan: DegradationPlan, texts, features_list):
+    """text_fallback 降级：在降级线程池中执行，不等待推理槽位"""
+    work = asyncio.ensure_future(executor.run_fallback(
+        embedding_service.generate_embeddings_fallback, texts, features_list, plan.version, deadline))
+    embeddings, fallback = await _await_inference(request, work, deadline)
+    if fallback:
+        plan.mark_applied(STEP_TEXT_FALLBACK)
+    return embeddings
+
+
+def _degradation_plan(request: Request, version: str, priority: str = PRIORITY_INTERACTIVE) -> DegradationPlan:
+    """
+    根据当前排队延迟（含推理线程池排队）为请求选择降级方案，批量刷新请求不降级
+
+    Raises:
+        ValueError: X-Embedding-Degrade 取值非法
+    """
+    used_version = version or embedding_service.model_manager.default_version
+    mode = resolve_mode(request.headers.get(DEGRADE_HEADER))
+    if priority != PRIORITY_INTERACTIVE:
+        return DegradationPlan(version=used_version)
+    queue_delay_ms = max(embedding_service.queue_delay_ms(), executor.queue_delay_ms())
+    return degradation.plan(queue_delay_ms, used_version, mode,
+                            text_fallback=embedding_service.fallback_text_encoder is not None)
+
+
+def _invalid_version(version: str) -> JSONResponse:
+    return JSONResponse({
+        'error': f'Invalid version: {version}',
+        'supported_versions': embedding_service.model_manager.get_supported_versions()
+    }, status_code=400)
+
+
+async def health_check(request: Request) -> JSONResponse:
+    """健康检查（在事件循环中直接响应，不经过推理线程池）"""
+    if embedding_service is None:
+        return JSONResponse({
+            'status': 'initializing',
+            'message': 'Service is still initializing'
+        }, status_code=503)
+
+    try:
+        service_info = embedding_service.get_service_info()
+        return JSONResponse({
+            'status': 'healthy',
+            'ready': embedding_service.is_ready(),
+            'service': 'TasteInsight Embedding Service',
+            'config': Config.get_info(),
+            'executor': executor.get_stats(),
+            'admission': admission.get_stats(),
+            'degradation': degradation.get_stats(),
+            **service_info
+        })
+    except Exception as e:
+        logger.error(f"Health check failed: {e}")
+        return JSONResponse({'status': 'unhealthy', 'error': str(e)}, status_code=503)
+
+
+async def liveness_probe(request: Request) -> JSONResponse:
+    """存活探针：事件循环能响应即返回 200"""
+    return JSONResponse({'status': 'alive'})
+
+
+async def readiness_probe(request: Request) -> JSONResponse:
+    """就绪探针：服务已初始化且预加载的模型已完成预热时返回 200，否则 503"""
+    if embedding_service is None:
+        return JSONResponse({'status': 'initializing'}, status_code=503)
+    if not embedding_service.is_ready():
+        return JSONResponse({'status': 'warming_up'}, status_code=503)
+    return JSONResponse({'status': 'ready'})
+
+
+async def models_status(request: Request) -> JSONResponse:
+    """模型注册表状态：各版本加载状态、加载耗时、检查点和预热情况"""
+    if embedding_service is None:
+        return _not_ready()
+    return JSONResponse(embedding_service.get_model_status())
+
+
+@admission_controlled
+async def embed_single(request: Request, deadline: float = None) -> Response:
+    """生成单个嵌入，请求/响应格式同 app.py 的 /embed"""
+    if embedding_service is None:
+        return _not_ready()
+
+    try:
+        data = await _read_json(request)
+        if not data or 'text' not in data:
+            return JSONResponse({'error': 'Missing required field: text'}, status_code=400)
+
+        text = data['text']
+        features = data.get('features', {})
+        version = data.get('version')
+        output_format = resolve_output_format(data.get('output_format'), negotiate_format(_accept(request)),
+                                              batch=False)
+
+        if version and not embedding_service.validate_version(version):
+            return _invalid_version(version)
+
+        plan = _degradation_plan(request, version)
+        text = plan.apply_text(text)
+
+        if plan.text_fallback:
+            embedding = (await _run_fallback(request, deadline, plan, [text], [features]))[0]
+        elif embedding_service.micro_batcher is not None:
+            # 微批调度线程本身就是推理线程，直接等待其 Future，不额外占用线程池
+            future = embedding_service.micro_batcher.submit(text, features, plan.version, deadline)
+            embedding = await _await_inference(request, asyncio.wrap_future(future), deadline)
+        else:
+            embedding = await _run_inference(
+                request, deadline,
+                embedding_service.generate_embedding,
+                text, features, plan.version,
+            )
+
+        return _embedding_response(embedding, 'embedding', {
+            'dimension': len(embedding),
+            'version': plan.version,
+            'degradation': plan.label,
+            'fingerprint': embedding_service.fingerprints([text], [features], plan.version,
+                                                          plan.text_fallback_applied)[0],
+        }, request, output_format)
+
+    except (DeadlineExceeded, ClientDisconnect):
+        raise
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        logger.error(f"Embedding generation failed: {e}\n{traceback.format_exc()}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+@admission_controlled
+async def embed_batch(request: Request, deadline: float = None) -> Response:
+    """批量生成嵌入，请求/响应格式同 app.py 的 /embed_batch"""
+    if embedding_service is None:
+        return _not_ready()
+
+    try:
+        data = await _read_json(request)
+        if not data or 'items' not in data:
+            return JSONResponse({'error': 'Missing required field: items'}, status_code=400)
+
+        items = data['items']
+        version = data.get('version')
+        output_format = resolve_output_format(data.get('output_format'), negotiate_format(_accept(request)),
+                                              batch=True)
+
+        if not isinstance(items, list) or not items:
+            return JSONResponse({'error': 'items must be a non-empty list'}, status_code=400)
+
+        if len(items) > Config.MAX_BATCH_ITEMS:
+            metrics.record_rejected('too_large')
+            return JSONResponse({
+                'error': f'Too many items: {len(items)}',
+                'max_batch_items': Config.MAX_BATCH_ITEMS,
+            }, status_code=413)
+
+        if version and not embedding_service.validate_version(version):
+            return _invalid_version(version)
+
+        priority = resolve_priority(
+            request.headers.get(PRIORITY_HEADER) or data.get('priority'),
+            len(items),
+            Config.PRIORITY_BULK_THRESHOLD,
+        )
+
+        profile_mode = resolve_profile_mode(request.headers, Config.ADMIN_TOKEN)
+        plan = _degradation_plan(request, version, priority)
+
+        texts = plan.apply_texts([item.get('text', '') for item in items])
+        features_list = [item.get('features', {}) for item in items]
+
+        profile = None
+        if profile_mode is None:
+            batch_fn = functools.partial(embedding_service.generate_embeddings_batch, priority=priority)
+        else:
+            profile = RequestProfile(profile_mode, Config.PROFILE_DIR)
+            batch_fn = functools.partial(embedding_service.generate_embeddings_profiled,
+                                         priority=priority, profile=profile)
+
+        if profile is None and plan.text_fallback:
+            embeddings = await _run_fallback(request, deadline, plan, texts, features_list)
+        else:
+            embeddings = await _run_inference(
+                request, deadline, batch_fn, texts, features_list, plan.version, priority=priority,
+            )
+
+        metadata = {
+            'count': len(embeddings),
+            'dimension': embeddings.shape[1],
+            'version': plan.version,
+            'degradation': plan.label,
+            'fingerprints': embedding_service.fingerprints(texts, features_list, plan.version,
+                                                           plan.text_fallback_applied),
+        }
+        if profile is None:
+            return _embedding_response(embeddings, 'embeddings', metadata, request, output_format)
+
+        with profile.stage('serialize'):
+            response = _embedding_response(embeddings, 'embeddings', metadata, request, output_format)
+        response.headers.update(profile.response_headers())
+        profile.save_summary()
+        return response
+
+    except (DeadlineExceeded, ClientDisconnect):
+        raise
+    except ProfileDenied as e:
+        return JSONResponse({'error': str(e)}, status_code=403)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        logger.error(f"Batch embedding generation failed: {e}\n{traceback.format_exc()}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+@admission_controlled
+async def embed_features(request: Request, deadline: float = None) -> Response:
+    """只更新数值特征的批量刷新，请求/响应格式同 app.py 的 /embed_features"""
+    if embedding_service is None:
+        return _not_ready()
+
+    try:
+        data = await _read_json(request)
+        if not data or 'items' not in data:
+            return JSONResponse({'error': 'Missing required field: items'}, status_code=400)
+
+        items = data['items']
+        version = data.get('version')
+
+        if not isinstance(items, list) or not items:
+            return JSONResponse({'error': 'items must be a non-empty list'}, status_code=400)
+
+        if len(items) > Config.MAX_BATCH_ITEMS:
+            metrics.record_rejected('too_large')
+            return JSONResponse({
+                'error': f'Too many items: {len(items)}',
+                'max_batch_items': Config.MAX_BATCH_ITEMS,
+            }, status_code=413)
+
+        if version and not embedding_service.validate_version(version):
+            return _invalid_version(version)
+
+        priority = resolve_priority(
+            request.headers.get(PRIORITY_HEADER) or data.get('priority'),
+            len(items),
+            Config.PRIORITY_BULK_THRESHOLD,
+        )
+        used_version = version or embedding_service.model_manager.default_version
+        features_list = [item.get('features', {}) for item in items]
+        texts = [item.get('text') for item in items]
+
+        embeddings, text_encoded = await _run_inference(
+            request, deadline,
+            functools.partial(embedding_service.refresh_features, priority=priority),
+            features_list,
+            [item.get('text_embedding') for item in items],
+            texts,
+            used_version,
+            priority=priority,
+        )
+
+        return _embedding_response(embeddings, 'embeddings', {
+            'count': len(embeddings),
+            'dimension': embeddings.shape[1],
+            'version': used_version,
+            'text_encoded': text_encoded,
+            'fingerprints': embedding_service.fingerprints(texts, features_list, used_version),
+        }, request)
+
+    except (DeadlineExceeded, ClientDisconnect):
+        raise
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        logger.error(f"Feature refresh failed: {e}\n{traceback.format_exc()}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+@admission_controlled
+async def embed_multi(request: Request, deadline: float = None) -> Response:
+    """同一批输入同时生成多个版本的嵌入，请求/响应格式同 app.py 的 /embed_multi"""
+    if embedding_service is None:
+        return _not_ready()
+
+    try:
+        data = await _read_json(request)
+        if not data or 'items' not in data or 'versions' not in data:
+            return JSONResponse({'error': 'Missing required field: items, versions'}, status_code=400)
+
+        items = data['items']
+        versions = data['versions']
+
+        if not isinstance(items, list) or not items:
+            return JSONResponse({'error': 'items must be a non-empty list'}, status_code=400)
+        if not isinstance(versions, list) or not versions:
+            return JSONResponse({'error': 'versions must be a non-empty list'}, status_code=400)
+
+        if len(items) > Config.MAX_BATCH_ITEMS:
+            metrics.record_rejected('too_large')
+            return JSONResponse({
+                'error': f'Too many items: {len(items)}',
+                'max_batch_items': Config.MAX_BATCH_ITEMS,
+            }, status_code=413)
+
+        versions = list(dict.fromkeys(versions))
+        for version in versions:
+            if not isinstance(version, str) or not embedding_service.validate_version(version):
+                return _invalid_version(version)
+
+        priority = resolve_priority(
+            request.headers.get(PRIORITY_HEADER) or data.get('priority'),
+            len(items),
+            Config.PRIORITY_BULK_THRESHOLD,
+        )
+
+        texts = [item.get('text', '') for item in items]
+        features_list = [item.get('features', {}) for item in items]
+        embeddings = await _run_inference(
+            request, deadline,
+            functools.partial(embedding_service.generate_embeddings_multi, priority=priority),
+            texts, features_list, versions,
+            priority=priority,
+        )
+
+        body, mimetype, headers = encode_multi_embeddings(embeddings, {
+            'count': len(items),
+            'dimensions': {version: array.shape[1] for version, array in embeddings.items()},
+            'versions': versions,
+            'fingerprints': embedding_service.fingerprints_multi(texts, features_list, versions),
+        }, fmt=negotiate_format(_accept(request)), dtype=resolve_dtype(request.headers))
+        return Response(body, media_type=mimetype, headers=headers)
+
+    except (DeadlineExceeded, ClientDisconnect):
+        raise
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        logger.error(f"Multi-version embedding failed: {e}\n{traceback.format_exc()}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def check_stale(request: Request) -> JSONResponse:
+    """批量判断哪些条目需要重新计算嵌入，请求/响应格式同 app.py 的 /check_stale"""
+    if embedding_service is None:
+        return _not_ready()
+
+    try:
+        data = await _read_json(request)
+        if not data or 'items' not in data:
+            return JSONResponse({'error': 'Missing required field: items'}, status_code=400)
+
+        items = data['items']
+        version = data.get('version')
+
+        if not isinstance(items, list):
+            return JSONResponse({'error': 'items must be a list'}, status_code=400)
+
+        if len(items) > Config.MAX_CHECK_ITEMS:
+            metrics.record_rejected('too_large')
+            return JSONResponse({
+                'error': f'Too many items: {len(items)}',
+                'max_check_items': Config.MAX_CHECK_ITEMS,
+            }, status_code=413)
+
+        if version and not embedding_service.validate_version(version):
+            return _invalid_version(version)
+        used_version = version or embedding_service.model_manager.default_version
+
+        # 不经过推理线程池（不做推理，不应排在推理任务后面），但数值编码和哈希不能阻塞事件循环
+        stale = await run_in_threadpool(
+            embedding_service.stale_ids,
+            [item.get('id') for item in items],
+            [item.get('fingerprint') for item in items],
+            [item.get('text', '') for item in items],
+            [item.get('features', {}) for item in items],
+            used_version,
+        )
+
+        return JSONResponse({
+            'stale': stale,
+            'checked': len(items),
+            'version': used_version,
+        })
+
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        logger.error(f"Stale check failed: {e}\n{traceback.format_exc()}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    请求体与响应体同时流动时使用的流式响应
+
+    StreamingResponse 在旧版 ASGI 协议下会另起任务调用 receive() 监听断开，
+    与读取请求体的 request.stream() 竞争同一个 receive 通道。这里不额外监听，
+    客户端断开由 request.stream() 抛出的 ClientDisconnect 感知。
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+async def _iter_ndjson(request: Request):
+    """按行异步读取 NDJSON 请求体，只缓冲未完成的一行"""
+    buffer = b''
+    line_no = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            line_no += 1
+            item = parse_ndjson_line(line, line_no)
+            if item is not None:
+                yield item
+    item = parse_ndjson_line(buffer, line_no + 1)
+    if item is not None:
+        yield item
+
+
+async def embed_stream(request: Request) -> Response:
+    """流式批量生成嵌入，请求/响应格式同 app.py 的 /embed_stream"""
+    if embedding_service is None:
+        return _not_ready()
+
+    try:
+        version = request.query_params.get('version')
+        fmt = negotiate_stream_format(_accept(request))
+        dtype = resolve_dtype(request.headers)
+        priority = resolve_priority(
+            request.headers.get(PRIORITY_HEADER) or request.query_params.get('priority') or PRIORITY_BULK
+        )
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    if version and not embedding_service.validate_version(version):
+        return _invalid_version(version)
+
+    # 流式接口不限制请求体大小，在途名额在整个流结束后才释放
+    deadline, rejected = _admit(request, limit_body=False)
+    if rejected is not None:
+        return rejected
+
+    chunk_size = Config.STREAM_CHUNK_SIZE
+    used_version = version or embedding_service.model_manager.default_version
+
+    async def generate():
+        start_index = 0
+        texts, features_list = [], []
+        try:
+            async for item in _iter_ndjson(request):
+                texts.append(item.get('text', ''))
+                features_list.append(item.get('features', {}))
+                if len(texts) < chunk_size:
+                    continue
+                embeddings = await executor.run(
+                    embedding_service.generate_embeddings_batch, texts, features_list, version, deadline, priority,
+                    priority=priority,
+                )
+                yield encode_stream_chunk(start_index, embeddings, fmt=fmt, dtype=dtype, version=used_version)
+                start_index += len(texts)
+                texts, features_list = [], []
+
+            if texts:
+                embeddings = await executor.run(
+                    embedding_service.generate_embeddings_batch, texts, features_list, version, deadline, priority,
+                    priority=priority,
+                )
+                yield encode_stream_chunk(start_index, embeddings, fmt=fmt, dtype=dtype, version=used_version)
+                start_index += len(texts)
+
+            # 响应头已发送，处理结果（条数或错误）只能放在流的结束记录中
+            yield encode_stream_end(start_index, fmt)
+        except ClientDisconnect:
+            logger.info(f"Client disconnected from stream after {start_index} items")
+        except DeadlineExceeded as e:
+            admission.record_expired()
+            yield encode_stream_end(start_index, fmt, str(e))
+        except ValueError as e:
+            logger.warning(f"Invalid stream input: {e}")
+            yield encode_stream_end(start_index, fmt, str(e))
+        except Exception as e:
+            logger.error(f"Stream embedding failed: {e}\n{traceback.format_exc()}")
+            yield encode_stream_end(start_index, fmt, str(e))
+        finally:
+            admission.release()
+
+    headers = {'X-Embedding-Version': used_version}
+    if fmt != FORMAT_NDJSON:
+        headers['X-Embedding-Dtype'] = dtype
+
+    return _DuplexStreamingResponse(generate(), media_type=fmt, headers=headers)
+
+
+@admission_controlled
+async def convert_version(request: Request, deadline: float = None) -> JSONResponse:
+    """转换嵌入版本，请求/响应格式同 app.py 的 /convert_version"""
+    if embedding_service is None:
+        return _not_ready()
+
+    try:
+        data = await _read_json(request)
+        if not data or 'text' not in data:
+            return JSONResponse({'error': 'Missing required field: text'}, status_code=400)
+
+        text = data['text']
+        features = data.get('features', {})
+        from_version = data.get('from_version')
+        to_version = data.get('to_version')
+
+        if not from_version or not to_version:
+            return JSONResponse({'error': 'Missing from_version or to_version'}, status_code=400)
+
+        embedding = await _run_inference(
+            request, deadline, embedding_service.convert_version, text, features, from_version, to_version
+        )
+
+        return JSONResponse({
+            'embedding': embedding.tolist(),
+            'dimension': len(embedding),
+            'from_version': from_version,
+            'to_version': to_version,
+        })
+
+    except (DeadlineExceeded, ClientDisconnect):
+        raise
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        logger.error(f"Version conversion failed: {e}\n{traceback.format_exc()}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def prometheus_metrics(request: Request) -> Response:
+    """Prometheus 指标"""
+    try:
+        body, content_type = metrics.render_metrics()
+    except RuntimeError as e:
+        return JSONResponse({'error': str(e)}, status_code=503)
+    return Response(body, headers={'Content-Type': content_type})
+
+
+async def list_models(request: Request) -> JSONResponse:
+    """列出所有支持的模型版本"""
+    if embedding_service is None:
+        return _not_ready()
+
+    try:
+        info = embedding_service.get_service_info()
+        return JSONResponse({
+            'default_version': info['default_version'],
+            'supported_versions': info['supported_versions'],
+            'models': info['models'],
+        })
+    except Exception as e:
+        logger.error(f"Failed to list models: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+class _RequestMetricsMiddleware:
+    """按端点和状态码计数（纯 ASGI 中间件，不缓冲响应体；未知路径不计）"""
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = scope['path'].lstrip('/')
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                metrics.record_request(endpoint, message['status'])
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+routes = [
+    Route('/health', health_check, methods=['GET']),
+    Route('/health/live', liveness_probe, methods=['GET']),
+    Route('/health/ready', readiness_probe, methods=['GET']),
+    Route('/metrics', prometheus_metrics, methods=['GET']),
+    Route('/embed', embed_single, methods=['POST']),
+    Route('/embed_batch', embed_batch, methods=['POST']),
+    Route('/embed_features', embed_features, methods=['POST']),
+    Route('/embed_multi', embed_multi, methods=['POST']),
+    Route('/check_stale', check_stale, methods=['POST']),
+    Route('/embed_stream', embed_stream, methods=['POST']),
+    Route('/convert_version', convert_version, methods=['POST']),
+    Route('/models', list_models, methods=['GET']),
+    Route('/models/status', models_status, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(
+        _RequestMetricsMiddleware,
+        paths=[route.path for route in routes if route.path != '/metrics'],
+    )],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host=Config.HOST, port=Config.PORT)
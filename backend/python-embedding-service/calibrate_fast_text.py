@@ -0,0 +1,184 @@
+"""
+TasteInsight 嵌入服务 - 校准文本编码快速模式
+
+对每个候选层数 K，在菜品语料上只运行 mpnet 的前 K 层编码器，拟合把截断输出映射回完整深度
+768 维空间的线性适配层（encoders/fast_mode.py），并报告延迟与保真度的取舍：
+
+- 保真度：留出集上与完整深度向量的逐条余弦与 top-k 近邻重合率（适配前 / 适配后）
+- 延迟：批量吞吐（条/秒）、单条编码延迟 p50 / p95，以及相对完整深度的加速比
+
+--save 指定的层数用全部语料重新拟合后保存到 MODEL_DIR/text_fast_l{K}.npz，
+服务通过 PYTHON_EMBEDDING_TEXT_FAST_LAYERS=K 启用。
+
+语料来源与 warm_text_store.py 相同（目录导出文件或数据库）。
+
+用法：
+    python calibrate_fast_text.py catalog.jsonl --layers 2,4,6,8,10
+    python calibrate_fast_text.py --from-db --save 6 --min-cosine 0.98 --report fast_text_report.json
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+from config import Config
+from encoders.backends import TorchTextBackend, truncate_layers
+from encoders.fast_mode import adapter_path_for, apply_adapter, fit_adapter, save_adapter
+from models.precision import PRECISION_FP32
+from precision_report import agreement, load_corpus
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def _parse_layers(value: str) -> List[int]:
+    return sorted({int(layer) for layer in value.split(',') if layer.strip()}, reverse=True)
+
+
+def measure_latency(backend: TorchTextBackend, texts: List[str], batch_size: int,
+                    adapter: Dict[str, np.ndarray] = None) -> Dict:
+    """
+    编码吞吐与单条延迟（先用一批预热），adapter 不为空时计入适配层
+
+    Returns:
+        {'texts_per_second', 'latency_ms_p50', 'latency_ms_p95'}
+    """
+    def encode(batch):
+        embeddings = backend.encode(batch, batch_size, False)
+        return apply_adapter(adapter, embeddings) if adapter is not None else embeddings
+
+    with torch.no_grad():
+        encode(texts[:batch_size])
+        start = time.perf_counter()
+        encode(texts)
+        elapsed = time.perf_counter() - start
+
+        latencies = []
+        for text in texts[:200]:
+            t0 = time.perf_counter()
+            encode([text])
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    return {
+        'texts_per_second': round(len(texts) / elapsed, 1),
+        'latency_ms_p50': round(float(np.percentile(latencies, 50)), 2),
+        'latency_ms_p95': round(float(np.percentile(latencies, 95)), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate layer-truncated text encoding (fast mode)')
+    parser.add_argument('catalog', nargs='?', help="Catalog export (JSON / JSONL), '-' for stdin")
+    parser.add_argument('--from-db', action='store_true', help='Read dishes from the database')
+    parser.add_argument('--layers', default='2,4,6,8,10', help='Comma-separated encoder layer counts to evaluate')
+    parser.add_argument('--save', default='', help='Comma-separated layer counts whose adapters are saved')
+    parser.add_argument('--ridge', type=float, default=1e-3, help='Relative ridge regularization of the adapter')
+    parser.add_argument('--limit', type=int, default=50000, help='Max corpus size')
+    parser.add_argument('--holdout', type=float, default=0.1, help='Fraction held out for evaluation')
+    parser.add_argument('--eval-size', type=int, default=2000, help='Max holdout items')
+    parser.add_argument('--top-k', type=int, default=10, help='Neighbours compared per item')
+    parser.add_argument('--batch-size', type=int, default=64, help='Text encoder batch size')
+    parser.add_argument('--device', default=Config.DEVICE, help='Device (cuda/cpu), None for auto')
+    parser.add_argument('--min-cosine', type=float, default=None,
+                        help='Do not save an adapter whose holdout mean cosine is below this value (exit 1)')
+    parser.add_argument('--report', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    if not args.catalog and not args.from_db:
+        parser.error('either a catalog file or --from-db is required')
+    if not 0 < args.holdout < 1:
+        parser.error('--holdout must be in (0, 1)')
+    layers = _parse_layers(args.layers)
+    save = set(_parse_layers(args.save))
+    layers = sorted(set(layers) | save, reverse=True)
+
+    source, texts, _ = load_corpus(args.catalog, args.from_db, args.limit)
+    texts = list(dict.fromkeys(texts))
+    n_holdout = min(int(len(texts) * args.holdout), args.eval_size)
+    if n_holdout <= args.top_k:
+        parser.error(f'corpus has {len(texts)} unique texts, too few for a holdout evaluation')
+    order = np.random.default_rng(0).permutation(len(texts))
+    eval_index, train_index = order[:n_holdout], order[n_holdout:]
+    eval_texts = [texts[i] for i in eval_index]
+    logger.info(f"Corpus: {source} ({len(train_index)} train, {n_holdout} holdout)")
+
+    # 同一个模型从深到浅逐步截断，每个 K 只需加载一次
+    device = args.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    backend = TorchTextBackend(Config.TEXT_MODEL, device, PRECISION_FP32)
+    with torch.no_grad():
+        full = backend.encode(texts, args.batch_size, False)
+    baseline = measure_latency(backend, eval_texts, args.batch_size)
+    total = len(backend.model[0].auto_model.encoder.layer)
+
+    report = {
+        'corpus': {'source': source, 'train': int(len(train_index)), 'holdout': int(n_holdout)},
+        'text_model': Config.TEXT_MODEL,
+        'total_layers': total,
+        'device': device,
+        'full': baseline,
+        'layers': {},
+    }
+    failures = []
+
+    for k in layers:
+        if not 0 < k < total:
+            parser.error(f'--layers values must be in [1, {total - 1}], got {k}')
+        truncate_layers(backend.model, k)
+        with torch.no_grad():
+            truncated = backend.encode(texts, args.batch_size, False)
+
+        adapter = fit_adapter(truncated[train_index], full[train_index], args.ridge)
+        adapted = apply_adapter(adapter, truncated[eval_index])
+        entry = {
+            'holdout': agreement(full[eval_index], adapted, args.top_k),
+            'holdout_unadapted': agreement(full[eval_index], truncated[eval_index], args.top_k),
+            **measure_latency(backend, eval_texts, args.batch_size, adapter),
+        }
+        entry['speedup'] = round(entry['texts_per_second'] / baseline['texts_per_second'], 2)
+        report['layers'][k] = entry
+        logger.info(f"{k}/{total} layers: holdout cosine {entry['holdout']['cosine_mean']:.4f} "
+                    f"(unadapted {entry['holdout_unadapted']['cosine_mean']:.4f}), "
+                    f"p50 {entry['latency_ms_p50']} ms, speedup {entry['speedup']}x")
+
+        if k not in save:
+            continue
+        if args.min_cosine is not None and entry['holdout']['cosine_mean'] < args.min_cosine:
+            failures.append(k)
+            logger.error(f"✗ {k} layers: holdout cosine {entry['holdout']['cosine_mean']:.4f} < "
+                         f"{args.min_cosine}, adapter not saved")
+            continue
+
+        # 保存的适配层用全部语料重新拟合
+        path = adapter_path_for(Config.MODEL_DIR, k)
+        save_adapter(path, fit_adapter(truncated, full, args.ridge), meta={
+            'model_name': Config.TEXT_MODEL,
+            'layers': k,
+            'total_layers': total,
+            'ridge': args.ridge,
+            'corpus': report['corpus'],
+            'holdout': entry['holdout'],
+            'speedup': entry['speedup'],
+        })
+        logger.info(f"✓ Saved {path}; enable with PYTHON_EMBEDDING_TEXT_FAST_LAYERS={k}")
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
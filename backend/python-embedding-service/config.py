@@ -18,12 +18,88 @@ class Config:
     DEFAULT_VERSION = os.getenv('PYTHON_EMBEDDING_DEFAULT_VERSION', 'v2')
     MODEL_DIR = os.getenv('PYTHON_EMBEDDING_MODEL_DIR', 'saved_models')  # 训练好的模型文件目录
     
+    # 推理精度（fp32 / bf16 / int8），切换前先运行 precision_report.py 检查与 fp32 的一致性
+    TEXT_PRECISION = os.getenv('PYTHON_EMBEDDING_TEXT_PRECISION', 'fp32')  # 文本编码器
+    MODEL_PRECISION = os.getenv('PYTHON_EMBEDDING_MODEL_PRECISION', 'fp32')  # v3 融合网络
+    
+    # 文本编码器推理后端（torch / onnx），onnx 需先运行 export_onnx.py 导出到 ONNX_DIR，只支持 CPU 与 fp32 / int8
+    TEXT_BACKEND = os.getenv('PYTHON_EMBEDDING_TEXT_BACKEND', 'torch')
+    ONNX_DIR = os.getenv('PYTHON_EMBEDDING_ONNX_DIR', os.path.join(MODEL_DIR, 'onnx'))
+    ONNX_THREADS = int(os.getenv('PYTHON_EMBEDDING_ONNX_THREADS', 0))  # 每个 worker 的算子内线程数，0 = 物理核数
+    
+    # 蒸馏学生文本编码器目录（train/distill_text.py 输出），为空时使用 TEXT_MODEL 本身
+    TEXT_STUDENT_DIR = os.getenv('PYTHON_EMBEDDING_TEXT_STUDENT_DIR', '')
+    
+    # 文本编码快速模式：只运行前 K 层编码器（0 = 完整深度），适配层由 calibrate_fast_text.py 拟合到 MODEL_DIR
+    TEXT_FAST_LAYERS = int(os.getenv('PYTHON_EMBEDDING_TEXT_FAST_LAYERS', 0))
+    
+    # v2 降维版本（v2-pca{dim}，逗号分隔的维度，默认不注册），投影由 fit_pca.py 拟合到 MODEL_DIR/v2_pca{dim}.npz
+    PCA_DIMS = [int(dim) for dim in os.getenv('PYTHON_EMBEDDING_PCA_DIMS', '').split(',') if dim.strip()]
+    
     # 设备配置
     DEVICE = os.getenv('PYTHON_EMBEDDING_DEVICE', None)  # None = 自动检测
     
     # 预加载模型
     PRELOAD_MODELS = os.getenv('PYTHON_EMBEDDING_PRELOAD_MODELS', 'v2,v3').split(',')
     
+    # 微批调度（合并并发的 /embed 请求，需配合多线程 worker 使用）
+    MICRO_BATCH_ENABLED = os.getenv('PYTHON_EMBEDDING_MICRO_BATCH_ENABLED', 'true').lower() == 'true'
+    MICRO_BATCH_MAX_SIZE = int(os.getenv('PYTHON_EMBEDDING_MICRO_BATCH_MAX_SIZE', 64))
+    MICRO_BATCH_MAX_WAIT_MS = float(os.getenv('PYTHON_EMBEDDING_MICRO_BATCH_MAX_WAIT_MS', 0))  # 0 = 不额外等待
+    
+    # 流式接口（/embed_stream）每块条数
+    STREAM_CHUNK_SIZE = int(os.getenv('PYTHON_EMBEDDING_STREAM_CHUNK_SIZE', 256))
+    
+    # 优先级调度（交互请求优先于批量刷新）
+    INFERENCE_CONCURRENCY = int(os.getenv('PYTHON_EMBEDDING_INFERENCE_CONCURRENCY', 1))  # 每进程同时推理的任务数
+    BULK_CHUNK_SIZE = int(os.getenv('PYTHON_EMBEDDING_BULK_CHUNK_SIZE', 64))  # 批量请求每块条数
+    PRIORITY_BULK_THRESHOLD = int(os.getenv('PYTHON_EMBEDDING_PRIORITY_BULK_THRESHOLD', 32))  # 未指定优先级时超过该条数视为批量
+    
+    # 准入控制与降载
+    MAX_IN_FLIGHT = int(os.getenv('PYTHON_EMBEDDING_MAX_IN_FLIGHT', 32))  # 每进程最大在途请求数，0 = 不限制
+    # gunicorn 每个 worker 的线程数（gunicorn.conf.py 读取同一配置）。每个在途请求占用一个线程，
+    # Flask 部署的在途上限会被压到线程数以下（见 services/admission.py 的 admission_limit）
+    WORKER_THREADS = int(os.getenv('PYTHON_EMBEDDING_WORKER_THREADS', 40))
+    RETRY_AFTER_SECONDS = int(os.getenv('PYTHON_EMBEDDING_RETRY_AFTER_SECONDS', 1))
+    MAX_BATCH_ITEMS = int(os.getenv('PYTHON_EMBEDDING_MAX_BATCH_ITEMS', 1000))
+    MAX_BODY_BYTES = int(os.getenv('PYTHON_EMBEDDING_MAX_BODY_BYTES', 16 * 1024 * 1024))  # /embed_stream 不受限
+    MAX_CHECK_ITEMS = int(os.getenv('PYTHON_EMBEDDING_MAX_CHECK_ITEMS', 10000))  # /check_stale 不做推理，上限更高
+    
+    # 过载降级（交互请求排队延迟超过阈值时启用，格式：步骤:阈值毫秒）
+    DEGRADATION_ENABLED = os.getenv('PYTHON_EMBEDDING_DEGRADATION_ENABLED', 'true').lower() == 'true'
+    # truncate 只截断超过 TRUNCATE_CHARS 的文本，菜名很短时几乎不省时间，默认不启用
+    DEGRADATION_POLICY = os.getenv('PYTHON_EMBEDDING_DEGRADATION_POLICY', 'text_fallback:250,version_fallback:1000')
+    DEGRADATION_TRUNCATE_CHARS = int(os.getenv('PYTHON_EMBEDDING_DEGRADATION_TRUNCATE_CHARS', 128))
+    # text_fallback 的备用文本编码器：int8（文本模型的 int8 副本，只支持 CPU，词表嵌入与主编码器共用，多占约 100MB 内存）、
+    # layers:K（快速模式，需 calibrate_fast_text.py 拟合的适配层）、student:目录（蒸馏学生模型），空 = 不加载
+    DEGRADATION_TEXT_ENGINE = os.getenv('PYTHON_EMBEDDING_DEGRADATION_TEXT_ENGINE', 'int8')
+    
+    # 文本嵌入缓存（键为文本模型名称 + 归一化文本，LRU 淘汰），0 = 禁用
+    TEXT_CACHE_MB = float(os.getenv('PYTHON_EMBEDDING_TEXT_CACHE_MB', 64))
+    
+    # 持久化文本嵌入存储（内存映射文件，各 worker 共享、重启后复用），留空 = 禁用
+    TEXT_STORE_DIR = os.getenv('PYTHON_EMBEDDING_TEXT_STORE_DIR', os.path.join(MODEL_DIR, 'text_store'))
+    TEXT_STORE_MAX_MB = float(os.getenv('PYTHON_EMBEDDING_TEXT_STORE_MAX_MB', 2048))  # 向量文件上限，0 = 不限制
+    
+    # 性能分析（/embed_batch 携带 X-Embedding-Profile 和 X-Admin-Token 时启用，未配置令牌则禁用）
+    ADMIN_TOKEN = os.getenv('PYTHON_EMBEDDING_ADMIN_TOKEN', '')
+    PROFILE_DIR = os.getenv('PYTHON_EMBEDDING_PROFILE_DIR', 'profiles')  # torch / cprofile trace 输出目录
+    
+    # 二进制 RPC 服务（rpc_server.py），设置了 RPC_SOCKET 时监听 Unix socket，否则监听 TCP
+    RPC_SOCKET = os.getenv('PYTHON_EMBEDDING_RPC_SOCKET', '/tmp/tasteinsight-embedding.sock')
+    RPC_HOST = os.getenv('PYTHON_EMBEDDING_RPC_HOST', '127.0.0.1')
+    RPC_PORT = int(os.getenv('PYTHON_EMBEDDING_RPC_PORT', 5002))
+    
+    # 异步模式（asgi_app.py）推理线程数
+    INFERENCE_WORKERS = int(os.getenv('PYTHON_EMBEDDING_INFERENCE_WORKERS', 2))
+    
+    # 一致性哈希路由（router_app.py），按文本把请求分片到多个副本
+    ROUTER_REPLICAS = [url.strip() for url in os.getenv('PYTHON_EMBEDDING_ROUTER_REPLICAS', '').split(',') if url.strip()]
+    ROUTER_VNODES = int(os.getenv('PYTHON_EMBEDDING_ROUTER_VNODES', 160))  # 每个副本的虚拟节点数
+    ROUTER_TIMEOUT_SECONDS = float(os.getenv('PYTHON_EMBEDDING_ROUTER_TIMEOUT_SECONDS', 30))  # 请求副本的超时
+    ROUTER_HEALTH_INTERVAL_SECONDS = float(os.getenv('PYTHON_EMBEDDING_ROUTER_HEALTH_INTERVAL_SECONDS', 5))
+    ROUTER_MAX_CONNECTIONS = int(os.getenv('PYTHON_EMBEDDING_ROUTER_MAX_CONNECTIONS', 32))  # 并发请求副本的线程数
+    
     @classmethod
     def get_info(cls) -> dict:
         """获取配置信息"""
@@ -33,7 +109,65 @@ class Config:
             'text_model': cls.TEXT_MODEL,
             'default_version': cls.DEFAULT_VERSION,
             'model_dir': cls.MODEL_DIR,
+            'precision': {
+                'text': cls.TEXT_PRECISION,
+                'model': cls.MODEL_PRECISION,
+            },
+            'text_backend': {
+                'backend': cls.TEXT_BACKEND,
+                'onnx_dir': cls.ONNX_DIR,
+                'onnx_threads': cls.ONNX_THREADS,
+                'student_dir': cls.TEXT_STUDENT_DIR or None,
+                'fast_layers': cls.TEXT_FAST_LAYERS,
+            },
+            'pca_dims': cls.PCA_DIMS,
             'device': cls.DEVICE or 'auto',
             'preload_models': cls.PRELOAD_MODELS,
+            'micro_batch': {
+                'enabled': cls.MICRO_BATCH_ENABLED,
+                'max_size': cls.MICRO_BATCH_MAX_SIZE,
+                'max_wait_ms': cls.MICRO_BATCH_MAX_WAIT_MS,
+            },
+            'stream_chunk_size': cls.STREAM_CHUNK_SIZE,
+            'scheduler': {
+                'inference_concurrency': cls.INFERENCE_CONCURRENCY,
+                'bulk_chunk_size': cls.BULK_CHUNK_SIZE,
+                'priority_bulk_threshold': cls.PRIORITY_BULK_THRESHOLD,
+            },
+            'admission': {
+                'max_in_flight': cls.MAX_IN_FLIGHT,
+                'worker_threads': cls.WORKER_THREADS,
+                'max_batch_items': cls.MAX_BATCH_ITEMS,
+                'max_body_bytes': cls.MAX_BODY_BYTES,
+                'max_check_items': cls.MAX_CHECK_ITEMS,
+            },
+            'degradation': {
+                'enabled': cls.DEGRADATION_ENABLED,
+                'policy': cls.DEGRADATION_POLICY,
+                'truncate_chars': cls.DEGRADATION_TRUNCATE_CHARS,
+                'text_engine': cls.DEGRADATION_TEXT_ENGINE or None,
+            },
+            'text_cache_mb': cls.TEXT_CACHE_MB,
+            'text_store': {
+                'dir': cls.TEXT_STORE_DIR or None,
+                'max_mb': cls.TEXT_STORE_MAX_MB,
+            },
+            'profiling': {
+                'enabled': bool(cls.ADMIN_TOKEN),
+                'profile_dir': cls.PROFILE_DIR,
+            },
+            'rpc': {
+                'socket': cls.RPC_SOCKET,
+                'host': cls.RPC_HOST,
+                'port': cls.RPC_PORT,
+            },
+            'inference_workers': cls.INFERENCE_WORKERS,
+            'router': {
+                'replicas': cls.ROUTER_REPLICAS,
+                'vnodes': cls.ROUTER_VNODES,
+                'timeout_seconds': cls.ROUTER_TIMEOUT_SECONDS,
+                'health_interval_seconds': cls.ROUTER_HEALTH_INTERVAL_SECONDS,
+                'max_connections': cls.ROUTER_MAX_CONNECTIONS,
+            },
         }
 
@@ -0,0 +1,258 @@
+"""
+文本推理后端 - TextEncoder 的分词与前向由后端实现
+
+- torch: SentenceTransformer（eager PyTorch），支持 fp32 / bf16 / int8
+- onnx: ONNX Runtime CPU，加载 export_onnx.py 导出的图（Transformer + 池化），支持 fp32 / int8；
+        同一份 mpnet 权重，在只有 CPU 的部署上延迟和常驻内存更低
+
+后端接口：
+    dimension            句向量维度
+    tokenize(texts)      -> 前向输入
+    forward(features)    -> (N, dim) float32 张量
+    forward_profiled(features, timings) 同 forward，并把各阶段耗时累加到 timings
+    encode(texts, batch_size, show_progress) -> np.ndarray
+    size_mb()            权重大小（MB）
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Union
+
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+from sentence_transformers.util import batch_to_device
+
+from models.precision import PRECISION_FP32, PRECISION_INT8, apply_precision, module_size_mb
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_TORCH = 'torch'
+BACKEND_ONNX = 'onnx'
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNX)
+
+# 导出目录中各精度对应的图文件，以及导出信息
+ONNX_MODEL_FILES = {
+    PRECISION_FP32: 'model.onnx',
+    PRECISION_INT8: 'model_int8.onnx',
+}
+ONNX_EXPORT_INFO = 'export.json'
+ONNX_OUTPUT = 'sentence_embedding'
+
+
+def parse_backend(value: str) -> str:
+    """
+    解析文本推理后端配置
+
+    Raises:
+        ValueError: 不支持的后端
+    """
+    backend = (value or BACKEND_TORCH).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported text backend: {value}. Available: {list(BACKENDS)}")
+    return backend
+
+
+def onnx_dir_for(root: str, model_name: str) -> str:
+    """文本模型的 ONNX 导出目录（root/<模型名，'/' 替换为 '__'>）"""
+    return os.path.join(root, model_name.strip('/').replace('/', '__'))
+
+
+def truncate_layers(model: SentenceTransformer, layers: int) -> int:
+    """
+    只保留 Transformer 编码器的前 layers 层（原地修改，池化等后续模块不变）
+
+    Returns:
+        截断前的层数
+
+    Raises:
+        ValueError: layers 超出范围
+    """
+    auto_model = model[0].auto_model
+    total = len(auto_model.encoder.layer)
+    if not 0 < layers <= total:
+        raise ValueError(f"Text model has {total} encoder layers, cannot keep {layers}")
+    auto_model.encoder.layer = auto_model.encoder.layer[:layers]
+    auto_model.config.num_hidden_layers = layers
+    return total
+
+
+def share_input_embeddings(target: SentenceTransformer, source: SentenceTransformer) -> bool:
+    """
+    target 改用 source 的词表嵌入层（同一模型的两个副本，动态量化不会改动嵌入层）
+
+    multilingual mpnet 的词表嵌入约 750MB，共用后 int8 副本只多占量化后的线性层。
+
+    Returns:
+        是否已共用（模型结构不支持时为 False）
+    """
+    try:
+        source_model = source[0].auto_model
+        target_model = target[0].auto_model
+        embeddings = source_model.get_input_embeddings()
+    except (AttributeError, IndexError, TypeError, NotImplementedError):
+        return False
+    if embeddings.weight.shape != target_model.get_input_embeddings().weight.shape:
+        return False
+    target_model.set_input_embeddings(embeddings)
+    return True
+
+
+class TorchTextBackend:
+    """SentenceTransformer（eager PyTorch）"""
+
+    name = BACKEND_TORCH
+
+    def __init__(self, model_name: str, device: str, precision: str, layers: int = 0):
+        """
+        Args:
+            layers: 只运行前 layers 层编码器（见 encoders/fast_mode.py），0 = 全部
+        """
+        self.device = device
+        self.precision = precision
+        self.model = SentenceTransformer(model_name)
+        if layers:
+            truncate_layers(self.model, layers)
+        self.model.to(device)
+        self.model.eval()
+        self.model = apply_precision(self.model, precision, device)
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def tokenize(self, texts: List[str]) -> Dict[str, torch.Tensor]:
+        return batch_to_device(self.model.tokenize(texts), self.device)
+
+    def forward(self, features: Dict[str, torch.Tensor]) -> torch.Tensor:
+        return self.model(features)['sentence_embedding']
+
+    def forward_profiled(self, features: Dict[str, torch.Tensor], timings: Dict[str, float]) -> torch.Tensor:
+        """逐模块前向，阶段名为模块类名（如 Transformer、Pooling）"""
+        for module in self.model:
+            name = type(module).__name__
+            t0 = time.perf_counter()
+            features = module(features)
+            if self.device.startswith('cuda'):
+                torch.cuda.synchronize()
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - t0
+        return features['sentence_embedding']
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int, show_progress: bool) -> np.ndarray:
+        if self.precision == PRECISION_FP32:
+            return self.model.encode(
+                texts,
+                convert_to_numpy=True,
+                batch_size=batch_size,
+                show_progress_bar=show_progress,
+                device=self.device
+            )
+
+        # numpy 不支持 bfloat16：取张量后统一转为 fp32
+        embeddings = self.model.encode(
+            texts,
+            convert_to_tensor=True,
+            batch_size=batch_size,
+            show_progress_bar=show_progress,
+            device=self.device
+        )
+        return embeddings.float().cpu().numpy()
+
+    def size_mb(self) -> float:
+        return module_size_mb(self.model)
+
+
+class OnnxTextBackend:
+    """ONNX Runtime CPU，图由 export_onnx.py 从本地 HuggingFace 快照导出"""
+
+    name = BACKEND_ONNX
+
+    def __init__(self, model_name: str, device: str, precision: str, onnx_dir: str, threads: int = 0):
+        """
+        Args:
+            model_name: 文本模型名称，需与导出信息一致
+            device: 只支持 cpu
+            precision: fp32 或 int8（导出时使用 --quantize 生成）
+            onnx_dir: 该模型的导出目录（见 onnx_dir_for）
+            threads: 每个会话的算子内线程数，0 = ONNX Runtime 默认（物理核数）
+
+        Raises:
+            ImportError: 未安装 onnxruntime
+            ValueError: 设备、精度或导出信息与配置不符
+            FileNotFoundError: 未导出
+        """
+        if ort is None:
+            raise ImportError("onnxruntime is not installed, pip install onnxruntime or use the torch backend")
+        if not str(device).startswith('cpu'):
+            raise ValueError(f"ONNX text backend only supports CPU, got device: {device}")
+        if precision not in ONNX_MODEL_FILES:
+            raise ValueError(f"ONNX text backend supports {list(ONNX_MODEL_FILES)}, got precision: {precision}")
+
+        path = os.path.join(onnx_dir, ONNX_MODEL_FILES[precision])
+        info_path = os.path.join(onnx_dir, ONNX_EXPORT_INFO)
+        if not os.path.exists(path) or not os.path.exists(info_path):
+            hint = ' --quantize' if precision == PRECISION_INT8 else ''
+            raise FileNotFoundError(f"ONNX model not found: {path}, run: python export_onnx.py{hint}")
+        with open(info_path, encoding='utf-8') as f:
+            self.info = json.load(f)
+        if self.info.get('model_name') != model_name:
+            raise ValueError(f"ONNX export in {onnx_dir} is for {self.info.get('model_name')}, not {model_name}")
+
+        from transformers import AutoTokenizer
+
+        self.device = 'cpu'
+        self.precision = precision
+        self.path = path
+        self.max_seq_length = self.info['max_seq_length']
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+    @property
+    def dimension(self) -> int:
+        return self.info['dimension']
+
+    def tokenize(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        # 与 SentenceTransformer 的 Transformer 模块相同：去除首尾空白，按最大长度截断
+        texts = [str(text).strip() for text in texts]
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length,
+                                 return_tensors='np')
+        return {name: encoded[name].astype(np.int64) for name in self.input_names}
+
+    def forward(self, features: Dict[str, np.ndarray]) -> torch.Tensor:
+        return torch.from_numpy(self.session.run([ONNX_OUTPUT], features)[0])
+
+    def forward_profiled(self, features: Dict[str, np.ndarray], timings: Dict[str, float]) -> torch.Tensor:
+        """整张图一次执行，阶段名为 OnnxRuntime"""
+        t0 = time.perf_counter()
+        embeddings = self.forward(features)
+        timings['OnnxRuntime'] = timings.get('OnnxRuntime', 0.0) + time.perf_counter() - t0
+        return embeddings
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int, show_progress: bool) -> np.ndarray:
+        """与 SentenceTransformer.encode 相同：按文本长度降序分批以减少 padding，结果按原顺序返回"""
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            index = order[start:start + batch_size]
+            embeddings[index] = self.session.run([ONNX_OUTPUT], self.tokenize([texts[i] for i in index]))[0]
+        return embeddings[0] if single else embeddings
+
+    def size_mb(self) -> float:
+        return os.path.getsize(self.path) / (1024 * 1024)
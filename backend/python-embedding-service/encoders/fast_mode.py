@@ -0,0 +1,177 @@
+"""
+文本编码快速模式 - 只运行 Transformer 的前 K 层编码器
+
+菜品名称很短，mpnet 顶部几层对检索的贡献有限。快速模式截断编码器后照常做 mean pooling，
+再经一个线性适配层 z = x @ W + b 映射回完整深度的 768 维向量空间，v2 拼接和 v3 融合网络无需改动。
+
+适配层由 calibrate_fast_text.py 在菜品语料上对完整深度的输出做最小二乘（岭回归）拟合，
+保存为 MODEL_DIR/text_fast_l{K}.npz：
+
+    weight      (768, 768)    线性映射
+    bias        (768,)
+    meta        ()            拟合信息 JSON（模型名、层数、留出集一致性、加速比等）
+
+只支持 torch 后端（截断发生在 PyTorch 模型上）。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import torch
+
+from .backends import BACKEND_TORCH, TorchTextBackend
+
+logger = logging.getLogger(__name__)
+
+ADAPTER_FORMAT = 1
+
+
+def adapter_path_for(model_dir: str, layers: int) -> str:
+    """前 layers 层对应的适配层文件路径"""
+    return os.path.join(model_dir, f'text_fast_l{layers}.npz')
+
+
+def fit_adapter(truncated: np.ndarray, full: np.ndarray, ridge: float = 1e-3) -> Dict[str, np.ndarray]:
+    """
+    拟合线性适配层，使 truncated @ weight + bias 逼近 full
+
+    中心化后解岭回归正规方程，正则项按输入协方差对角线均值缩放，语料少于维度时也有稳定解。
+
+    Args:
+        truncated: (N, dim) 截断模型的句向量
+        full: (N, dim) 完整深度的句向量
+        ridge: 相对正则强度
+
+    Returns:
+        {'weight': (dim, dim), 'bias': (dim,)}，float32
+    """
+    x = truncated.astype(np.float64)
+    y = full.astype(np.float64)
+    x_mean = x.mean(axis=0)
+    y_mean = y.mean(axis=0)
+    x = x - x_mean
+
+    gram = x.T @ x
+    gram[np.diag_indices_from(gram)] += ridge * max(float(np.trace(gram)) / len(gram), 1e-12)
+    weight = np.linalg.solve(gram, x.T @ (y - y_mean))
+    bias = y_mean - x_mean @ weight
+    return {'weight': weight.astype(np.float32), 'bias': bias.astype(np.float32)}
+
+
+def apply_adapter(adapter: Dict[str, np.ndarray], embeddings: np.ndarray) -> np.ndarray:
+    """对 (N, dim) 或 (dim,) 句向量应用适配层"""
+    return embeddings.astype(np.float32) @ adapter['weight'] + adapter['bias']
+
+
+def save_adapter(path: str, adapter: Dict[str, np.ndarray], meta: Dict[str, Any]):
+    """保存适配层（先写临时文件再替换）"""
+    meta = dict(meta)
+    meta.setdefault('fitted_at', time.time())
+    meta['format'] = ADAPTER_FORMAT
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp.npz'
+    np.savez(
+        tmp_path,
+        weight=adapter['weight'],
+        bias=adapter['bias'],
+        meta=np.array(json.dumps(meta, ensure_ascii=False)),
+    )
+    os.replace(tmp_path, path)
+    logger.info(f"Saved text fast-mode adapter: {path}")
+
+
+def load_adapter(path: str) -> Dict[str, Any]:
+    """
+    读取适配层文件
+
+    Raises:
+        FileNotFoundError: 未拟合
+        ValueError: 格式版本不符
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Text fast-mode adapter not found: {path}, run calibrate_fast_text.py")
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        if meta.get('format') != ADAPTER_FORMAT:
+            raise ValueError(f"Unsupported text fast-mode adapter format: {meta.get('format')}")
+        return {
+            'weight': data['weight'].astype(np.float32),
+            'bias': data['bias'].astype(np.float32),
+            'meta': meta,
+        }
+
+
+class FastTextBackend:
+    """截断到前 K 层的 SentenceTransformer + 线性适配层（后端接口见 encoders/backends.py）"""
+
+    name = BACKEND_TORCH
+
+    def __init__(self, model_name: str, device: str, precision: str, layers: int, adapter_dir: str):
+        """
+        Args:
+            model_name: 文本模型名称，需与适配层拟合时一致
+            device: 计算设备
+            precision: 推理精度（截断后的模型照常量化 / 转换）
+            layers: 保留的编码器层数
+            adapter_dir: 适配层文件所在目录（见 adapter_path_for）
+
+        Raises:
+            FileNotFoundError: 适配层未拟合
+            ValueError: 适配层与模型或层数不符
+        """
+        self.adapter = load_adapter(adapter_path_for(adapter_dir, layers))
+        meta = self.adapter['meta']
+        if meta.get('model_name') != model_name or meta.get('layers') != layers:
+            raise ValueError(f"Text fast-mode adapter is for {meta.get('model_name')} with {meta.get('layers')} "
+                             f"layers, not {model_name} with {layers}")
+
+        self.inner = TorchTextBackend(model_name, device, precision, layers=layers)
+        if self.adapter['weight'].shape != (self.inner.dimension, self.inner.dimension):
+            raise ValueError(f"Text fast-mode adapter shape {self.adapter['weight'].shape} does not match "
+                             f"dimension {self.inner.dimension}")
+
+        self.device = device
+        self.precision = precision
+        self.layers = layers
+        self.model = self.inner.model
+        self.adapter_sha256 = hashlib.sha256(
+            self.adapter['weight'].tobytes() + self.adapter['bias'].tobytes()).hexdigest()
+        self._weight_t = torch.from_numpy(self.adapter['weight']).to(device)
+        self._bias_t = torch.from_numpy(self.adapter['bias']).to(device)
+
+    @property
+    def dimension(self) -> int:
+        return self.inner.dimension
+
+    def tokenize(self, texts: List[str]) -> Dict[str, torch.Tensor]:
+        return self.inner.tokenize(texts)
+
+    def _adapt(self, embeddings: torch.Tensor) -> torch.Tensor:
+        return torch.addmm(self._bias_t, embeddings.float(), self._weight_t)
+
+    def forward(self, features: Dict[str, torch.Tensor]) -> torch.Tensor:
+        return self._adapt(self.inner.forward(features))
+
+    def forward_profiled(self, features: Dict[str, torch.Tensor], timings: Dict[str, float]) -> torch.Tensor:
+        """同 TorchTextBackend，另计适配层阶段 Adapter"""
+        embeddings = self.inner.forward_profiled(features, timings)
+        t0 = time.perf_counter()
+        embeddings = self._adapt(embeddings)
+        if self.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        timings['Adapter'] = timings.get('Adapter', 0.0) + time.perf_counter() - t0
+        return embeddings
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int, show_progress: bool) -> np.ndarray:
+        return apply_adapter(self.adapter, self.inner.encode(texts, batch_size, show_progress))
+
+    def size_mb(self) -> float:
+        return self.inner.size_mb() + (self.adapter['weight'].nbytes + self.adapter['bias'].nbytes) / (1024 * 1024)
@@ -18,24 +18,34 @@ class NumericEncoder:
         """
         self.dimension = dimension
     
-    def encode(self, features: Union[Dict, List[Dict]]) -> np.ndarray:
+    def encode(self, features: Union[Dict, List[Dict]], out: np.ndarray = None) -> np.ndarray:
         """
-        编码数值特征
+        编码数值特征（float32）
         
         Args:
             features: 单个特征字典或特征字典列表
+            out: 预分配的输出 (N, dim) float32，逐行直接写入（仅批量）
             
         Returns:
             (dim,) 或 (N, dim)
         """
         if isinstance(features, dict):
-            return self._encode_single(features)
-        else:
-            return np.array([self._encode_single(f) for f in features])
+            vector = np.zeros(self.dimension, dtype=np.float32)
+            self._encode_into(features, vector)
+            return vector
+        
+        if out is None:
+            out = np.empty((len(features), self.dimension), dtype=np.float32)
+        elif out.shape != (len(features), self.dimension) or out.dtype != np.float32:
+            raise ValueError(f"out must be float32 {(len(features), self.dimension)}, got {out.dtype} {out.shape}")
+        out.fill(0)
+        for i, f in enumerate(features):
+            self._encode_into(f, out[i])
+        return out
     
-    def _encode_single(self, features: Dict) -> np.ndarray:
+    def _encode_into(self, features: Dict, vector: np.ndarray):
         """
-        编码单个特征字典为向量
+        编码单个特征字典，写入已清零的向量
         
         特征维度分配 (20维):
         - 0-6: 基础特征（价格、口味、评分）
@@ -43,7 +53,6 @@ class NumericEncoder:
         - 11-12: 质量指标
         - 13-19: 预留扩展
         """
-        vector = np.zeros(self.dimension)
         
         # 基础特征 (0-6)
         vector[0] = min(1.0, features.get('price', 0) / 50.0)
@@ -68,8 +77,6 @@ class NumericEncoder:
         vector[12] = 1.0 if review_count >= 50 else review_count / 50.0  # 热度
         
         # 13-19: 预留扩展
-        
-        return vector
     
     def get_info(self) -> dict:
         """获取编码器信息"""
@@ -2,44 +2,133 @@
 文本编码器
 """
 
-from sentence_transformers import SentenceTransformer
+import json
+import os
+import time
 import torch
 import numpy as np
-from typing import List, Union
+from typing import Dict, List, Tuple, Union
 import logging
 
+from models.precision import PRECISION_FP32, parse_precision
+from .backends import BACKEND_TORCH, OnnxTextBackend, TorchTextBackend, onnx_dir_for, parse_backend
+from .fast_mode import FastTextBackend
+
 logger = logging.getLogger(__name__)
 
+# 蒸馏学生模型目录中的蒸馏信息（train/distill_text.py 写入）
+STUDENT_INFO = 'distill.json'
+
 
 class TextEncoder:
-    """文本编码器 - 使用 Sentence Transformers"""
+    """文本编码器 - 使用 Sentence Transformers（推理后端见 encoders/backends.py）"""
     
     def __init__(self, 
                  model_name: str = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2',
-                 device: str = None):
+                 device: str = None,
+                 precision: str = PRECISION_FP32,
+                 backend: str = BACKEND_TORCH,
+                 onnx_dir: str = 'saved_models/onnx',
+                 onnx_threads: int = 0,
+                 student_dir: str = None,
+                 fast_layers: int = 0,
+                 fast_adapter_dir: str = 'saved_models'):
         """
         初始化文本编码器
         
         Args:
             model_name: 模型名称
             device: 计算设备 ('cpu', 'cuda', None=自动检测)
+            precision: 推理精度 ('fp32', 'bf16', 'int8')，见 models/precision.py
+            backend: 推理后端 ('torch', 'onnx')
+            onnx_dir: ONNX 导出根目录（onnx 后端使用，见 export_onnx.py）
+            onnx_threads: ONNX Runtime 算子内线程数，0 = 默认
+            student_dir: 蒸馏学生模型目录（train/distill_text.py 输出），None = 使用 model_name 本身
+            fast_layers: 快速模式只运行前 fast_layers 层编码器（见 encoders/fast_mode.py），0 = 完整深度
+            fast_adapter_dir: 快速模式适配层所在目录（calibrate_fast_text.py 输出）
         """
         self.model_name = model_name
-        self.device = device if device else ('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = None
+        self.backend_name = parse_backend(backend)
+        if self.backend_name == BACKEND_TORCH:
+            self.device = device if device else ('cuda' if torch.cuda.is_available() else 'cpu')
+        else:
+            self.device = device or 'cpu'
+        self.precision = parse_precision(precision)
+        self.onnx_dir = onnx_dir
+        self.onnx_threads = onnx_threads
+        self.student_dir = student_dir
+        self.student = None
+        self.fast_layers = fast_layers
+        self.fast_adapter_dir = fast_adapter_dir
+        self.backend = None
         self._load_model()
     
     def _load_model(self):
         """加载模型"""
-        logger.info(f"Loading text model: {self.model_name}")
-        self.model = SentenceTransformer(self.model_name)
-        self.model.to(self.device)
-        logger.info(f"Text model loaded (dim: {self.dimension}, device: {self.device})")
+        source = self.model_name
+        if self.student_dir:
+            self.student = self._read_student_info(self.student_dir)
+            source = self.student_dir
+        
+        if self.fast_layers and (self.backend_name != BACKEND_TORCH or self.student is not None):
+            raise ValueError("Text fast mode only supports the torch backend with the teacher model")
+        
+        logger.info(f"Loading text model: {source} (backend: {self.backend_name}"
+                    f"{f', first {self.fast_layers} layers' if self.fast_layers else ''})")
+        if self.fast_layers:
+            self.backend = FastTextBackend(source, self.device, self.precision, self.fast_layers,
+                                           self.fast_adapter_dir)
+        elif self.backend_name == BACKEND_TORCH:
+            self.backend = TorchTextBackend(source, self.device, self.precision)
+        else:
+            self.backend = OnnxTextBackend(source, self.device, self.precision,
+                                           onnx_dir_for(self.onnx_dir, source), self.onnx_threads)
+        logger.info(f"Text model loaded (dim: {self.dimension}, device: {self.device}, "
+                    f"precision: {self.precision}, backend: {self.backend_name})")
+    
+    def _read_student_info(self, student_dir: str) -> dict:
+        """
+        读取学生模型的蒸馏信息
+        
+        Raises:
+            FileNotFoundError: 不是 distill_text.py 输出的目录
+            ValueError: 学生模型蒸馏自其他教师（向量空间不同，v2/v3 不能直接使用）
+        """
+        info_path = os.path.join(student_dir, STUDENT_INFO)
+        if not os.path.exists(info_path):
+            raise FileNotFoundError(f"Student info not found: {info_path}, run train/distill_text.py")
+        with open(info_path, encoding='utf-8') as f:
+            info = json.load(f)
+        if info.get('teacher') != self.model_name:
+            raise ValueError(f"Student in {student_dir} was distilled from {info.get('teacher')}, "
+                             f"not {self.model_name}")
+        return info
     
     @property
     def dimension(self) -> int:
         """获取嵌入维度"""
-        return self.model.get_sentence_embedding_dimension()
+        return self.backend.dimension
+    
+    @property
+    def cache_key(self) -> str:
+        """
+        文本向量的来源标识（文本嵌入缓存、持久化存储与指纹使用）
+        
+        非 fp32 精度的向量与 fp32 略有差异，需要与 fp32 向量区分开。fp32 的 ONNX 图与 PyTorch
+        计算相同（export_onnx.py 导出时校验一致性），共用同一标识；ONNX 的 int8 量化方式与
+        PyTorch 动态量化不同，单独标识。学生模型和快速模式的适配层按权重摘要标识，
+        重新蒸馏 / 拟合后不会读到旧向量。
+        """
+        key = self.model_name
+        if self.student is not None:
+            key = f"{key}@student-{self.student['weights_sha256'][:12]}"
+        if self.fast_layers:
+            key = f'{key}@l{self.fast_layers}-{self.backend.adapter_sha256[:12]}'
+        if self.precision == PRECISION_FP32:
+            return key
+        if self.backend_name != BACKEND_TORCH:
+            return f'{key}@{self.backend_name}-{self.precision}'
+        return f'{key}@{self.precision}'
     
     def encode(self, 
                texts: Union[str, List[str]], 
@@ -57,15 +146,66 @@ class TextEncoder:
             嵌入向量 (dim,) 或 (N, dim)
         """
         with torch.no_grad():
-            embeddings = self.model.encode(
-                texts,
-                convert_to_numpy=True,
-                batch_size=batch_size,
-                show_progress_bar=show_progress,
-                device=self.device
-            )
+            return self.backend.encode(texts, batch_size, show_progress)
+    
+    def encode_into(self,
+                    texts: List[str],
+                    out: torch.Tensor,
+                    batch_size: int = 32) -> torch.Tensor:
+        """
+        编码文本并直接写入预分配的 float32 张量（不经 numpy，结果留在编码器所在设备）
+        
+        与 SentenceTransformer.encode 的计算相同：按文本长度降序分批以减少 padding，
+        各批的句向量按原下标写入 out。
+        
+        Args:
+            texts: 文本列表
+            out: 输出 (N, dim) float32，与编码器在同一设备
+            batch_size: 批处理大小
+            
+        Returns:
+            out
+        """
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        
+        with torch.no_grad():
+            for start in range(0, len(texts), batch_size):
+                index = order[start:start + batch_size]
+                features = self.backend.tokenize([texts[i] for i in index])
+                embeddings = self.backend.forward(features)
+                out.index_copy_(0, torch.tensor(index, device=out.device), embeddings.to(out.dtype))
+        
+        return out
+    
+    def encode_profiled(self,
+                        texts: List[str],
+                        batch_size: int = 32) -> Tuple[np.ndarray, Dict[str, float]]:
+        """
+        编码文本并分别计时分词和各个模块的前向（用于性能分析，比 encode 略慢）
+        
+        与 SentenceTransformer.encode 的计算相同，只是把分词与逐模块前向拆开执行。
+        
+        Args:
+            texts: 文本列表
+            batch_size: 批处理大小
+            
+        Returns:
+            (嵌入向量 (N, dim), {阶段名: 秒})，阶段名为 tokenize 以及各模块类名
+            （如 Transformer、Pooling；onnx 后端为 OnnxRuntime）
+        """
+        timings: Dict[str, float] = {'tokenize': 0.0}
+        outputs = []
+        
+        with torch.no_grad():
+            for start in range(0, len(texts), batch_size):
+                t0 = time.perf_counter()
+                features = self.backend.tokenize(texts[start:start + batch_size])
+                timings['tokenize'] += time.perf_counter() - t0
+                
+                embeddings = self.backend.forward_profiled(features, timings)
+                outputs.append(embeddings.detach().float().cpu().numpy())
         
-        return embeddings
+        return np.concatenate(outputs), timings
     
     def get_info(self) -> dict:
         """获取编码器信息"""
@@ -73,5 +213,19 @@ class TextEncoder:
             'model_name': self.model_name,
             'dimension': self.dimension,
             'device': self.device,
+            'precision': self.precision,
+            'backend': self.backend_name,
+            'student': {
+                'dir': self.student_dir,
+                'layers': self.student['student'].get('layers'),
+                'holdout_cosine': self.student['holdout'].get('cosine_mean'),
+                'speedup': self.student.get('speedup'),
+            } if self.student is not None else None,
+            'fast_mode': {
+                'layers': self.fast_layers,
+                'total_layers': self.backend.adapter['meta'].get('total_layers'),
+                'holdout_cosine': self.backend.adapter['meta'].get('holdout', {}).get('cosine_mean'),
+                'speedup': self.backend.adapter['meta'].get('speedup'),
+            } if self.fast_layers else None,
         }
 
@@ -0,0 +1,222 @@
+"""
+TasteInsight 嵌入服务 - 导出文本编码器的 ONNX 图
+
+把本地 HuggingFace 快照（SentenceTransformer 的 Transformer + 池化模块）导出为一张 ONNX 图，
+经 ONNX Runtime 离线图优化（算子融合、常量折叠）后写入 ONNX_DIR/<模型名>/，
+供 PYTHON_EMBEDDING_TEXT_BACKEND=onnx 使用：
+
+    model.onnx        fp32 图，输出 sentence_embedding（已含 mean pooling）
+    model_int8.onnx   --quantize 时生成，MatMul 权重动态量化为 int8（PYTHON_EMBEDDING_TEXT_PRECISION=int8）
+    tokenizer 文件    分词器配置，服务不再需要加载 SentenceTransformer
+    export.json       维度、最大长度、文件摘要以及与 PyTorch 的一致性和吞吐对比
+
+导出完成后在语料上对比 PyTorch fp32 与 ONNX 的输出，fp32 图的最小余弦低于 --min-cosine 时
+不替换已有导出并以状态码 1 退出。
+
+用法：
+    python export_onnx.py
+    python export_onnx.py --quantize catalog.jsonl
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import torch
+import torch.nn as nn
+
+from config import Config
+from encoders.backends import (
+    ONNX_EXPORT_INFO, ONNX_MODEL_FILES, ONNX_OUTPUT, OnnxTextBackend, TorchTextBackend, onnx_dir_for,
+)
+from models.precision import PRECISION_FP32, PRECISION_INT8
+from precision_report import agreement, load_corpus
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 图的输入，按 HuggingFace 分词器的输出取交集（mpnet 没有 token_type_ids）
+_INPUT_NAMES = ('input_ids', 'attention_mask', 'token_type_ids')
+
+
+class SentenceEmbedding(nn.Module):
+    """SentenceTransformer 的全部模块（Transformer、Pooling 等）串成位置参数输入的一个模块，便于导出"""
+
+    def __init__(self, model: nn.Module, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = list(input_names)
+
+    def forward(self, *inputs):
+        features = dict(zip(self.input_names, inputs))
+        return self.model(features)['sentence_embedding']
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_graph(backend: TorchTextBackend, path: str, opset: int):
+    """导出未优化的 fp32 图，batch 与序列长度为动态维度"""
+    example = backend.tokenize(['宫保鸡丁 麻辣鲜香', '清炒时蔬'])
+    input_names = [name for name in _INPUT_NAMES if name in example]
+    wrapper = SentenceEmbedding(backend.model, input_names).eval()
+
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        kwargs['dynamo'] = False  # TorchScript 导出器（新版 torch 默认改为 dynamo 导出）
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes[ONNX_OUTPUT] = {0: 'batch'}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            tuple(example[name] for name in input_names),
+            path,
+            input_names=input_names,
+            output_names=[ONNX_OUTPUT],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+            **kwargs,
+        )
+    return input_names
+
+
+def optimize_graph(source: str, target: str):
+    """
+    离线图优化（LayerNorm / GELU / MatMul+Add 融合、常量折叠），结果写入 target
+
+    使用 ORT_ENABLE_EXTENDED：ORT_ENABLE_ALL 的布局优化与导出机器的 CPU 相关，留到服务加载时在线完成。
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = target
+    ort.InferenceSession(source, options, providers=['CPUExecutionProvider'])
+
+
+def quantize_graph(source: str, target: str):
+    """MatMul 权重动态量化为 int8（激活在运行时按批量化）"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+
+
+def _timed_encode(backend, texts, batch_size: int):
+    """编码并计时（先用一批预热）"""
+    backend.encode(texts[:batch_size], batch_size, False)
+    start = time.perf_counter()
+    embeddings = backend.encode(texts, batch_size, False)
+    return embeddings, {
+        'size_mb': round(backend.size_mb(), 2),
+        'texts_per_second': round(len(texts) / (time.perf_counter() - start), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the text encoder to an optimized ONNX graph')
+    parser.add_argument('catalog', nargs='?', help="Corpus for the parity check (JSON / JSONL), default: built-in sample")
+    parser.add_argument('--from-db', action='store_true', help='Read the parity corpus from the database')
+    parser.add_argument('--model', default=Config.TEXT_MODEL, help='Model name or local snapshot path')
+    parser.add_argument('--onnx-dir', default=Config.ONNX_DIR, help='Export root directory')
+    parser.add_argument('--opset', type=int, default=14, help='ONNX opset version')
+    parser.add_argument('--quantize', action='store_true', help='Also write an int8 graph (model_int8.onnx)')
+    parser.add_argument('--limit', type=int, default=1000, help='Max parity corpus size')
+    parser.add_argument('--batch-size', type=int, default=32, help='Batch size for the parity check')
+    parser.add_argument('--top-k', type=int, default=10, help='Neighbours compared per item')
+    parser.add_argument('--min-cosine', type=float, default=0.9999,
+                        help='Keep the previous export and exit 1 if the fp32 graph has a lower min cosine')
+    args = parser.parse_args()
+
+    try:
+        import onnxruntime
+    except ImportError:
+        parser.error('onnxruntime is not installed (pip install onnxruntime onnx)')
+
+    source, texts, _ = load_corpus(args.catalog, args.from_db, args.limit)
+    if len(texts) < 2:
+        parser.error('parity corpus needs at least 2 texts')
+
+    target_dir = onnx_dir_for(args.onnx_dir, args.model)
+    work_dir = f'{target_dir}.tmp'
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+
+    logger.info(f"Loading {args.model}")
+    reference = TorchTextBackend(args.model, 'cpu', PRECISION_FP32)
+
+    raw_path = os.path.join(work_dir, 'model.raw.onnx')
+    fp32_path = os.path.join(work_dir, ONNX_MODEL_FILES[PRECISION_FP32])
+    input_names = export_graph(reference, raw_path, args.opset)
+    optimize_graph(raw_path, fp32_path)
+    os.remove(raw_path)
+    logger.info(f"✓ Exported and optimized: {fp32_path}")
+
+    precisions = [PRECISION_FP32]
+    if args.quantize:
+        quantize_graph(fp32_path, os.path.join(work_dir, ONNX_MODEL_FILES[PRECISION_INT8]))
+        precisions.append(PRECISION_INT8)
+        logger.info("✓ Quantized int8 graph")
+
+    reference.model.tokenizer.save_pretrained(work_dir)
+    info = {
+        'model_name': args.model,
+        'dimension': reference.dimension,
+        'max_seq_length': reference.model.max_seq_length,
+        'inputs': input_names,
+        'opset': args.opset,
+        'torch_version': torch.__version__,
+        'onnxruntime_version': onnxruntime.__version__,
+        'exported_at': time.time(),
+        'files': {
+            precision: {
+                'file': ONNX_MODEL_FILES[precision],
+                'sha256': _sha256(os.path.join(work_dir, ONNX_MODEL_FILES[precision])),
+            } for precision in precisions
+        },
+    }
+    info_path = os.path.join(work_dir, ONNX_EXPORT_INFO)
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+
+    # 一致性与吞吐：经服务实际使用的 OnnxTextBackend 加载
+    info['parity'] = {'corpus': {'source': source, 'size': len(texts)}}
+    expected, info['parity']['torch'] = _timed_encode(reference, texts, args.batch_size)
+    for precision in precisions:
+        backend = OnnxTextBackend(args.model, 'cpu', precision, work_dir)
+        actual, entry = _timed_encode(backend, texts, args.batch_size)
+        entry.update(agreement(expected, actual, args.top_k))
+        info['parity'][f'onnx-{precision}'] = entry
+        del backend
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    print(json.dumps(info['parity'], ensure_ascii=False, indent=2))
+
+    cosine_min = info['parity'][f'onnx-{PRECISION_FP32}']['cosine_min']
+    if cosine_min < args.min_cosine:
+        logger.error(f"✗ fp32 graph min cosine {cosine_min:.6f} < {args.min_cosine}, "
+                     f"keeping the previous export (this one is in {work_dir})")
+        sys.exit(1)
+
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.replace(work_dir, target_dir)
+    logger.info(f"✓ ONNX export ready: {target_dir} (PYTHON_EMBEDDING_TEXT_BACKEND=onnx)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+TasteInsight 嵌入服务 - 拟合 v2 降维投影
+
+在菜品目录上计算完整的 v2 向量（788 维），拟合 PCA（可选白化）投影并保存到
+MODEL_DIR/v2_pca{dim}.npz，服务以 v2-pca{dim} 版本加载（维度见 PYTHON_EMBEDDING_PCA_DIMS）。
+
+报告：
+- 解释方差占比：所选维度及若干常用维度的累计值，用于选择维度
+- 近邻重合率：降维后 top-k 近邻与完整 v2 的平均重合率。先在留出集上评估（投影未见过这些条目），
+  再用全部条目重新拟合并评估保存的投影
+
+语料来源与 warm_text_store.py 相同（目录导出文件或数据库）。
+
+用法：
+    python fit_pca.py catalog.jsonl --dim 128
+    python fit_pca.py --from-db --dim 128 --min-overlap 0.8 --report pca_report.json
+"""
+
+import argparse
+import json
+import logging
+import sys
+from typing import Dict
+
+import numpy as np
+
+from config import Config
+from encoders import NumericEncoder, TextEncoder
+from models import ConcatModel, PCAConcatModel
+from models.pca import fit_projection, projection_path_for, save_projection
+from precision_report import load_corpus, neighbour_overlap
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 报告累计解释方差的维度
+REPORT_DIMS = (16, 32, 64, 128, 256, 384)
+
+
+def evaluate(reference: np.ndarray, model: PCAConcatModel, text_embs: np.ndarray, numeric_embs: np.ndarray,
+             k: int, sample: np.ndarray) -> Dict:
+    """
+    在 sample 条目上对比降维向量与完整 v2 向量的 top-k 近邻
+
+    Args:
+        reference: 完整 v2 向量 (N, 788)，已归一化
+        model: 已设置投影的降维模型
+        text_embs / numeric_embs: 全部条目的输入
+        k: 近邻数
+        sample: 参与评估的条目下标
+    """
+    k = min(k, len(sample) - 1)
+    projected = model.generate_embedding(text_embs[sample], numeric_embs[sample])
+    return {
+        'items': int(len(sample)),
+        f'top{k}_overlap': round(neighbour_overlap(reference[sample], projected, k), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit a PCA projection for reduced-dimension v2 embeddings')
+    parser.add_argument('catalog', nargs='?', help="Catalog export (JSON / JSONL), '-' for stdin")
+    parser.add_argument('--from-db', action='store_true', help='Read dishes from the database')
+    parser.add_argument('--dim', type=int, default=(Config.PCA_DIMS or [128])[0], help='Output dimension')
+    parser.add_argument('--whiten', action='store_true', help='Scale components to unit variance')
+    parser.add_argument('--limit', type=int, default=200000, help='Max corpus size')
+    parser.add_argument('--holdout', type=float, default=0.1, help='Fraction held out for evaluation')
+    parser.add_argument('--eval-size', type=int, default=2000, help='Max items per neighbour evaluation')
+    parser.add_argument('--top-k', type=int, default=10, help='Neighbours compared per item')
+    parser.add_argument('--batch-size', type=int, default=64, help='Text encoder batch size')
+    parser.add_argument('--device', default=Config.DEVICE, help='Device (cuda/cpu), None for auto')
+    parser.add_argument('--output', help='Projection path (default: MODEL_DIR/v2_pca{dim}.npz)')
+    parser.add_argument('--min-overlap', type=float, default=None,
+                        help='Exit with status 1 and keep the old projection if holdout overlap is below this value')
+    parser.add_argument('--report', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    if not args.catalog and not args.from_db:
+        parser.error('either a catalog file or --from-db is required')
+    if not 0 <= args.holdout < 1:
+        parser.error('--holdout must be in [0, 1)')
+
+    source, texts, features_list = load_corpus(args.catalog, args.from_db, args.limit)
+    if len(texts) <= args.dim:
+        parser.error(f'corpus has {len(texts)} items, need more than --dim ({args.dim})')
+    logger.info(f"Corpus: {source} ({len(texts)} items), dim: {args.dim}, whiten: {args.whiten}")
+
+    encoder = TextEncoder(model_name=Config.TEXT_MODEL, device=args.device, precision=Config.TEXT_PRECISION,
+                          backend=Config.TEXT_BACKEND, onnx_dir=Config.ONNX_DIR,
+                          student_dir=Config.TEXT_STUDENT_DIR or None,
+                          fast_layers=Config.TEXT_FAST_LAYERS, fast_adapter_dir=Config.MODEL_DIR)
+    text_embs = encoder.encode(texts, batch_size=args.batch_size)
+    numeric_embs = NumericEncoder(dimension=20).encode(features_list)
+    reference = ConcatModel().generate_embedding(text_embs, numeric_embs).astype(np.float32)
+
+    model = PCAConcatModel(output_dim=args.dim, device='cpu')
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(texts))
+    report = {
+        'corpus': {'source': source, 'size': len(texts)},
+        'text_model': encoder.cache_key,
+        'dim': args.dim,
+        'whiten': args.whiten,
+    }
+
+    # 留出集评估：投影只在其余条目上拟合
+    n_holdout = min(int(len(texts) * args.holdout), args.eval_size)
+    if n_holdout > args.top_k and len(texts) - n_holdout > args.dim:
+        model.set_projection(fit_projection(reference[order[n_holdout:]], args.dim, args.whiten))
+        report['holdout'] = evaluate(reference, model, text_embs, numeric_embs, args.top_k, order[:n_holdout])
+    else:
+        logger.warning("Corpus too small for a holdout evaluation, reporting in-sample overlap only")
+
+    projection = fit_projection(reference, args.dim, args.whiten)
+    ratio = projection['explained_variance_ratio']
+    report['explained_variance_ratio'] = round(float(ratio[:args.dim].sum()), 4)
+    report['cumulative_variance'] = {
+        dim: round(float(ratio[:dim].sum()), 4) for dim in sorted(set(REPORT_DIMS) | {args.dim}) if dim <= len(ratio)
+    }
+    model.set_projection(projection)
+    report['in_sample'] = evaluate(reference, model, text_embs, numeric_embs, args.top_k,
+                                   np.sort(order[:args.eval_size]))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+
+    if args.min_overlap is not None:
+        evaluation = report.get('holdout', report['in_sample'])
+        overlap = next(value for key, value in evaluation.items() if key.endswith('_overlap'))
+        if overlap < args.min_overlap:
+            logger.error(f"✗ Neighbour overlap {overlap:.4f} < {args.min_overlap}, projection not saved")
+            sys.exit(1)
+
+    path = args.output or projection_path_for(Config.MODEL_DIR, args.dim)
+    save_projection(path, projection, meta={key: report[key] for key in (
+        'corpus', 'text_model', 'explained_variance_ratio', 'holdout', 'in_sample') if key in report})
+    logger.info(f"✓ Saved {path}; serve it as v2-pca{args.dim} (PYTHON_EMBEDDING_PCA_DIMS)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+"""
+gunicorn 配置钩子（gunicorn 启动时自动加载当前目录下的 gunicorn.conf.py）
+
+命令行参数（-w / -b 等）仍在 Dockerfile 中指定，这里放进程生命周期钩子和 worker 线程数。
+"""
+
+import glob
+import os
+
+# 每个 worker 的线程数（只对 Flask 的 gthread worker 生效，uvicorn worker 忽略），与 Config.WORKER_THREADS 读取同一变量和默认值（加载本文件时项目目录
+# 尚未加入 sys.path，不能导入 config）。app.py 的准入上限低于线程数，超出上限的请求仍有空闲线程立即返回 429
+threads = int(os.environ.get('PYTHON_EMBEDDING_WORKER_THREADS', 40))
+
+
+def on_starting(server):
+    """主进程启动时清空上次运行遗留的 Prometheus 多进程指标文件"""
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not multiproc_dir:
+        return
+    os.makedirs(multiproc_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(multiproc_dir, '*.db')):
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    """worker 退出时清理其 live* 类型的指标"""
+    from services.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
@@ -1,12 +1,17 @@
 from .base import BaseEmbeddingModel
 from .concat import ConcatModel
 from .fusion import FeatureFusionMLP, FusionModel
+from .pca import PCAConcatModel
+from .precision import PRECISIONS, parse_precision
 
 __all__ = [
     'BaseEmbeddingModel',
     'ConcatModel',
     'FusionModel',
     'FeatureFusionMLP',  # 保留用于训练
+    'PCAConcatModel',
+    'PRECISIONS',
+    'parse_precision',
 ]
 
 __version__ = '0.1.0'
\ No newline at end of file
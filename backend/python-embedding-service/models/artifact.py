@@ -0,0 +1,238 @@
+"""
+v3 推理产物 - 由训练检查点导出的 TorchScript 模块
+
+检查点（fusion_v3.pt）包含优化器状态和训练参数，加载后是带 Dropout 的 eager 网络。
+推理产物只保留 eval 模式下的计算图：Dropout 替换为恒等映射，经 torch.jit.trace + freeze
+把参数折叠为常量，加载更快、单批前向开销更低。
+
+文件格式：
+    MAGIC (8 字节) | 头部长度 (4 字节大端) | 头部 JSON | TorchScript 字节流
+
+头部记录维度、TorchScript 字节流的 sha256（加载时校验）、导出前 fp32 权重的摘要
+（与 eager 网络加载同一检查点时的权重摘要一致，嵌入指纹不因改用推理产物而变化）以及来源检查点信息，
+其中 source 为来源检查点文件的大小和 sha256，服务据此判断产物是否由磁盘上当前的检查点导出。
+"""
+
+import copy
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+import time
+from typing import Any, Dict, Tuple
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TIFUSE\x00\x01'
+ARTIFACT_FORMAT = 1
+
+# 随检查点一起保存、写入头部的训练信息
+_CHECKPOINT_FIELDS = ('epoch', 'train_loss', 'test_loss', 'test_accuracy', 'timestamp')
+
+
+def state_dict_digest(state_dict: Dict[str, Any]) -> str:
+    """
+    权重的 sha256 摘要（十六进制）
+
+    张量按名称、dtype 和原始字节计入；动态量化层的打包权重（元组）逐项计入，量化张量取整数表示。
+    """
+    digest = hashlib.sha256()
+
+    def update(value):
+        if isinstance(value, (tuple, list)):
+            for item in value:
+                update(item)
+        elif isinstance(value, torch.Tensor):
+            tensor = value.detach().cpu()
+            if tensor.is_quantized:
+                tensor = tensor.int_repr()
+            digest.update(str(tensor.dtype).encode('utf-8'))
+            digest.update(tensor.contiguous().reshape(-1).view(torch.uint8).numpy().tobytes())
+        elif value is not None:
+            digest.update(repr(value).encode('utf-8'))
+
+    for name, value in state_dict.items():
+        digest.update(name.encode('utf-8'))
+        update(value)
+    return digest.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    """文件内容的 sha256（十六进制）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def checkpoint_source(checkpoint_path: str) -> Dict[str, Any]:
+    """来源检查点文件的标识（写入头部的 source 字段）"""
+    return {
+        'file': os.path.basename(checkpoint_path),
+        'size': os.path.getsize(checkpoint_path),
+        'sha256': file_sha256(checkpoint_path),
+    }
+
+
+def matches_checkpoint(header: Dict[str, Any], checkpoint_path: str) -> bool:
+    """
+    推理产物是否由 checkpoint_path 当前的内容导出
+
+    先比较文件大小，相同时再比较 sha256；头部没有 source（直接从内存中的网络导出，或旧版产物）时无法确认，返回 False。
+    """
+    source = header.get('source') or {}
+    if not source.get('sha256') or os.path.getsize(checkpoint_path) != source.get('size'):
+        return False
+    return file_sha256(checkpoint_path) == source['sha256']
+
+
+def artifact_path_for(checkpoint_path: str) -> str:
+    """检查点对应的推理产物路径（fusion_v3.pt -> fusion_v3.jit）"""
+    return os.path.splitext(checkpoint_path)[0] + '.jit'
+
+
+def _strip_dropout(module: nn.Module) -> nn.Module:
+    """把 Dropout 替换为 nn.Identity（eval 模式下两者等价，trace 后不再留下 dropout 节点）"""
+    for name, child in module.named_children():
+        if isinstance(child, nn.Dropout):
+            setattr(module, name, nn.Identity())
+        else:
+            _strip_dropout(child)
+    return module
+
+
+def export_artifact(model: nn.Module,
+                    path: str,
+                    text_dim: int,
+                    numeric_dim: int,
+                    output_dim: int,
+                    checkpoint_info: Dict[str, Any] = None,
+                    source: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    导出推理产物
+
+    Args:
+        model: 已加载权重的 fp32 FeatureFusionMLP（不会被修改）
+        path: 输出路径
+        text_dim / numeric_dim / output_dim: 网络维度
+        checkpoint_info: 来源检查点信息，写入头部
+        source: 来源检查点文件的标识（见 checkpoint_source），None 表示不是从检查点文件导出
+
+    Returns:
+        头部字典
+    """
+    model = copy.deepcopy(model).float().cpu().eval()
+    weights_sha256 = state_dict_digest(model.state_dict())
+    model = _strip_dropout(model)
+
+    example = (torch.zeros(2, text_dim), torch.zeros(2, numeric_dim))
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, example))
+
+    buffer = io.BytesIO()
+    torch.jit.save(traced, buffer)
+    payload = buffer.getvalue()
+
+    header = {
+        'format': ARTIFACT_FORMAT,
+        'text_dim': text_dim,
+        'numeric_dim': numeric_dim,
+        'output_dim': output_dim,
+        'weights_sha256': weights_sha256,
+        'payload_sha256': hashlib.sha256(payload).hexdigest(),
+        'payload_bytes': len(payload),
+        'torch_version': torch.__version__,
+        'exported_at': time.time(),
+        'checkpoint': {key: value for key, value in (checkpoint_info or {}).items()
+                       if key in _CHECKPOINT_FIELDS},
+        'source': source,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # 先写临时文件再替换，服务进程不会读到半个文件
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('>I', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+    logger.info(f"Exported inference artifact: {path} ({len(payload) / 1024:.1f} KB)")
+    return header
+
+
+def export_checkpoint(checkpoint_path: str, path: str = None) -> Dict[str, Any]:
+    """
+    从训练检查点导出推理产物
+
+    Args:
+        checkpoint_path: train_fusion.py 保存的检查点
+        path: 输出路径，None 时为 artifact_path_for(checkpoint_path)
+
+    Returns:
+        头部字典
+    """
+    from .fusion import FeatureFusionMLP
+
+    checkpoint = torch.load(checkpoint_path, map_location='cpu')
+    state_dict = checkpoint['model_state_dict']
+    text_dim = state_dict['text_proj.0.weight'].shape[1]
+    numeric_dim = state_dict['numeric_proj.0.weight'].shape[1]
+    output_dim = state_dict['fusion.4.weight'].shape[0]
+
+    model = FeatureFusionMLP(text_dim, numeric_dim, output_dim)
+    model.load_state_dict(state_dict)
+    return export_artifact(model, path or artifact_path_for(checkpoint_path),
+                           text_dim, numeric_dim, output_dim, checkpoint, checkpoint_source(checkpoint_path))
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    """只读取推理产物头部"""
+    with open(path, 'rb') as f:
+        return _read_header(f)
+
+
+def _read_header(f) -> Dict[str, Any]:
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a fusion inference artifact")
+    (length,) = struct.unpack('>I', f.read(4))
+    header = json.loads(f.read(length).decode('utf-8'))
+    if header.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"Unsupported artifact format: {header.get('format')}")
+    return header
+
+
+def load_artifact(path: str, device: str = 'cpu') -> Tuple[torch.jit.ScriptModule, Dict[str, Any]]:
+    """
+    加载推理产物
+
+    Args:
+        path: 推理产物路径
+        device: 计算设备
+
+    Returns:
+        (TorchScript 模块, 头部字典)
+
+    Raises:
+        ValueError: 文件格式不符或校验和不匹配
+    """
+    with open(path, 'rb') as f:
+        header = _read_header(f)
+        payload = f.read()
+
+    if len(payload) != header['payload_bytes'] or hashlib.sha256(payload).hexdigest() != header['payload_sha256']:
+        raise ValueError(f"Artifact checksum mismatch: {path}")
+
+    module = torch.jit.load(io.BytesIO(payload), map_location=device)
+    module.eval()
+    return module, header
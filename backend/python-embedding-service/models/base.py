@@ -4,6 +4,7 @@
 """
 
 from abc import ABC, abstractmethod
+import torch
 import torch.nn as nn
 from typing import Dict, Any
 import numpy as np
@@ -42,6 +43,21 @@ class BaseEmbeddingModel(ABC):
         """
         pass
     
+    def embed_into(self, text_emb: torch.Tensor, numeric_emb: torch.Tensor, out: torch.Tensor):
+        """
+        张量版 generate_embedding：结果写入预分配的 out（EmbeddingService 的推理路径使用）
+        
+        默认实现经 numpy 调用 generate_embedding 再拷入 out；子类可覆盖为不经 numpy、
+        不产生中间拷贝的实现。
+        
+        Args:
+            text_emb: 文本嵌入 (N, text_dim) float32
+            numeric_emb: 数值特征 (N, numeric_dim) float32
+            out: 输出 (N, output_dim) float32，与输入在同一设备
+        """
+        result = self.generate_embedding(text_emb.cpu().numpy(), numeric_emb.cpu().numpy())
+        out.copy_(torch.from_numpy(result))
+    
     @abstractmethod
     def get_trainable_model(self):
         """获取可训练的 PyTorch 模型（如果有）"""
@@ -4,6 +4,8 @@ Concat 模型 (v2)
 """
 
 import numpy as np
+import torch
+import torch.nn.functional as F
 from typing import Dict, Any
 from .base import BaseEmbeddingModel
 
@@ -60,6 +62,12 @@ class ConcatModel(BaseEmbeddingModel):
         
         return hybrid
     
+    def embed_into(self, text_emb: torch.Tensor, numeric_emb: torch.Tensor, out: torch.Tensor):
+        """拼接直接写入 out 的两段，再原地归一化（零向量保持为零）"""
+        out[:, :self.text_dim] = text_emb
+        out[:, self.text_dim:] = numeric_emb
+        F.normalize(out, p=2, dim=1, out=out)
+    
     def get_trainable_model(self):
         """Concat 模型不需要训练"""
         return None
@@ -7,7 +7,9 @@ import torch
 import torch.nn as nn
 import numpy as np
 from typing import Dict, Any
+from .artifact import load_artifact
 from .base import BaseEmbeddingModel
+from .precision import PRECISION_FP32, apply_precision, input_dtype, parse_precision
 
 
 class FeatureFusionMLP(nn.Module):
@@ -59,7 +61,7 @@ class FeatureFusionMLP(nn.Module):
 class FusionModel(BaseEmbeddingModel):
     """融合模型包装器 - 使用神经网络融合特征"""
     
-    def __init__(self, text_dim=768, numeric_dim=20, output_dim=256, device='cpu'):
+    def __init__(self, text_dim=768, numeric_dim=20, output_dim=256, device='cpu', precision=PRECISION_FP32):
         super().__init__()
         self.version = 'v3'
         self.text_dim = text_dim
@@ -68,11 +70,23 @@ class FusionModel(BaseEmbeddingModel):
         self.requires_training = True
         self.description = '神经网络融合'
         self.device = device
+        self.precision = parse_precision(precision)
+        self._input_dtype = input_dtype(self.precision)
+        # 从推理产物加载时为 TorchScript 模块，weights_sha256 取自产物头部
+        self.compiled = False
+        self.weights_sha256 = None
         
         # 创建 PyTorch 模型
-        self.model = FeatureFusionMLP(text_dim, numeric_dim, output_dim)
-        self.model.to(device)
-        self.model.eval()
+        self.model = self._build()
+    
+    def _build(self, state_dict=None) -> nn.Module:
+        """创建 fp32 网络（可选加载权重），再转换为目标精度"""
+        model = FeatureFusionMLP(self.text_dim, self.numeric_dim, self.dimension)
+        if state_dict is not None:
+            model.load_state_dict(state_dict)
+        model.to(self.device)
+        model.eval()
+        return apply_precision(model, self.precision, self.device)
     
     def get_info(self) -> Dict[str, Any]:
         info = super().get_info()
@@ -82,14 +96,39 @@ class FusionModel(BaseEmbeddingModel):
             'output_dim': self.dimension,
             'method': 'neural_fusion',
             'device': str(self.device),
+            'precision': self.precision,
+            'compiled': self.compiled,
         })
         return info
     
     def load_weights(self, checkpoint_path: str):
         """加载训练好的权重"""
         checkpoint = torch.load(checkpoint_path, map_location=self.device)
-        self.model.load_state_dict(checkpoint['model_state_dict'])
-        self.model.eval()
+        self.load_state_dict(checkpoint['model_state_dict'])
+    
+    def load_state_dict(self, state_dict: Dict[str, Any]):
+        """加载 fp32 权重：量化 / bf16 模型需要从 fp32 网络重新转换"""
+        self.model = self._build(state_dict)
+        self.compiled = False
+        self.weights_sha256 = None
+    
+    def load_artifact(self, artifact_path: str):
+        """
+        加载 train_fusion.py 导出的推理产物（TorchScript，见 models/artifact.py）
+        
+        Raises:
+            ValueError: 非 fp32 精度（产物的参数已折叠为常量，无法再转换）、维度不符或校验失败
+        """
+        if self.precision != PRECISION_FP32:
+            raise ValueError(f"Inference artifact is fp32 only, precision is {self.precision}")
+        module, header = load_artifact(artifact_path, self.device)
+        dims = (header['text_dim'], header['numeric_dim'], header['output_dim'])
+        if dims != (self.text_dim, self.numeric_dim, self.dimension):
+            raise ValueError(f"Artifact dimensions {dims} do not match model "
+                             f"{(self.text_dim, self.numeric_dim, self.dimension)}")
+        self.model = module
+        self.compiled = True
+        self.weights_sha256 = header['weights_sha256']
     
     def generate_embedding(self, text_emb: np.ndarray, numeric_emb: np.ndarray) -> np.ndarray:
         """
@@ -104,8 +143,8 @@ class FusionModel(BaseEmbeddingModel):
         """
         with torch.no_grad():
             # 转换为 tensor
-            text_tensor = torch.from_numpy(text_emb).float().to(self.device)
-            numeric_tensor = torch.from_numpy(numeric_emb).float().to(self.device)
+            text_tensor = torch.from_numpy(text_emb).to(self.device, self._input_dtype)
+            numeric_tensor = torch.from_numpy(numeric_emb).to(self.device, self._input_dtype)
             
             # 添加 batch 维度（如果需要）
             if text_tensor.dim() == 1:
@@ -121,14 +160,23 @@ class FusionModel(BaseEmbeddingModel):
             # L2 归一化
             output = torch.nn.functional.normalize(output, p=2, dim=-1)
             
-            # 转回 numpy
-            result = output.cpu().numpy()
+            # 转回 numpy（bf16 输出统一转为 fp32）
+            result = output.float().cpu().numpy()
             
             if squeeze:
                 result = result.squeeze(0)
             
             return result
     
+    def embed_into(self, text_emb: torch.Tensor, numeric_emb: torch.Tensor, out: torch.Tensor):
+        """张量版融合：fp32 时输入直接送入网络，归一化结果写入 out"""
+        with torch.no_grad():
+            output = self.model(text_emb.to(self._input_dtype), numeric_emb.to(self._input_dtype))
+            if output.dtype == out.dtype:
+                torch.nn.functional.normalize(output, p=2, dim=-1, out=out)
+            else:
+                out.copy_(torch.nn.functional.normalize(output.float(), p=2, dim=-1))
+    
     def get_trainable_model(self):
         """返回可训练的 PyTorch 模型"""
         return self.model
@@ -0,0 +1,245 @@
+"""
+PCA 降维模型 (v2-pca{dim})
+在 v2 拼接向量上做离线拟合的 PCA（可选白化）投影
+
+v2 的 788 维向量让 pgvector 的每次距离计算和每个索引页都更贵。投影矩阵由 fit_pca.py
+在菜品目录上拟合，保存为 MODEL_DIR/v2_pca{dim}.npz：
+
+    mean        (788,)        拟合语料上 v2 向量的均值
+    components  (dim, 788)    主成分（按解释方差降序）
+    explained_variance (dim,) 各主成分的方差
+    whiten      ()            是否白化（按主成分标准差缩放）
+    meta        ()            拟合信息 JSON（语料、解释方差占比、近邻重合率等）
+
+推理时把中心化、投影、白化折叠为一次仿射变换 z = x @ W + b，再做 L2 归一化。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from .concat import ConcatModel
+
+logger = logging.getLogger(__name__)
+
+PROJECTION_FORMAT = 1
+
+# 白化时方差的下限，避免除以接近 0 的值
+_WHITEN_EPS = 1e-8
+
+
+def projection_path_for(model_dir: str, dim: int) -> str:
+    """降维维度对应的投影文件路径"""
+    return os.path.join(model_dir, f'v2_pca{dim}.npz')
+
+
+def fit_projection(embeddings: np.ndarray, dim: int, whiten: bool = False) -> Dict[str, Any]:
+    """
+    在 v2 向量上拟合 PCA
+
+    协方差矩阵只有 788 x 788，按块累加后做特征分解，语料再大也不需要把中心化后的矩阵整个放进内存。
+
+    Args:
+        embeddings: (N, input_dim) v2 向量
+        dim: 保留的主成分数
+        whiten: 是否白化
+
+    Returns:
+        {'mean', 'components', 'explained_variance', 'explained_variance_ratio', 'whiten'}
+
+    Raises:
+        ValueError: 样本数或输入维度不足
+    """
+    n, input_dim = embeddings.shape
+    if not 0 < dim <= input_dim:
+        raise ValueError(f"PCA dim must be in [1, {input_dim}], got {dim}")
+    if n <= dim:
+        raise ValueError(f"Need more than {dim} items to fit a {dim}-dim projection, got {n}")
+
+    mean = embeddings.mean(axis=0, dtype=np.float64)
+    covariance = np.zeros((input_dim, input_dim), dtype=np.float64)
+    for i in range(0, n, 4096):
+        chunk = embeddings[i:i + 4096].astype(np.float64) - mean
+        covariance += chunk.T @ chunk
+    covariance /= n - 1
+
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1]
+    eigenvalues = np.maximum(eigenvalues[order], 0.0)
+    components = eigenvectors[:, order[:dim]].T
+
+    # 主成分的符号不唯一，固定为绝对值最大的分量为正，重新拟合时结果稳定
+    signs = np.sign(components[np.arange(dim), np.abs(components).argmax(axis=1)])
+    components *= signs[:, None]
+
+    total = eigenvalues.sum()
+    return {
+        'mean': mean.astype(np.float32),
+        'components': components.astype(np.float32),
+        'explained_variance': eigenvalues[:dim].astype(np.float32),
+        'explained_variance_ratio': eigenvalues / total if total > 0 else np.zeros_like(eigenvalues),
+        'whiten': whiten,
+    }
+
+
+def save_projection(path: str, projection: Dict[str, Any], meta: Dict[str, Any] = None):
+    """保存投影（先写临时文件再替换）"""
+    meta = dict(meta or {})
+    meta.setdefault('fitted_at', time.time())
+    meta['format'] = PROJECTION_FORMAT
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp.npz'
+    np.savez(
+        tmp_path,
+        mean=projection['mean'],
+        components=projection['components'],
+        explained_variance=projection['explained_variance'],
+        whiten=np.array(bool(projection['whiten'])),
+        meta=np.array(json.dumps(meta, ensure_ascii=False)),
+    )
+    os.replace(tmp_path, path)
+    logger.info(f"Saved PCA projection: {path}")
+
+
+def load_projection(path: str) -> Dict[str, Any]:
+    """
+    读取投影文件
+
+    Raises:
+        ValueError: 格式版本不符
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        if meta.get('format') != PROJECTION_FORMAT:
+            raise ValueError(f"Unsupported PCA projection format: {meta.get('format')}")
+        return {
+            'mean': data['mean'].astype(np.float32),
+            'components': data['components'].astype(np.float32),
+            'explained_variance': data['explained_variance'].astype(np.float32),
+            'whiten': bool(data['whiten']),
+            'meta': meta,
+        }
+
+
+def affine_from_projection(projection: Dict[str, Any]):
+    """
+    折叠为仿射变换 z = x @ W + b
+
+    Returns:
+        (W (input_dim, dim), b (dim,))，float32
+    """
+    weight = projection['components'].astype(np.float64).T
+    if projection['whiten']:
+        weight = weight / np.sqrt(np.maximum(projection['explained_variance'].astype(np.float64), _WHITEN_EPS))
+    bias = -projection['mean'].astype(np.float64) @ weight
+    return weight.astype(np.float32), bias.astype(np.float32)
+
+
+class PCAConcatModel(ConcatModel):
+    """PCA 降维模型 - v2 拼接向量经离线拟合的投影降到 output_dim 维"""
+
+    def __init__(self, text_dim=768, numeric_dim=20, output_dim=128, device='cpu', text_key=None):
+        super().__init__(text_dim=text_dim, numeric_dim=numeric_dim)
+        self.version = f'v2-pca{output_dim}'
+        self.input_dim = text_dim + numeric_dim
+        self.dimension = output_dim
+        self.device = device
+        self.requires_training = True  # 需要先运行 fit_pca.py
+        self.description = f'文本+数值拼接后 PCA 降至 {output_dim} 维'
+        # 服务文本编码器的 cache_key：投影只对拟合时所用文本编码器的向量有效
+        self.text_key = text_key
+
+        self.whiten = False
+        self.meta: Dict[str, Any] = {}
+        self.weights_sha256 = None
+        self._weight = None
+        self._bias = None
+        self._weight_t = None
+        self._bias_t = None
+
+    def get_info(self) -> Dict[str, Any]:
+        info = super().get_info()
+        info.update({
+            'input_dim': self.input_dim,
+            'output_dim': self.dimension,
+            'method': 'concatenation+pca',
+            'whiten': self.whiten,
+            'fitted': self._weight is not None,
+        })
+        if 'explained_variance_ratio' in self.meta:
+            info['explained_variance_ratio'] = self.meta['explained_variance_ratio']
+        return info
+
+    def load_weights(self, path: str):
+        """
+        加载 fit_pca.py 保存的投影
+
+        Raises:
+            ValueError: 投影维度与模型不一致，或拟合所用的文本编码器与服务不同
+        """
+        self.set_projection(load_projection(path))
+
+    def set_projection(self, projection: Dict[str, Any]):
+        """
+        使用 fit_projection / load_projection 得到的投影
+
+        Raises:
+            ValueError: 投影维度与模型不一致，或拟合所用的文本编码器（meta['text_model']）与服务不同
+        """
+        shape = projection['components'].shape
+        if shape != (self.dimension, self.input_dim):
+            raise ValueError(f"PCA projection shape {shape} does not match model "
+                             f"{(self.dimension, self.input_dim)}")
+        fitted_with = projection.get('meta', {}).get('text_model')
+        if self.text_key is not None and fitted_with != self.text_key:
+            raise ValueError(f"PCA projection was fitted on text encoder {fitted_with}, "
+                             f"but the service uses {self.text_key}")
+
+        self._weight, self._bias = affine_from_projection(projection)
+        self._weight_t = torch.from_numpy(self._weight).to(self.device)
+        self._bias_t = torch.from_numpy(self._bias).to(self.device)
+        self.whiten = projection['whiten']
+        self.meta = projection.get('meta', {})
+        # 指纹随投影变化：重新拟合后旧嵌入会被 /check_stale 判为过期
+        self.weights_sha256 = hashlib.sha256(self._weight.tobytes() + self._bias.tobytes()).hexdigest()
+
+    def _require_fitted(self):
+        if self._weight is None:
+            raise RuntimeError(f"{self.version} projection is not loaded, run fit_pca.py --dim {self.dimension}")
+
+    def generate_embedding(self, text_emb: np.ndarray, numeric_emb: np.ndarray) -> np.ndarray:
+        """
+        拼接、归一化后投影并再次归一化
+
+        Args:
+            text_emb: (N, 768) 或 (768,)
+            numeric_emb: (N, 20) 或 (20,)
+
+        Returns:
+            (N, output_dim) 或 (output_dim,)
+        """
+        self._require_fitted()
+        hybrid = super().generate_embedding(text_emb, numeric_emb)
+        projected = hybrid.astype(np.float32) @ self._weight + self._bias
+
+        norms = np.linalg.norm(projected, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return projected / norms
+
+    def embed_into(self, text_emb: torch.Tensor, numeric_emb: torch.Tensor, out: torch.Tensor):
+        """拼接到临时缓冲区，投影（addmm）直接写入 out，再原地归一化"""
+        self._require_fitted()
+        hybrid = torch.empty((text_emb.shape[0], self.input_dim), dtype=torch.float32, device=out.device)
+        super().embed_into(text_emb, numeric_emb, hybrid)
+        torch.addmm(self._bias_t, hybrid, self._weight_t, out=out)
+        F.normalize(out, p=2, dim=1, out=out)
@@ -0,0 +1,81 @@
+"""
+推理精度 - fp32 / bf16 / int8
+
+- fp32: 默认，与训练时一致
+- bf16: 权重和激活转为 bfloat16，权重内存减半；需要 CPU 支持 AVX512-BF16 / AMX 或 GPU 才会更快
+- int8: nn.Linear 动态量化（权重 int8，激活在运行时按批量化），只支持 CPU；
+        Transformer 的大部分计算在 Linear 中，权重内存约为 fp32 的 1/4
+
+切换精度前先用 precision_report.py 对比 fp32 基线的余弦一致性。
+"""
+
+import io
+import logging
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+PRECISION_FP32 = 'fp32'
+PRECISION_BF16 = 'bf16'
+PRECISION_INT8 = 'int8'
+PRECISIONS = (PRECISION_FP32, PRECISION_BF16, PRECISION_INT8)
+
+_ALIASES = {
+    'float32': PRECISION_FP32,
+    'bfloat16': PRECISION_BF16,
+    'qint8': PRECISION_INT8,
+}
+
+
+def parse_precision(value: str) -> str:
+    """
+    解析精度配置
+
+    Raises:
+        ValueError: 不支持的精度
+    """
+    precision = (value or PRECISION_FP32).strip().lower()
+    precision = _ALIASES.get(precision, precision)
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported precision: {value}. Available: {list(PRECISIONS)}")
+    return precision
+
+
+def apply_precision(module: nn.Module, precision: str, device: str) -> nn.Module:
+    """
+    把 fp32 模块转换为指定精度（就地转换，返回转换后的模块）
+
+    Args:
+        module: 已加载权重的 fp32 模块（eval 模式）
+        precision: 见 PRECISIONS
+        device: 模块所在设备
+
+    Returns:
+        转换后的模块（int8 时为动态量化后的模块）
+
+    Raises:
+        ValueError: int8 用于非 CPU 设备
+    """
+    precision = parse_precision(precision)
+    if precision == PRECISION_FP32:
+        return module
+    if precision == PRECISION_BF16:
+        return module.to(torch.bfloat16)
+
+    if not str(device).startswith('cpu'):
+        raise ValueError(f"int8 dynamic quantization is only supported on CPU, got device: {device}")
+    return torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def input_dtype(precision: str) -> torch.dtype:
+    """模块输入应使用的浮点类型（int8 动态量化的输入仍为 fp32）"""
+    return torch.bfloat16 if precision == PRECISION_BF16 else torch.float32
+
+
+def module_size_mb(module: nn.Module) -> float:
+    """模块序列化后的权重大小（MB），量化后的打包权重也计算在内"""
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell() / (1024 * 1024)
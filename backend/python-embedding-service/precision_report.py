@@ -0,0 +1,282 @@
+"""
+TasteInsight 嵌入服务 - 推理精度一致性报告
+
+在样本语料上对比 bf16 / int8 与 fp32 基线，切换 PYTHON_EMBEDDING_TEXT_PRECISION /
+PYTHON_EMBEDDING_MODEL_PRECISION 前运行：
+- 文本编码器：逐条余弦相似度、top-k 近邻重合率、吞吐、权重大小
+- v3 融合网络：同一组 fp32 文本向量输入下的一致性，以及文本编码器 + 融合网络同为该精度时的端到端一致性
+
+语料来源与 warm_text_store.py 相同（目录导出文件或数据库），都未指定时使用内置样本。
+
+用法：
+    python precision_report.py catalog.jsonl --precision bf16,int8
+    python precision_report.py --from-db --limit 2000 --min-cosine 0.99 --output report.json
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from config import Config
+from encoders import NumericEncoder, TextEncoder
+from models import FusionModel, PRECISIONS, parse_precision
+from models.precision import PRECISION_FP32, module_size_mb
+from services.model_manager import ModelManager
+from warm_text_store import item_text, load_catalog_items
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 未指定语料时使用的内置样本
+SAMPLE_CORPUS = [
+    ('宫保鸡丁 鸡丁花生米爆炒，麻辣鲜香', {'price': 18, 'spicyLevel': 3, 'sweetness': 2, 'saltiness': 3, 'oiliness': 3}),
+    ('鱼香肉丝 酸甜微辣，下饭', {'price': 16, 'spicyLevel': 2, 'sweetness': 3, 'saltiness': 3, 'oiliness': 3}),
+    ('麻婆豆腐 麻辣烫嫩', {'price': 12, 'spicyLevel': 4, 'sweetness': 1, 'saltiness': 3, 'oiliness': 4}),
+    ('清炒时蔬 少油少盐', {'price': 8, 'spicyLevel': 0, 'sweetness': 1, 'saltiness': 2, 'oiliness': 1}),
+    ('番茄炒蛋 家常酸甜', {'price': 10, 'spicyLevel': 0, 'sweetness': 3, 'saltiness': 2, 'oiliness': 2}),
+    ('红烧肉 肥而不腻，浓油赤酱', {'price': 22, 'spicyLevel': 0, 'sweetness': 4, 'saltiness': 3, 'oiliness': 5}),
+    ('水煮鱼 鲜嫩鱼片配红油', {'price': 28, 'spicyLevel': 5, 'sweetness': 0, 'saltiness': 4, 'oiliness': 5}),
+    ('酸辣土豆丝 爽脆开胃', {'price': 8, 'spicyLevel': 2, 'sweetness': 0, 'saltiness': 3, 'oiliness': 2}),
+    ('糖醋里脊 外酥里嫩', {'price': 20, 'spicyLevel': 0, 'sweetness': 5, 'saltiness': 2, 'oiliness': 4}),
+    ('白切鸡 原汁原味，配姜葱', {'price': 24, 'spicyLevel': 0, 'sweetness': 1, 'saltiness': 2, 'oiliness': 1}),
+    ('回锅肉 川味经典，豆瓣酱香', {'price': 19, 'spicyLevel': 3, 'sweetness': 1, 'saltiness': 4, 'oiliness': 4}),
+    ('地三鲜 茄子土豆青椒', {'price': 14, 'spicyLevel': 1, 'sweetness': 2, 'saltiness': 3, 'oiliness': 4}),
+    ('蒜蓉西兰花 清淡爽口', {'price': 10, 'spicyLevel': 0, 'sweetness': 0, 'saltiness': 2, 'oiliness': 1}),
+    ('黑椒牛柳 黑胡椒汁浓郁', {'price': 26, 'spicyLevel': 1, 'sweetness': 1, 'saltiness': 3, 'oiliness': 3}),
+    ('兰州牛肉面 清汤牛肉', {'price': 15, 'spicyLevel': 1, 'sweetness': 0, 'saltiness': 3, 'oiliness': 2}),
+    ('扬州炒饭 虾仁火腿鸡蛋', {'price': 13, 'spicyLevel': 0, 'sweetness': 1, 'saltiness': 3, 'oiliness': 3}),
+    ('重庆小面 麻辣鲜香', {'price': 10, 'spicyLevel': 4, 'sweetness': 0, 'saltiness': 4, 'oiliness': 3}),
+    ('小笼包 皮薄汁多', {'price': 12, 'spicyLevel': 0, 'sweetness': 2, 'saltiness': 2, 'oiliness': 2}),
+    ('酸菜鱼 酸爽鲜辣', {'price': 30, 'spicyLevel': 3, 'sweetness': 0, 'saltiness': 4, 'oiliness': 3}),
+    ('凉拌黄瓜 蒜香清爽', {'price': 6, 'spicyLevel': 1, 'sweetness': 1, 'saltiness': 2, 'oiliness': 1}),
+    ('干煸四季豆 焦香入味', {'price': 14, 'spicyLevel': 2, 'sweetness': 0, 'saltiness': 3, 'oiliness': 4}),
+    ('皮蛋瘦肉粥 暖胃清淡', {'price': 9, 'spicyLevel': 0, 'sweetness': 0, 'saltiness': 2, 'oiliness': 1}),
+    ('烤鸭 皮脆肉嫩，配薄饼', {'price': 48, 'spicyLevel': 0, 'sweetness': 2, 'saltiness': 2, 'oiliness': 4}),
+    ('辣子鸡 干辣椒爆炒，香辣酥脆', {'price': 25, 'spicyLevel': 5, 'sweetness': 0, 'saltiness': 4, 'oiliness': 4}),
+]
+
+
+def load_corpus(catalog: str = None, from_db: bool = False, limit: int = 2000) -> Tuple[str, List[str], List[Dict]]:
+    """
+    读取语料
+
+    Returns:
+        (来源描述, 文本列表, 数值特征列表)
+    """
+    if from_db:
+        from train.dataset import DishDataset, get_db_config_from_env
+
+        dataset = DishDataset(db_config=get_db_config_from_env(), min_interactions=0)
+        items = [(dish['text'], dish.get('features') or {}) for dish in dataset.load_dishes()]
+        source = 'database'
+    elif catalog:
+        items = [
+            (item_text(item), (item.get('features') or {}) if isinstance(item, dict) else {})
+            for item in load_catalog_items(catalog)
+        ]
+        source = catalog
+    else:
+        items = SAMPLE_CORPUS
+        source = 'builtin-sample'
+
+    items = [(text, features) for text, features in items if text][:limit]
+    return source, [text for text, _ in items], [features for _, features in items]
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def _neighbours(embeddings: np.ndarray, k: int) -> np.ndarray:
+    """每条的 top-k 近邻下标（不含自身），embeddings 已归一化"""
+    similarity = embeddings @ embeddings.T
+    np.fill_diagonal(similarity, -np.inf)
+    return np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+
+
+def neighbour_overlap(reference: np.ndarray, candidate: np.ndarray, k: int) -> float:
+    """
+    top-k 近邻的平均重合率（两组向量维度可以不同）
+
+    Args:
+        reference: 基线向量 (N, dim)，已归一化
+        candidate: 候选向量 (N, dim')，已归一化
+        k: 近邻数，需小于 N
+    """
+    ref_nn = _neighbours(reference, k)
+    cand_nn = _neighbours(candidate, k)
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_nn, cand_nn)]))
+
+
+def agreement(reference: np.ndarray, candidate: np.ndarray, k: int = 10) -> Dict:
+    """
+    候选向量与基线向量的一致性
+
+    Args:
+        reference: fp32 基线 (N, dim)
+        candidate: 候选精度 (N, dim)
+        k: 近邻数
+
+    Returns:
+        逐条余弦的统计量，以及 top-k 近邻的平均重合率（检索结果是否变化）
+    """
+    reference = _normalize(reference.astype(np.float64))
+    candidate = _normalize(candidate.astype(np.float64))
+    cosine = np.sum(reference * candidate, axis=1)
+
+    result = {
+        'cosine_mean': float(cosine.mean()),
+        'cosine_min': float(cosine.min()),
+        'cosine_p1': float(np.percentile(cosine, 1)),
+        'cosine_p5': float(np.percentile(cosine, 5)),
+    }
+
+    k = min(k, len(reference) - 1)
+    if k > 0:
+        result[f'top{k}_overlap'] = neighbour_overlap(reference, candidate, k)
+    return result
+
+
+def _timed(fn, *args) -> Tuple[np.ndarray, float]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def compare_text(texts: List[str], precisions: List[str], device: str, batch_size: int, k: int) -> Tuple[Dict, Dict]:
+    """
+    对比文本编码器
+
+    Returns:
+        (报告, {精度: 文本向量})，向量供端到端对比复用
+    """
+    report, embeddings = {}, {}
+    for precision in [PRECISION_FP32] + precisions:
+        encoder = TextEncoder(model_name=Config.TEXT_MODEL, device=device, precision=precision)
+        encoder.encode(texts[:batch_size], batch_size=batch_size)  # 预热
+        embeddings[precision], seconds = _timed(encoder.encode, texts, batch_size)
+
+        entry = {
+            'size_mb': round(encoder.backend.size_mb(), 2),
+            'texts_per_second': round(len(texts) / seconds, 1),
+        }
+        if precision != PRECISION_FP32:
+            entry.update(agreement(embeddings[PRECISION_FP32], embeddings[precision], k))
+        report[precision] = entry
+        del encoder
+    return report, embeddings
+
+
+def compare_fusion(text_embeddings: Dict[str, np.ndarray], numeric_embs: np.ndarray,
+                   precisions: List[str], device: str, k: int) -> Dict:
+    """
+    对比 v3 融合网络：所有精度加载同一份 fp32 权重（未训练时为同一份随机初始化权重）
+    """
+    manager = ModelManager(device=device, model_dir=Config.MODEL_DIR)
+    baseline = manager.get_model('v3')
+    state_dict = baseline.model.state_dict()
+
+    fp32_text = text_embeddings[PRECISION_FP32]
+    reference, seconds = _timed(baseline.generate_embedding, fp32_text, numeric_embs)
+    report = {PRECISION_FP32: {
+        'size_mb': round(module_size_mb(baseline.model), 3),
+        'items_per_second': round(len(fp32_text) / seconds, 1),
+    }}
+
+    for precision in precisions:
+        model = FusionModel(text_dim=baseline.text_dim, numeric_dim=baseline.numeric_dim,
+                            output_dim=baseline.dimension, device=baseline.device, precision=precision)
+        model.load_state_dict(state_dict)
+
+        candidate, seconds = _timed(model.generate_embedding, fp32_text, numeric_embs)
+        entry = {
+            'size_mb': round(module_size_mb(model.model), 3),
+            'items_per_second': round(len(fp32_text) / seconds, 1),
+        }
+        entry.update(agreement(reference, candidate, k))
+        if precision in text_embeddings:
+            # 文本编码器与融合网络同为该精度
+            end_to_end = model.generate_embedding(text_embeddings[precision], numeric_embs)
+            entry['end_to_end'] = agreement(reference, end_to_end, k)
+        report[precision] = entry
+    return report
+
+
+def _failures(report: Dict, min_cosine: float) -> List[str]:
+    """第 1 百分位余弦低于阈值的对比项"""
+    failures = []
+    for component in ('text', 'v3'):
+        for precision, entry in report.get(component, {}).items():
+            for name, stats in ((component, entry), (f'{component}/end_to_end', entry.get('end_to_end'))):
+                if stats and 'cosine_p1' in stats and stats['cosine_p1'] < min_cosine:
+                    failures.append(f"{name} {precision}: p1 cosine {stats['cosine_p1']:.4f} < {min_cosine}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare bf16 / int8 inference against the fp32 baseline')
+    parser.add_argument('catalog', nargs='?', help="Catalog export (JSON / JSONL), '-' for stdin")
+    parser.add_argument('--from-db', action='store_true', help='Read dishes from the database')
+    parser.add_argument('--precision', default='bf16,int8',
+                        help=f'Comma-separated precisions to compare with fp32 ({", ".join(PRECISIONS[1:])})')
+    parser.add_argument('--limit', type=int, default=2000, help='Max corpus size')
+    parser.add_argument('--top-k', type=int, default=10, help='Neighbours compared per item')
+    parser.add_argument('--batch-size', type=int, default=64, help='Text encoder batch size')
+    parser.add_argument('--device', default=Config.DEVICE or 'cpu', help='Device (int8 requires cpu)')
+    parser.add_argument('--skip-model', action='store_true', help='Only compare the text encoder')
+    parser.add_argument('--min-cosine', type=float, default=None,
+                        help='Exit with status 1 if any p1 cosine falls below this value')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    try:
+        precisions = [parse_precision(p) for p in args.precision.split(',') if p.strip()]
+    except ValueError as e:
+        parser.error(str(e))
+    precisions = [p for p in dict.fromkeys(precisions) if p != PRECISION_FP32]
+    if not precisions:
+        parser.error('no precision to compare with fp32')
+
+    source, texts, features_list = load_corpus(args.catalog, args.from_db, args.limit)
+    if len(texts) < 2:
+        parser.error('corpus needs at least 2 texts')
+    logger.info(f"Corpus: {source} ({len(texts)} items), precisions: {precisions}, device: {args.device}")
+
+    report = {
+        'corpus': {'source': source, 'size': len(texts)},
+        'device': args.device,
+        'text_model': Config.TEXT_MODEL,
+    }
+    report['text'], text_embeddings = compare_text(texts, precisions, args.device, args.batch_size, args.top_k)
+    if not args.skip_model:
+        numeric_embs = NumericEncoder(dimension=20).encode(features_list)
+        report['v3'] = compare_fusion(text_embeddings, numeric_embs, precisions, args.device, args.top_k)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        logger.info(f"✓ Report written to {args.output}")
+    else:
+        print(output)
+
+    if args.min_cosine is not None:
+        failures = _failures(report, args.min_cosine)
+        for failure in failures:
+            logger.error(f"✗ {failure}")
+        if failures:
+            sys.exit(1)
+        logger.info(f"✓ All p1 cosines >= {args.min_cosine}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+TasteInsight 嵌入服务 - 一致性哈希路由（ASGI）
+
+部署多个嵌入服务副本时放在副本前面，代替轮询负载均衡：
+- /embed_batch、/embed_features、/embed_multi 按条目文本一致性哈希拆分，并行发往各副本，按原顺序合并
+- /embed、/convert_version 按文本整体转发给所属副本
+- 其余接口（/check_stale、/models 等）在健康副本间轮询转发
+
+同一文本总是由同一副本编码，各副本的文本嵌入缓存互不重叠。副本列表见 PYTHON_EMBEDDING_ROUTER_REPLICAS。
+
+启动：
+    PYTHON_EMBEDDING_ROUTER_REPLICAS=http://embedding-1:5001,http://embedding-2:5001 \\
+        uvicorn router_app:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import logging
+import traceback
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from config import Config
+from services.admission import DeadlineExceeded, parse_deadline
+from services.priority_scheduler import PRIORITY_HEADER, resolve_priority
+from services.router import EmbeddingRouter, UpstreamError
+from services.serialization import (
+    encode_embeddings, encode_multi_embeddings, negotiate_format, resolve_dtype, resolve_output_format,
+)
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+router: EmbeddingRouter = None
+
+
+async def _health_loop():
+    """定期检查副本就绪状态，恢复的副本重新加入哈希环"""
+    while True:
+        await asyncio.sleep(Config.ROUTER_HEALTH_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(router.check_health)
+        except Exception as e:
+            logger.error(f"Replica health check failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global router
+
+    logger.info("=" * 60)
+    logger.info("TasteInsight Embedding Router")
+    logger.info("=" * 60)
+    logger.info(f"Replicas: {Config.ROUTER_REPLICAS}")
+
+    router = EmbeddingRouter(
+        Config.ROUTER_REPLICAS,
+        vnodes=Config.ROUTER_VNODES,
+        timeout=Config.ROUTER_TIMEOUT_SECONDS,
+        max_connections=Config.ROUTER_MAX_CONNECTIONS,
+    )
+    await run_in_threadpool(router.check_health)
+    health_task = asyncio.ensure_future(_health_loop())
+    yield
+    health_task.cancel()
+    router.shutdown()
+
+
+def _upstream_response(error: UpstreamError) -> Response:
+    return Response(error.body, status_code=error.status, media_type=error.content_type, headers=error.headers)
+
+
+def _deadline_exceeded_response() -> JSONResponse:
+    return JSONResponse({'error': 'Deadline exceeded'}, status_code=504)
+
+
+async def _read_json(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def _fan_out(request: Request, path: str) -> Response:
+    """/embed_batch、/embed_features 与 /embed_multi：按文本拆分到各副本"""
+    try:
+        deadline = parse_deadline(request.headers)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    data = await _read_json(request)
+    if not data or 'items' not in data:
+        return JSONResponse({'error': 'Missing required field: items'}, status_code=400)
+
+    items = data['items']
+    if not isinstance(items, list) or not items:
+        return JSONResponse({'error': 'items must be a non-empty list'}, status_code=400)
+    if len(items) > Config.MAX_BATCH_ITEMS:
+        return JSONResponse({
+            'error': f'Too many items: {len(items)}',
+            'max_batch_items': Config.MAX_BATCH_ITEMS,
+        }, status_code=413)
+
+    fmt = negotiate_format(parse_accept_header(request.headers.get('accept'), MIMEAccept))
+    try:
+        priority = resolve_priority(
+            request.headers.get(PRIORITY_HEADER) or data.get('priority'),
+            len(items),
+            Config.PRIORITY_BULK_THRESHOLD,
+        )
+        dtype = resolve_dtype(request.headers)
+        # 逐向量量化与分片无关：副本返回 float32，合并后由路由统一转换
+        output_format = resolve_output_format(data.get('output_format'), fmt, batch=True) \
+            if path == '/embed_batch' else 'float32'
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    body = {key: value for key, value in data.items() if key not in ('items', 'priority', 'output_format')}
+    try:
+        embeddings, metadata = await run_in_threadpool(
+            router.fan_out, path, items, body, request.headers, priority, deadline,
+        )
+    except UpstreamError as e:
+        return _upstream_response(e)
+    except DeadlineExceeded:
+        return _deadline_exceeded_response()
+
+    if isinstance(embeddings, dict):
+        content, mimetype, headers = encode_multi_embeddings(embeddings, metadata, fmt=fmt, dtype=dtype)
+    else:
+        content, mimetype, headers = encode_embeddings(embeddings, 'embeddings', metadata, fmt=fmt, dtype=dtype,
+                                                       output_format=output_format)
+    return Response(content, media_type=mimetype, headers=headers)
+
+
+async def _forward(request: Request, key_field: str = None) -> Response:
+    """整体转发给一个副本：有路由键时发往所属副本，否则轮询"""
+    try:
+        deadline = parse_deadline(request.headers)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    body = await request.body() if request.method == 'POST' else None
+    key = None
+    if key_field is not None:
+        data = await _read_json(request)
+        if isinstance(data, dict) and isinstance(data.get(key_field), str):
+            key = data[key_field]
+
+    try:
+        status, headers, content = await run_in_threadpool(
+            router.forward, request.method, request.url.path, body, request.headers, key, deadline,
+        )
+    except UpstreamError as e:
+        return _upstream_response(e)
+    except DeadlineExceeded:
+        return _deadline_exceeded_response()
+
+    passthrough = {k: v for k, v in headers.items() if k.startswith('x-embedding-') or k == 'retry-after'}
+    return Response(content, status_code=status, media_type=headers.get('content-type'), headers=passthrough)
+
+
+async def embed_batch(request: Request) -> Response:
+    """批量生成嵌入，请求/响应格式同 app.py 的 /embed_batch，另附 shards（拆分的副本数）"""
+    try:
+        return await _fan_out(request, '/embed_batch')
+    except Exception as e:
+        logger.error(f"Routed batch failed: {e}\n{traceback.format_exc()}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def embed_features(request: Request) -> Response:
+    """只更新数值特征，请求/响应格式同 app.py 的 /embed_features（带 text 的条目按文本路由）"""
+    try:
+        return await _fan_out(request, '/embed_features')
+    except Exception as e:
+        logger.error(f"Routed feature refresh failed: {e}\n{traceback.format_exc()}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def embed_multi(request: Request) -> Response:
+    """同时生成多个版本的嵌入，请求/响应格式同 app.py 的 /embed_multi"""
+    try:
+        return await _fan_out(request, '/embed_multi')
+    except Exception as e:
+        logger.error(f"Routed multi-version embedding failed: {e}\n{traceback.format_exc()}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def embed_single(request: Request) -> Response:
+    """生成单个嵌入，发往文本所属的副本"""
+    return await _forward(request, key_field='text')
+
+
+async def convert_version(request: Request) -> Response:
+    """转换嵌入版本，发往文本所属的副本"""
+    return await _forward(request, key_field='text')
+
+
+async def passthrough(request: Request) -> Response:
+    """不涉及文本编码的接口，在健康副本间轮询"""
+    return await _forward(request)
+
+
+async def health_check(request: Request) -> JSONResponse:
+    """路由健康检查：至少一个副本就绪时为 healthy"""
+    ready = router is not None and router.is_ready()
+    return JSONResponse({
+        'status': 'healthy' if ready else 'unavailable',
+        'router': router.get_stats() if router is not None else None,
+    }, status_code=200 if ready else 503)
+
+
+async def liveness_probe(request: Request) -> JSONResponse:
+    """存活探针"""
+    return JSONResponse({'status': 'alive'})
+
+
+async def readiness_probe(request: Request) -> JSONResponse:
+    """就绪探针：至少一个副本就绪"""
+    if router is None or not router.is_ready():
+        return JSONResponse({'status': 'no_replica'}, status_code=503)
+    return JSONResponse({'status': 'ready', 'replicas': len(router.ring)})
+
+
+routes = [
+    Route('/health', health_check, methods=['GET']),
+    Route('/health/live', liveness_probe, methods=['GET']),
+    Route('/health/ready', readiness_probe, methods=['GET']),
+    Route('/embed', embed_single, methods=['POST']),
+    Route('/embed_batch', embed_batch, methods=['POST']),
+    Route('/embed_features', embed_features, methods=['POST']),
+    Route('/embed_multi', embed_multi, methods=['POST']),
+    Route('/convert_version', convert_version, methods=['POST']),
+    Route('/check_stale', passthrough, methods=['POST']),
+    Route('/models', passthrough, methods=['GET']),
+    Route('/models/status', passthrough, methods=['GET']),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host=Config.HOST, port=Config.PORT)
@@ -0,0 +1,500 @@
+"""
+TasteInsight 嵌入服务 - 二进制 RPC 入口
+
+与 HTTP 服务并行部署，供同机（同 Pod）的 NestJS 后端调用：
+- 传输：Unix socket（默认）或本机 TCP
+- 协议：长度前缀 + msgpack，嵌入向量以 float32 原始字节传输，见 services/rpc_protocol.py
+- 方法：embed_batch（同 /embed_batch）、embed_features（同 /embed_features）、embed_multi（同 /embed_multi）、
+  check_stale（同 /check_stale）、models（同 /models）、health
+
+推理同样经过准入控制、优先级调度和过载降级。
+
+启动：
+    python rpc_server.py
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import time
+import traceback
+
+from config import Config
+from services import EmbeddingService, AdmissionController, DeadlineExceeded, metrics
+from services.admission import parse_finite
+from services.degradation import STEP_TEXT_FALLBACK, DegradationPlan, DegradationPolicy, parse_policy, resolve_mode
+from services.inference_executor import InferenceExecutor
+from services.priority_scheduler import PRIORITY_INTERACTIVE, resolve_priority
+from services.rpc_protocol import (
+    METHOD_CHECK_STALE, METHOD_EMBED_BATCH, METHOD_EMBED_FEATURES, METHOD_EMBED_MULTI, METHOD_HEALTH, METHOD_MODELS, RPCError,
+    decode_payload, decode_tensor, encode_frame, encode_tensor, read_frame,
+)
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+embedding_service: EmbeddingService = None
+executor = InferenceExecutor(max_workers=Config.INFERENCE_WORKERS)
+admission = AdmissionController(
+    max_in_flight=Config.MAX_IN_FLIGHT,
+    retry_after=Config.RETRY_AFTER_SECONDS,
+)
+degradation = DegradationPolicy(
+    parse_policy(Config.DEGRADATION_POLICY),
+    enabled=Config.DEGRADATION_ENABLED,
+    truncate_chars=Config.DEGRADATION_TRUNCATE_CHARS,
+)
+
+
+def init_service() -> EmbeddingService:
+    """初始化嵌入服务（阻塞，在推理线程池中执行）"""
+    global embedding_service
+
+    logger.info("=" * 60)
+    logger.info("TasteInsight Embedding Service (RPC)")
+    logger.info("=" * 60)
+    logger.info(f"Configuration: {Config.get_info()}")
+
+    service = EmbeddingService(
+        text_model_name=Config.TEXT_MODEL,
+        device=Config.DEVICE,
+        model_dir=Config.MODEL_DIR,
+        default_version=Config.DEFAULT_VERSION,
+        micro_batch_enabled=False,
+        inference_concurrency=Config.INFERENCE_CONCURRENCY,
+        bulk_chunk_size=Config.BULK_CHUNK_SIZE,
+        text_cache_mb=Config.TEXT_CACHE_MB,
+        text_store_dir=Config.TEXT_STORE_DIR or None,
+        text_store_max_mb=Config.TEXT_STORE_MAX_MB,
+        text_precision=Config.TEXT_PRECISION,
+        text_backend=Config.TEXT_BACKEND,
+        onnx_dir=Config.ONNX_DIR,
+        onnx_threads=Config.ONNX_THREADS,
+        text_student_dir=Config.TEXT_STUDENT_DIR or None,
+        text_fast_layers=Config.TEXT_FAST_LAYERS,
+        text_fallback_engine=Config.DEGRADATION_TEXT_ENGINE if Config.DEGRADATION_ENABLED else '',
+        model_precision=Config.MODEL_PRECISION,
+        pca_dims=Config.PCA_DIMS,
+    )
+
+    if Config.PRELOAD_MODELS:
+        logger.info(f"Preloading models: {Config.PRELOAD_MODELS}")
+        service.preload_models(Config.PRELOAD_MODELS)
+        service.warmup()
+
+    embedding_service = service
+
+    logger.info("=" * 60)
+    logger.info("Service ready!")
+    logger.info("=" * 60)
+    return service
+
+
+def _deadline(params: dict):
+    """timeout_ms 参数对应的 time.monotonic() 截止时间，未指定时为 None"""
+    if params.get('timeout_ms') is None:
+        return None
+    try:
+        return time.monotonic() + parse_finite(params['timeout_ms'], 'timeout_ms') / 1000.0
+    except ValueError as e:
+        raise RPCError(400, str(e))
+
+
+def _require_service():
+    if embedding_service is None:
+        raise RPCError(503, 'Service is still initializing')
+
+
+async def embed_batch(params: dict) -> dict:
+    """
+    批量生成嵌入
+
+    参数：
+        texts: 文本列表
+        features: 特征字典列表（可选，默认全部为空）
+        version: 模型版本（可选）
+        priority: interactive / bulk（可选，未指定时按条数判断）
+        timeout_ms: 相对超时（可选）
+        degrade: off / auto / any（可选，同 X-Embedding-Degrade 头）
+
+    返回：
+        {"embeddings": <float32 bytes>, "shape": [N, dim], "dtype": "float32",
+         "version": "v3", "degradation": "none", "fingerprints": [...]}
+    """
+    _require_service()
+
+    texts = params.get('texts')
+    if not isinstance(texts, list) or not texts:
+        raise RPCError(400, 'texts must be a non-empty list')
+    if len(texts) > Config.MAX_BATCH_ITEMS:
+        metrics.record_rejected('too_large')
+        raise RPCError(413, f'Too many items: {len(texts)}', max_batch_items=Config.MAX_BATCH_ITEMS)
+
+    features_list = params.get('features') or [{}] * len(texts)
+    if len(features_list) != len(texts):
+        raise RPCError(400, 'texts and features must have same length')
+
+    version = params.get('version')
+    if version and not embedding_service.validate_version(version):
+        raise RPCError(400, f'Invalid version: {version}',
+                       supported_versions=embedding_service.model_manager.get_supported_versions())
+
+    try:
+        priority = resolve_priority(params.get('priority'), len(texts), Config.PRIORITY_BULK_THRESHOLD)
+        mode = resolve_mode(params.get('degrade'))
+    except ValueError as e:
+        raise RPCError(400, str(e))
+
+    deadline = _deadline(params)
+
+    used_version = version or embedding_service.model_manager.default_version
+    if priority == PRIORITY_INTERACTIVE:
+        queue_delay_ms = max(embedding_service.queue_delay_ms(), executor.queue_delay_ms())
+        plan = degradation.plan(queue_delay_ms, used_version, mode,
+                                text_fallback=embedding_service.fallback_text_encoder is not None)
+        texts = plan.apply_texts(texts)
+    else:
+        plan = DegradationPlan(version=used_version)
+
+    if plan.text_fallback:
+        # 降级请求不等待推理槽位
+        work = executor.run_fallback(
+            embedding_service.generate_embeddings_fallback, texts, features_list, plan.version, deadline,
+        )
+    else:
+        work = executor.run(
+            functools.partial(embedding_service.generate_embeddings_batch, priority=priority),
+            texts, features_list, plan.version, deadline,
+            priority=priority,
+        )
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        embeddings = await asyncio.wait_for(work, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded()
+    if plan.text_fallback:
+        embeddings, fallback = embeddings
+        if fallback:
+            plan.mark_applied(STEP_TEXT_FALLBACK)
+
+    data, shape = encode_tensor(embeddings)
+    return {
+        'embeddings': data,
+        'shape': shape,
+        'dtype': 'float32',
+        'version': plan.version,
+        'degradation': plan.label,
+        'fingerprints': embedding_service.fingerprints(texts, features_list, plan.version,
+                                                       plan.text_fallback_applied),
+    }
+
+
+async def embed_features(params: dict) -> dict:
+    """
+    只更新数值特征的批量刷新（文本未变化，跳过文本编码器）
+
+    参数：
+        features: 特征字典列表
+        text_embeddings: 之前计算的文本向量，float32 原始字节（可选，与 texts 至少提供一个）
+        shape: text_embeddings 的形状 [N, text_dim]
+        texts: 文本列表（可选，元素可为 None），从文本缓存 / 持久化存储取向量
+        version / priority / timeout_ms: 同 embed_batch
+
+    返回：
+        {"embeddings": <float32 bytes>, "shape": [N, dim], "dtype": "float32",
+         "version": "v3", "text_encoded": 0, "fingerprints": [...]}
+    """
+    _require_service()
+
+    features_list = params.get('features')
+    if not isinstance(features_list, list) or not features_list:
+        raise RPCError(400, 'features must be a non-empty list')
+    if len(features_list) > Config.MAX_BATCH_ITEMS:
+        metrics.record_rejected('too_large')
+        raise RPCError(413, f'Too many items: {len(features_list)}', max_batch_items=Config.MAX_BATCH_ITEMS)
+
+    text_embeddings = None
+    if params.get('text_embeddings') is not None:
+        try:
+            text_embeddings = decode_tensor(params['text_embeddings'], params.get('shape'))
+        except (TypeError, ValueError) as e:
+            raise RPCError(400, f'Invalid text_embeddings: {e}')
+
+    version = params.get('version')
+    if version and not embedding_service.validate_version(version):
+        raise RPCError(400, f'Invalid version: {version}',
+                       supported_versions=embedding_service.model_manager.get_supported_versions())
+    used_version = version or embedding_service.model_manager.default_version
+
+    try:
+        priority = resolve_priority(params.get('priority'), len(features_list), Config.PRIORITY_BULK_THRESHOLD)
+    except ValueError as e:
+        raise RPCError(400, str(e))
+
+    deadline = _deadline(params)
+
+    texts = params.get('texts')
+    work = executor.run(
+        functools.partial(embedding_service.refresh_features, priority=priority),
+        features_list, text_embeddings, texts, used_version, deadline,
+        priority=priority,
+    )
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        embeddings, text_encoded = await asyncio.wait_for(work, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded()
+
+    data, shape = encode_tensor(embeddings)
+    return {
+        'embeddings': data,
+        'shape': shape,
+        'dtype': 'float32',
+        'version': used_version,
+        'text_encoded': text_encoded,
+        'fingerprints': embedding_service.fingerprints(texts or [None] * len(features_list),
+                                                       features_list, used_version),
+    }
+
+
+async def embed_multi(params: dict) -> dict:
+    """
+    同一批输入同时生成多个版本的嵌入（文本编码和数值编码只做一次）
+
+    参数：
+        texts: 文本列表
+        features: 特征字典列表（可选）
+        versions: 模型版本列表
+        priority / timeout_ms: 同 embed_batch
+
+    返回：
+        {"embeddings": {"v2": <float32 bytes>, ...}, "shapes": {"v2": [N, dim], ...}, "dtype": "float32",
+         "versions": ["v2", "v3"], "fingerprints": {"v2": [...], ...}}
+    """
+    _require_service()
+
+    texts = params.get('texts')
+    if not isinstance(texts, list) or not texts:
+        raise RPCError(400, 'texts must be a non-empty list')
+    if len(texts) > Config.MAX_BATCH_ITEMS:
+        metrics.record_rejected('too_large')
+        raise RPCError(413, f'Too many items: {len(texts)}', max_batch_items=Config.MAX_BATCH_ITEMS)
+
+    features_list = params.get('features') or [{}] * len(texts)
+    if len(features_list) != len(texts):
+        raise RPCError(400, 'texts and features must have same length')
+
+    versions = params.get('versions')
+    if not isinstance(versions, list) or not versions:
+        raise RPCError(400, 'versions must be a non-empty list')
+    versions = list(dict.fromkeys(versions))
+    for version in versions:
+        if not isinstance(version, str) or not embedding_service.validate_version(version):
+            raise RPCError(400, f'Invalid version: {version}',
+                           supported_versions=embedding_service.model_manager.get_supported_versions())
+
+    try:
+        priority = resolve_priority(params.get('priority'), len(texts), Config.PRIORITY_BULK_THRESHOLD)
+    except ValueError as e:
+        raise RPCError(400, str(e))
+
+    deadline = _deadline(params)
+
+    work = executor.run(
+        functools.partial(embedding_service.generate_embeddings_multi, priority=priority),
+        texts, features_list, versions, deadline,
+        priority=priority,
+    )
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        embeddings = await asyncio.wait_for(work, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded()
+
+    tensors = {version: encode_tensor(array) for version, array in embeddings.items()}
+    return {
+        'embeddings': {version: data for version, (data, _) in tensors.items()},
+        'shapes': {version: shape for version, (_, shape) in tensors.items()},
+        'dtype': 'float32',
+        'versions': versions,
+        'fingerprints': embedding_service.fingerprints_multi(texts, features_list, versions),
+    }
+
+
+async def check_stale(params: dict) -> dict:
+    """
+    批量判断哪些条目需要重新计算嵌入（不做推理）
+
+    参数：
+        ids: 条目 ID 列表
+        fingerprints: 上次嵌入返回的指纹列表（没有旧嵌入的条目为 None）
+        texts: 当前文本列表
+        features: 当前特征字典列表
+        version: 模型版本（可选）
+
+    返回：
+        {"stale": [...], "checked": N, "version": "v3"}
+    """
+    _require_service()
+
+    ids = params.get('ids')
+    if not isinstance(ids, list):
+        raise RPCError(400, 'ids must be a list')
+    if len(ids) > Config.MAX_CHECK_ITEMS:
+        metrics.record_rejected('too_large')
+        raise RPCError(413, f'Too many items: {len(ids)}', max_check_items=Config.MAX_CHECK_ITEMS)
+
+    version = params.get('version')
+    if version and not embedding_service.validate_version(version):
+        raise RPCError(400, f'Invalid version: {version}',
+                       supported_versions=embedding_service.model_manager.get_supported_versions())
+    used_version = version or embedding_service.model_manager.default_version
+
+    # 不做推理，不经过推理线程池
+    stale = await asyncio.get_running_loop().run_in_executor(
+        None, embedding_service.stale_ids,
+        ids, params.get('fingerprints') or [], params.get('texts') or [], params.get('features') or [],
+        used_version,
+    )
+    return {'stale': stale, 'checked': len(ids), 'version': used_version}
+
+
+async def list_models(params: dict) -> dict:
+    """列出所有支持的模型版本，同 /models"""
+    _require_service()
+    info = embedding_service.get_service_info()
+    return {
+        'default_version': info['default_version'],
+        'supported_versions': info['supported_versions'],
+        'models': info['models'],
+    }
+
+
+async def health_check(params: dict) -> dict:
+    """健康检查"""
+    _require_service()
+    return {
+        'status': 'healthy',
+        'ready': embedding_service.is_ready(),
+        'executor': executor.get_stats(),
+        'admission': admission.get_stats(),
+        'degradation': degradation.get_stats(),
+    }
+
+
+# 需要占用在途名额的方法
+_INFERENCE_METHODS = {METHOD_EMBED_BATCH, METHOD_EMBED_FEATURES, METHOD_EMBED_MULTI}
+
+HANDLERS = {
+    METHOD_EMBED_BATCH: embed_batch,
+    METHOD_EMBED_FEATURES: embed_features,
+    METHOD_EMBED_MULTI: embed_multi,
+    METHOD_CHECK_STALE: check_stale,
+    METHOD_MODELS: list_models,
+    METHOD_HEALTH: health_check,
+}
+
+
+async def dispatch(payload: dict) -> dict:
+    """执行一个请求，返回响应消息（不抛出异常）"""
+    request_id = payload.get('id')
+    method = payload.get('method')
+    params = payload.get('params') or {}
+
+    handler = HANDLERS.get(method)
+    if handler is None:
+        return {'id': request_id, 'error': {'code': 400, 'message': f'Unknown method: {method}'}}
+
+    admitted = False
+    try:
+        if method in _INFERENCE_METHODS:
+            if not admission.try_acquire():
+                raise RPCError(429, 'Service overloaded, please retry later', retry_after=admission.retry_after)
+            admitted = True
+        return {'id': request_id, 'result': await handler(params)}
+    except RPCError as e:
+        return {'id': request_id, 'error': e.to_dict()}
+    except DeadlineExceeded as e:
+        admission.record_expired()
+        return {'id': request_id, 'error': {'code': 504, 'message': str(e)}}
+    except ValueError as e:
+        return {'id': request_id, 'error': {'code': 400, 'message': str(e)}}
+    except Exception as e:
+        logger.error(f"RPC {method} failed: {e}\n{traceback.format_exc()}")
+        return {'id': request_id, 'error': {'code': 500, 'message': str(e)}}
+    finally:
+        if admitted:
+            admission.release()
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """处理一个连接：逐帧读取请求，每个请求单独执行，响应按完成顺序写回"""
+    write_lock = asyncio.Lock()
+    tasks = set()
+
+    async def respond(payload: dict):
+        response = await dispatch(payload)
+        async with write_lock:
+            writer.write(encode_frame(response))
+            await writer.drain()
+
+    try:
+        while True:
+            try:
+                body = await read_frame(reader, Config.MAX_BODY_BYTES)
+                payload = decode_payload(body)
+            except asyncio.IncompleteReadError:
+                break
+            except RPCError as e:
+                # 帧边界已不可信，回复错误后关闭连接
+                async with write_lock:
+                    writer.write(encode_frame({'id': None, 'error': e.to_dict()}))
+                    await writer.drain()
+                break
+            except Exception as e:
+                async with write_lock:
+                    writer.write(encode_frame({'id': None, 'error': {'code': 400, 'message': f'Invalid frame: {e}'}}))
+                    await writer.drain()
+                continue
+
+            task = asyncio.ensure_future(respond(payload))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except ConnectionError:
+        pass
+    finally:
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        writer.close()
+
+
+async def serve(socket_path: str = None, host: str = None, port: int = None):
+    """启动 RPC 服务（Unix socket 优先）"""
+    init_task = asyncio.ensure_future(executor.run(init_service))
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = await asyncio.start_unix_server(handle_connection, path=socket_path)
+        logger.info(f"RPC server listening on unix:{socket_path}")
+    else:
+        server = await asyncio.start_server(handle_connection, host=host, port=port)
+        logger.info(f"RPC server listening on {host}:{port}")
+
+    try:
+        async with server:
+            await init_task
+            await server.serve_forever()
+    finally:
+        executor.shutdown()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == '__main__':
+    asyncio.run(serve(Config.RPC_SOCKET, Config.RPC_HOST, Config.RPC_PORT))
@@ -1,5 +1,23 @@
-from .model_manager import ModelManager
+from .model_manager import ModelManager, ModelUnavailable
 from .embedding_service import EmbeddingService
+from .micro_batcher import MicroBatcher
+from .admission import AdmissionController, Overloaded, DeadlineExceeded
+from .priority_scheduler import PriorityScheduler
+from .text_cache import TextEmbeddingCache
+from .text_store import TextEmbeddingStore
+from .degradation import DegradationPolicy
 
-__all__ = ['ModelManager', 'EmbeddingService']
+__all__ = [
+    'ModelManager',
+    'ModelUnavailable',
+    'EmbeddingService',
+    'MicroBatcher',
+    'AdmissionController',
+    'Overloaded',
+    'DeadlineExceeded',
+    'PriorityScheduler',
+    'TextEmbeddingCache',
+    'TextEmbeddingStore',
+    'DegradationPolicy',
+]
 
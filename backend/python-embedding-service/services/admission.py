@@ -0,0 +1,181 @@
+"""
+准入控制 - 限制在途请求数、请求截止时间与过载降载
+"""
+
+import math
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# 截止时间请求头
+# - X-Request-Deadline: 绝对截止时间（Unix 时间戳，秒，可带小数）
+# - X-Request-Timeout-Ms: 相对超时（毫秒，从服务收到请求时开始计算）
+DEADLINE_HEADER = 'X-Request-Deadline'
+TIMEOUT_HEADER = 'X-Request-Timeout-Ms'
+
+
+class Overloaded(Exception):
+    """在途请求已满，请求被拒绝（HTTP 429）"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Service overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """请求截止时间已过，工作被丢弃（HTTP 504）"""
+
+    def __init__(self, message: str = 'Request deadline exceeded'):
+        super().__init__(message)
+
+
+def parse_deadline(headers) -> Optional[float]:
+    """
+    从请求头解析截止时间
+
+    Args:
+        headers: 请求头（大小写不敏感的映射）
+
+    Returns:
+        time.monotonic() 时间轴上的截止时间，未指定时返回 None
+
+    Raises:
+        ValueError: 请求头格式错误
+    """
+    now = time.monotonic()
+
+    timeout_ms = headers.get(TIMEOUT_HEADER)
+    if timeout_ms:
+        return now + parse_finite(timeout_ms, TIMEOUT_HEADER) / 1000.0
+
+    deadline = headers.get(DEADLINE_HEADER)
+    if deadline:
+        return now + (parse_finite(deadline, DEADLINE_HEADER) - time.time())
+
+    return None
+
+
+def parse_finite(value, name: str) -> float:
+    """
+    解析有限的浮点数（nan / inf 会让截止时间比较永远不成立或立即成立）
+
+    Raises:
+        ValueError: 不是有限数值
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: {value}")
+    if not math.isfinite(number):
+        raise ValueError(f"Invalid {name}: {value}")
+    return number
+
+
+def check_deadline(deadline: Optional[float]):
+    """截止时间已过时抛出 DeadlineExceeded"""
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded()
+
+
+# 线程部署中不计入在途名额的线程：用于返回 429 和响应健康检查
+RESERVED_THREADS = 2
+
+
+def admission_limit(max_in_flight: int, worker_threads: int) -> int:
+    """
+    线程部署（gunicorn gthread）下的有效在途上限
+
+    每个在途请求占用一个 worker 线程。上限不小于线程数时名额永远不会用完：超出的请求在 gunicorn
+    的连接队列中无限等待而不是收到 429。因此上限最多为线程数减去 RESERVED_THREADS。
+
+    Args:
+        max_in_flight: 配置的在途上限，<= 0 表示不限制（准入控制关闭，保持不变）
+        worker_threads: 每个进程的线程数，<= 0 表示线程不受限（如开发服务器）
+    """
+    limit = max(1, worker_threads - RESERVED_THREADS)
+    if max_in_flight <= 0 or worker_threads <= 0 or max_in_flight <= limit:
+        return max_in_flight
+    logger.warning(f"max_in_flight={max_in_flight} would never reject with {worker_threads} worker threads, "
+                   f"using {limit}")
+    return limit
+
+
+class AdmissionController:
+    """
+    准入控制器
+
+    - 在途请求数达到 max_in_flight 时直接拒绝（429 + Retry-After），
+      避免请求无限排队导致延迟失控、worker 被 gunicorn 超时杀死
+    - 统计拒绝和超时丢弃次数
+    """
+
+    def __init__(self, max_in_flight: int = 32, retry_after: int = 1):
+        """
+        初始化准入控制器
+
+        Args:
+            max_in_flight: 每个进程允许的最大在途请求数，<= 0 表示不限制
+            retry_after: 拒绝时建议客户端的重试间隔（秒）
+        """
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._expired = 0
+
+    def try_acquire(self) -> bool:
+        """尝试占用一个在途名额"""
+        with self._lock:
+            if 0 < self.max_in_flight <= self._in_flight:
+                self._rejected += 1
+                metrics.record_rejected('overloaded')
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        """释放在途名额"""
+        with self._lock:
+            self._in_flight -= 1
+
+    @contextmanager
+    def admit(self):
+        """
+        在途名额上下文
+
+        Raises:
+            Overloaded: 在途请求已满
+        """
+        if not self.try_acquire():
+            raise Overloaded(self.retry_after)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record_expired(self):
+        """记录一次因截止时间已过而丢弃的请求"""
+        with self._lock:
+            self._expired += 1
+        metrics.record_rejected('deadline')
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def get_stats(self) -> Dict:
+        """获取准入统计"""
+        return {
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self._in_flight,
+            'rejected': self._rejected,
+            'expired': self._expired,
+        }
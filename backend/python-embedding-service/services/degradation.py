@@ -0,0 +1,244 @@
+"""
+过载降级 - 排队延迟超过阈值时用质量稍低但更快的路径处理交互请求
+"""
+
+import threading
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# 降级步骤（按代价从低到高）
+# - truncate: 截断长文本后再编码，只对超过 truncate_chars 的文本生效。菜名远短于默认的 128 字符，
+#   mpnet 本身也在 128 token 处截断，对常见请求几乎不省时间，默认策略不启用
+# - text_fallback: 缓存和持久化存储都未命中的文本改用备用文本编码器（int8 / 快速模式 / 学生模型），
+#   不经过微批和调度器排队；向量空间不变但有少量误差，响应指纹按备用编码器标识，之后会被判为过期重算
+# - version_fallback: v3 请求改用 v2（ConcatModel 无需融合网络），向量空间和维度会变化
+STEP_TRUNCATE = 'truncate'
+STEP_TEXT_FALLBACK = 'text_fallback'
+STEP_VERSION_FALLBACK = 'version_fallback'
+STEPS = (STEP_TRUNCATE, STEP_TEXT_FALLBACK, STEP_VERSION_FALLBACK)
+
+# 早期的 cache 步骤：文本嵌入缓存现已对所有请求常开，策略中出现时忽略
+_LEGACY_STEP_CACHE = 'cache'
+
+# 请求头：客户端可接受的降级程度
+# - off: 不降级
+# - auto（默认）: 只允许不改变向量空间的步骤（truncate、text_fallback）
+# - any: 允许所有步骤，包括 version_fallback
+DEGRADE_HEADER = 'X-Embedding-Degrade'
+MODE_OFF = 'off'
+MODE_AUTO = 'auto'
+MODE_ANY = 'any'
+MODES = (MODE_OFF, MODE_AUTO, MODE_ANY)
+
+# 未降级时响应中 degradation 字段的取值
+NOT_DEGRADED = 'none'
+
+
+def parse_policy(spec: str) -> List[Tuple[str, float]]:
+    """
+    解析降级策略
+
+    Args:
+        spec: 形如 "version_fallback:1000" 或 "text_fallback:250,version_fallback:1000" 的字符串，
+            每项为 步骤:排队延迟阈值（毫秒）
+
+    Returns:
+        [(步骤, 阈值毫秒)]，按阈值升序
+
+    Raises:
+        ValueError: 未知步骤或阈值格式错误
+    """
+    steps = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, threshold = part.partition(':')
+        name = name.strip()
+        if name == _LEGACY_STEP_CACHE:
+            logger.warning("Degradation step 'cache' is obsolete (text cache is always enabled), ignoring")
+            continue
+        if name not in STEPS:
+            raise ValueError(f"Unknown degradation step: {name}. Available: {list(STEPS)}")
+        try:
+            steps.append((name, float(threshold) if threshold else 0.0))
+        except ValueError:
+            raise ValueError(f"Invalid threshold for degradation step {name}: {threshold}")
+    return sorted(steps, key=lambda step: step[1])
+
+
+def resolve_mode(value: Optional[str]) -> str:
+    """
+    解析客户端的降级请求头
+
+    Raises:
+        ValueError: 未知取值
+    """
+    if not value:
+        return MODE_AUTO
+    value = value.lower()
+    if value not in MODES:
+        raise ValueError(f"Invalid {DEGRADE_HEADER}: {value}. Available: {list(MODES)}")
+    return value
+
+
+class DegradationPlan:
+    """
+    单个请求的降级方案
+
+    steps 为按排队延迟启用的步骤，applied 为实际生效的步骤：truncate 只在确有文本被截断时生效，
+    text_fallback 只在确有文本由备用编码器编码时生效。响应中的 degradation 字段与统计都只反映实际生效的步骤。
+    """
+
+    __slots__ = ('steps', 'applied', 'version', 'truncate_chars', '_policy')
+
+    def __init__(self,
+                 steps: Sequence[str] = (),
+                 version: Optional[str] = None,
+                 truncate_chars: int = 0,
+                 policy: 'DegradationPolicy' = None):
+        self.steps = tuple(steps)
+        self.applied: List[str] = []
+        self.version = version
+        self.truncate_chars = truncate_chars
+        self._policy = policy
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.applied)
+
+    @property
+    def text_fallback(self) -> bool:
+        """是否走备用文本编码器路径（见 EmbeddingService.generate_embeddings_fallback）"""
+        return STEP_TEXT_FALLBACK in self.steps
+
+    @property
+    def text_fallback_applied(self) -> bool:
+        """是否确有文本由备用编码器编码（指纹按备用编码器计算）"""
+        return STEP_TEXT_FALLBACK in self.applied
+
+    @property
+    def label(self) -> str:
+        """响应中的 degradation 字段"""
+        applied = [name for name in self.steps if name in self.applied]
+        return ','.join(applied) if applied else NOT_DEGRADED
+
+    def mark_applied(self, name: str):
+        """记录一个生效的步骤（每个请求每个步骤只计一次）"""
+        if name in self.applied:
+            return
+        first = not self.applied
+        self.applied.append(name)
+        if self._policy is not None:
+            self._policy.record(name, first)
+
+    def apply_text(self, text: str) -> str:
+        if STEP_TRUNCATE in self.steps and text and len(text) > self.truncate_chars:
+            self.mark_applied(STEP_TRUNCATE)
+            return text[:self.truncate_chars]
+        return text
+
+    def apply_texts(self, texts: List[str]) -> List[str]:
+        if STEP_TRUNCATE not in self.steps:
+            return texts
+        return [self.apply_text(text) for text in texts]
+
+
+class DegradationPolicy:
+    """
+    降级策略
+
+    请求进入时根据当前排队延迟选择降级步骤：延迟超过某一步骤的阈值时启用该步骤，
+    阈值越高的步骤质量损失越大。只用于交互请求，批量刷新写入存储的向量不降级。
+    """
+
+    def __init__(self,
+                 steps: List[Tuple[str, float]],
+                 enabled: bool = True,
+                 truncate_chars: int = 128,
+                 fallback_versions: Dict[str, str] = None):
+        """
+        初始化降级策略
+
+        Args:
+            steps: [(步骤, 阈值毫秒)]，见 parse_policy
+            enabled: 是否启用降级
+            truncate_chars: truncate 步骤保留的字符数
+            fallback_versions: version_fallback 步骤的版本映射，默认 {'v3': 'v2'}
+        """
+        self.steps = list(steps)
+        self.enabled = enabled
+        self.truncate_chars = max(1, truncate_chars)
+        self.fallback_versions = fallback_versions if fallback_versions is not None else {'v3': 'v2'}
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._degraded = 0
+        self._fired: Dict[str, int] = {name: 0 for name, _ in self.steps}
+
+    def plan(self, queue_delay_ms: float, version: Optional[str], mode: str = MODE_AUTO,
+             text_fallback: bool = False) -> DegradationPlan:
+        """
+        为一个请求选择降级方案并计入统计
+
+        Args:
+            queue_delay_ms: 当前排队延迟（毫秒）
+            version: 请求的模型版本（已解析默认值）
+            mode: 客户端允许的降级程度，见 resolve_mode
+            text_fallback: 服务是否有可用的备用文本编码器（没有时跳过 text_fallback 步骤）
+
+        Returns:
+            DegradationPlan，version 为实际使用的版本
+        """
+        steps = []
+        if self.enabled and mode != MODE_OFF:
+            for name, threshold in self.steps:
+                if queue_delay_ms < threshold:
+                    break
+                if name == STEP_TEXT_FALLBACK and not text_fallback:
+                    continue
+                if name == STEP_VERSION_FALLBACK:
+                    if mode != MODE_ANY or version not in self.fallback_versions:
+                        continue
+                    version = self.fallback_versions[version]
+                steps.append(name)
+
+        with self._lock:
+            self._requests += 1
+
+        if steps:
+            logger.debug(f"Degrading request (queue delay: {queue_delay_ms:.1f}ms, steps: {steps})")
+
+        plan = DegradationPlan(steps, version, self.truncate_chars, policy=self)
+        if STEP_VERSION_FALLBACK in steps:
+            plan.mark_applied(STEP_VERSION_FALLBACK)
+        return plan
+
+    def record(self, name: str, first: bool):
+        """
+        计入一次生效的降级步骤
+
+        Args:
+            name: 步骤名
+            first: 是否为该请求第一个生效的步骤（计入降级请求数）
+        """
+        with self._lock:
+            if first:
+                self._degraded += 1
+            self._fired[name] = self._fired.get(name, 0) + 1
+        metrics.record_degradation(name)
+
+    def get_stats(self) -> Dict:
+        """获取降级统计"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'policy': {name: threshold for name, threshold in self.steps},
+                'requests': self._requests,
+                'degraded': self._degraded,
+                'fired': dict(self._fired),
+            }
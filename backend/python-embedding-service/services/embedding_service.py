@@ -4,13 +4,30 @@
 
 import numpy as np
 import logging
-from typing import Dict, List, Union
+import time
+import torch
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
 from encoders import TextEncoder, NumericEncoder
+from encoders.backends import BACKEND_TORCH, share_input_embeddings
 from services.model_manager import ModelManager
+from services.micro_batcher import MicroBatcher
+from services.admission import check_deadline
+from services.priority_scheduler import PriorityScheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from services.text_cache import TextEmbeddingCache, dedupe_texts
+from services.text_store import TextEmbeddingStore
+from services.fingerprint import compute_fingerprints, fingerprint_context
+from services.profiling import RequestProfile
+from services import metrics
+from services.metrics import STAGE_TEXT_ENCODE, STAGE_NUMERIC_ENCODE, STAGE_MODEL_FORWARD
 
 logger = logging.getLogger(__name__)
 
 
+def _stage_label(models: Dict) -> str:
+    """多版本共享阶段（文本编码、数值编码）的指标标签，如 v2+v3"""
+    return '+'.join(models)
+
+
 class EmbeddingService:
     """嵌入服务 - 协调文本编码器、数值编码器和模型"""
     
@@ -18,7 +35,24 @@ class EmbeddingService:
                  text_model_name: str = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2',
                  device: str = None,
                  model_dir: str = 'models',
-                 default_version: str = 'v2'):
+                 default_version: str = 'v2',
+                 micro_batch_enabled: bool = False,
+                 micro_batch_max_size: int = 64,
+                 micro_batch_max_wait_ms: float = 0.0,
+                 inference_concurrency: int = 1,
+                 bulk_chunk_size: int = 64,
+                 text_cache_mb: float = 0,
+                 text_store_dir: str = None,
+                 text_store_max_mb: float = 2048,
+                 text_precision: str = 'fp32',
+                 text_backend: str = 'torch',
+                 onnx_dir: str = 'saved_models/onnx',
+                 onnx_threads: int = 0,
+                 text_student_dir: str = None,
+                 text_fast_layers: int = 0,
+                 text_fallback_engine: str = '',
+                 model_precision: str = 'fp32',
+                 pca_dims: List[int] = None):
         """
         初始化嵌入服务
         
@@ -27,17 +61,115 @@ class EmbeddingService:
             device: 计算设备
             model_dir: 模型文件目录
             default_version: 默认版本
+            micro_batch_enabled: 是否合并并发的单条请求
+            micro_batch_max_size: 微批最大条数
+            micro_batch_max_wait_ms: 微批凑批最长等待时间（毫秒）
+            inference_concurrency: 同时推理的任务数（由优先级调度器控制）
+            bulk_chunk_size: 批量刷新请求每块条数，块之间让出推理资源给交互请求
+            text_cache_mb: 文本嵌入缓存内存上限（MB），0 表示禁用
+            text_store_dir: 持久化文本嵌入存储根目录，None 表示禁用
+            text_store_max_mb: 持久化存储向量文件上限（MB）
+            text_precision: 文本编码器推理精度（fp32/bf16/int8）
+            text_backend: 文本编码器推理后端（torch/onnx）
+            onnx_dir: ONNX 导出根目录（onnx 后端）
+            onnx_threads: ONNX Runtime 算子内线程数，0 = 默认
+            text_student_dir: 蒸馏学生文本编码器目录，None 表示使用 text_model_name
+            text_fast_layers: 文本编码快速模式的编码器层数（适配层在 model_dir 中），0 表示完整深度
+            text_fallback_engine: 过载降级 text_fallback 步骤使用的备用文本编码器，见 _load_fallback_text_encoder，
+                空字符串表示不加载
+            model_precision: v3 融合网络推理精度（fp32/bf16/int8）
+            pca_dims: 注册的 v2 降维版本维度（v2-pca{dim}）
         """
-        self.text_encoder = TextEncoder(model_name=text_model_name, device=device)
+        self.text_encoder = TextEncoder(model_name=text_model_name, device=device, precision=text_precision,
+                                        backend=text_backend, onnx_dir=onnx_dir, onnx_threads=onnx_threads,
+                                        student_dir=text_student_dir, fast_layers=text_fast_layers,
+                                        fast_adapter_dir=model_dir)
+        # 推理路径上的张量（文本向量、数值特征、模型输出）都在此设备上，均为 float32
+        # （onnx 后端只支持 CPU，模型也随之放在 CPU 上）
+        self.device = self.text_encoder.device
         self.numeric_encoder = NumericEncoder(dimension=20)
-        self.model_manager = ModelManager(device=device, model_dir=model_dir, default_version=default_version)
+        self.model_manager = ModelManager(device=self.device, model_dir=model_dir, default_version=default_version,
+                                          precision=model_precision, pca_dims=pca_dims,
+                                          text_key=self.text_encoder.cache_key)
+        self.scheduler = PriorityScheduler(concurrency=inference_concurrency, bulk_chunk_size=bulk_chunk_size)
+        # 缓存、持久化存储和指纹按 cache_key 区分，低精度向量不会与 fp32 向量混用
+        self.text_cache = TextEmbeddingCache(max_mb=text_cache_mb, model_name=self.text_encoder.cache_key)
+        self.text_store = None
+        if text_store_dir:
+            try:
+                self.text_store = TextEmbeddingStore(
+                    text_store_dir, self.text_encoder.cache_key, self.text_encoder.dimension,
+                    max_mb=text_store_max_mb
+                )
+            except (OSError, ValueError) as e:
+                logger.warning(f"Text embedding store disabled: {e}")
+        # 备用文本编码器的向量只进自己的进程内缓存，不写入持久化存储
+        self.fallback_text_encoder = self._load_fallback_text_encoder(
+            text_fallback_engine, text_model_name, text_precision, model_dir)
+        self.fallback_text_cache = None
+        if self.fallback_text_encoder is not None:
+            self.fallback_text_cache = TextEmbeddingCache(max_mb=text_cache_mb,
+                                                          model_name=self.fallback_text_encoder.cache_key)
+        self.micro_batcher = None
+        if micro_batch_enabled:
+            self.micro_batcher = MicroBatcher(
+                self.generate_embeddings_batch,
+                max_batch_size=micro_batch_max_size,
+                max_wait_ms=micro_batch_max_wait_ms,
+            )
+        
+        # 已完成预热推理的版本（就绪探针只读此集合）
+        self._warm_versions = set()
         
         logger.info("EmbeddingService initialized")
     
+    def _load_fallback_text_encoder(self, engine: str, text_model_name: str, text_precision: str,
+                                    model_dir: str):
+        """
+        加载备用文本编码器（与主编码器输出同一 768 维空间，但更快）
+        
+        Args:
+            engine: int8（主模型的 int8 动态量化副本，只支持 CPU）、layers:K（快速模式，前 K 层 + 适配层）
+                或 student:目录（蒸馏学生模型）
+            text_model_name: 主文本模型名称
+            text_precision: 主文本编码器精度（快速模式与学生模型沿用）
+            model_dir: 快速模式适配层所在目录
+            
+        Returns:
+            TextEncoder，未配置、加载失败或与主编码器相同时为 None
+        """
+        if not engine:
+            return None
+        kind, _, value = engine.partition(':')
+        try:
+            if kind == 'int8':
+                encoder = TextEncoder(model_name=text_model_name, device=self.device, precision='int8')
+                if (self.text_encoder.backend_name == BACKEND_TORCH and self.text_encoder.precision == 'fp32'
+                        and self.text_encoder.student is None and not self.text_encoder.fast_layers):
+                    share_input_embeddings(encoder.backend.model, self.text_encoder.backend.model)
+            elif kind == 'layers':
+                encoder = TextEncoder(model_name=text_model_name, device=self.device, precision=text_precision,
+                                      fast_layers=int(value), fast_adapter_dir=model_dir)
+            elif kind == 'student':
+                encoder = TextEncoder(model_name=text_model_name, device=self.device, precision=text_precision,
+                                      student_dir=value)
+            else:
+                raise ValueError(f"Unknown text fallback engine: {engine}. Available: int8, layers:K, student:DIR")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Text fallback encoder disabled: {e}")
+            return None
+        
+        if encoder.cache_key == self.text_encoder.cache_key:
+            logger.warning(f"Text fallback encoder {engine} is the same as the primary encoder, disabled")
+            return None
+        logger.info(f"Text fallback encoder loaded: {encoder.cache_key}")
+        return encoder
+    
     def generate_embedding(self, 
                           text: str, 
                           features: Dict,
-                          version: str = None) -> np.ndarray:
+                          version: str = None,
+                          deadline: float = None) -> np.ndarray:
         """
         生成单个嵌入
         
@@ -45,57 +177,484 @@ class EmbeddingService:
             text: 文本内容
             features: 数值特征字典
             version: 模型版本（None 使用默认版本）
+            deadline: time.monotonic() 截止时间，已过期时不进入文本编码
             
         Returns:
             嵌入向量 (dim,)
         """
-        # 1. 编码文本
-        text_emb = self.text_encoder.encode(text)
-        
-        # 2. 编码数值特征
-        numeric_emb = self.numeric_encoder.encode(features)
+        return self.generate_embeddings_batch([text], [features], version, deadline)[0]
+    
+    def generate_embedding_batched(self,
+                                   text: str,
+                                   features: Dict,
+                                   version: str = None,
+                                   deadline: float = None) -> np.ndarray:
+        """
+        生成单个嵌入（经过微批调度）
         
-        # 3. 获取模型并生成嵌入
-        model = self.model_manager.get_model(version)
-        embedding = model.generate_embedding(text_emb, numeric_emb)
+        并发到达的单条请求会被合并为一次 generate_embeddings_batch 调用；
+        未启用微批时等价于 generate_embedding。
         
-        return embedding
+        Returns:
+            嵌入向量 (dim,)
+        """
+        if self.micro_batcher is None:
+            return self.generate_embedding(text, features, version, deadline)
+        return self.micro_batcher.embed(text, features, version, deadline)
     
     def generate_embeddings_batch(self,
                                   texts: List[str],
                                   features_list: List[Dict],
-                                  version: str = None) -> np.ndarray:
+                                  version: str = None,
+                                  deadline: float = None,
+                                  priority: str = PRIORITY_INTERACTIVE) -> np.ndarray:
         """
         批量生成嵌入
         
+        批量刷新（priority='bulk'）请求按 bulk_chunk_size 分块，每块单独向调度器
+        申请推理名额，块之间排队的交互请求会被优先执行。
+        
         Args:
             texts: 文本列表
             features_list: 特征字典列表
             version: 模型版本
+            deadline: time.monotonic() 截止时间，已过期时不进入文本编码
+            priority: 请求优先级（interactive / bulk）
             
         Returns:
             嵌入向量数组 (N, dim)
         """
+        version = version or self.model_manager.default_version
+        return self.generate_embeddings_multi(texts, features_list, [version], deadline, priority)[version]
+    
+    def generate_embeddings_multi(self,
+                                  texts: List[str],
+                                  features_list: List[Dict],
+                                  versions: List[str],
+                                  deadline: float = None,
+                                  priority: str = PRIORITY_INTERACTIVE) -> Dict[str, np.ndarray]:
+        """
+        同一批输入同时生成多个版本的嵌入（如 v2→v3 迁移期间双写）
+        
+        文本编码和数值特征编码只做一次，结果依次送入各版本的模型。
+        分块与优先级规则同 generate_embeddings_batch；各块的结果直接写入预分配的整批输出。
+        
+        Args:
+            texts: 文本列表
+            features_list: 特征字典列表
+            versions: 模型版本列表（重复的版本只计算一次）
+            deadline: time.monotonic() 截止时间
+            priority: 请求优先级（interactive / bulk）
+            
+        Returns:
+            {版本: 嵌入向量数组 (N, dim)}，按 versions 的顺序
+        """
         if len(texts) != len(features_list):
             raise ValueError("texts and features_list must have same length")
+        if not versions:
+            raise ValueError("versions must not be empty")
         
-        # 1. 批量编码文本
-        text_embs = self.text_encoder.encode(texts)
+        models = {version: self.model_manager.get_model(version) for version in versions}
+        outputs = {version: np.empty((len(texts), model.dimension), dtype=np.float32)
+                   for version, model in models.items()}
         
-        # 2. 批量编码数值特征
+        chunk_size = self.scheduler.chunk_size_for(priority, len(texts))
+        for i in range(0, len(texts), chunk_size):
+            self._generate_chunk(models, texts[i:i + chunk_size], features_list[i:i + chunk_size],
+                                 deadline, priority,
+                                 {version: out[i:i + chunk_size] for version, out in outputs.items()})
+        return outputs
+    
+    def _generate_chunk(self, models: Dict, texts: List[str], features_list: List[Dict],
+                        deadline: float, priority: str, out: Dict[str, np.ndarray]):
+        """
+        在一个调度名额内完成一块的推理，结果写入 out（各阶段耗时计入 Prometheus 指标）
+        
+        文本先按归一化结果去重，再依次查进程内缓存和持久化存储，只有都未命中的唯一文本进入文本编码器。
+        文本编码器的输出直接写入预分配的 float32 张量，与缓存命中的向量合并后留在同一设备上送入模型。
+        """
+        n = len(texts)
+        label = _stage_label(models)
+        unique_texts, inverse = dedupe_texts(texts)
+        cached, misses = self._lookup_text_embeddings(unique_texts)
+        unique_embs = torch.empty((len(unique_texts), self.text_encoder.dimension),
+                                  dtype=torch.float32, device=self.device)
+        
+        if not misses:
+            # 文本全部命中缓存：只剩数值编码和模型前向，不占用调度名额
+            check_deadline(deadline)
+            self._fill_text_embeddings(unique_embs, cached)
+            text_embs = unique_embs if len(unique_texts) == n else unique_embs[inverse]
+            self._fuse(models, text_embs, features_list, out)
+        else:
+            with self.scheduler.slot(priority):
+                check_deadline(deadline)
+                
+                # 1. 批量编码文本（只编码未命中缓存的唯一文本）
+                miss_texts = [unique_texts[i] for i in misses]
+                with metrics.stage_timer(STAGE_TEXT_ENCODE, label, len(miss_texts)):
+                    if cached:
+                        encoded = self.text_encoder.encode_into(
+                            miss_texts, unique_embs.new_empty((len(misses), unique_embs.shape[1])))
+                        unique_embs.index_copy_(0, torch.tensor(misses, device=self.device), encoded)
+                    else:
+                        encoded = self.text_encoder.encode_into(miss_texts, unique_embs)
+                self._remember_text_embeddings(miss_texts, encoded.cpu().numpy())
+                self._fill_text_embeddings(unique_embs, cached)
+                text_embs = unique_embs if len(unique_texts) == n else unique_embs[inverse]
+                
+                # 2-3. 数值特征编码与模型融合
+                self._fuse(models, text_embs, features_list, out)
+        
+        for version in models:
+            metrics.record_items(version, priority, n)
+        metrics.update_process_metrics()
+    
+    def generate_embeddings_fallback(self,
+                                     texts: List[str],
+                                     features_list: List[Dict],
+                                     version: str = None,
+                                     deadline: float = None) -> Tuple[np.ndarray, int]:
+        """
+        过载降级（text_fallback）：缓存未命中的文本改用备用文本编码器，不经过微批和调度器
+        
+        命中进程内缓存或持久化存储的文本仍使用主编码器的向量；其余文本先查备用编码器自己的缓存，
+        再由备用编码器直接在调用线程中编码。排队中的主编码器任务不会阻塞这些请求，
+        并发量由准入控制限制。
+        
+        Args:
+            texts: 文本列表
+            features_list: 特征字典列表
+            version: 模型版本
+            deadline: time.monotonic() 截止时间
+            
+        Returns:
+            (嵌入向量数组 (N, dim), 由备用编码器提供向量的唯一文本数)，
+            后者为 0 时结果与正常路径完全相同
+        """
+        if len(texts) != len(features_list):
+            raise ValueError("texts and features_list must have same length")
+        if self.fallback_text_encoder is None:
+            raise ValueError("Text fallback encoder is not loaded")
+        
+        version = version or self.model_manager.default_version
+        model = self.model_manager.get_model(version)
+        unique_texts, inverse = dedupe_texts(texts)
+        cached, misses = self._lookup_text_embeddings(unique_texts)
+        check_deadline(deadline)
+        
+        if misses:
+            miss_texts = [unique_texts[i] for i in misses]
+            found, pending = self.fallback_text_cache.get_many(miss_texts)
+            if pending:
+                pending_texts = [miss_texts[j] for j in pending]
+                with metrics.stage_timer(STAGE_TEXT_ENCODE, f'{version}-fallback', len(pending_texts)):
+                    vectors = self.fallback_text_encoder.encode(pending_texts)
+                self.fallback_text_cache.put_many(pending_texts, vectors)
+                found.update(zip(pending, vectors))
+            for j, i in enumerate(misses):
+                cached[i] = found[j]
+        
+        unique_embs = torch.empty((len(unique_texts), self.text_encoder.dimension),
+                                  dtype=torch.float32, device=self.device)
+        self._fill_text_embeddings(unique_embs, cached)
+        text_embs = unique_embs if len(unique_texts) == len(texts) else unique_embs[inverse]
+        embeddings = np.empty((len(texts), model.dimension), dtype=np.float32)
+        self._fuse({version: model}, text_embs, features_list, {version: embeddings})
+        
+        metrics.record_items(version, PRIORITY_INTERACTIVE, len(texts))
+        return embeddings, len(misses)
+    
+    def refresh_features(self,
+                         features_list: List[Dict],
+                         text_embeddings: List = None,
+                         texts: List[str] = None,
+                         version: str = None,
+                         deadline: float = None,
+                         priority: str = PRIORITY_BULK) -> Tuple[np.ndarray, int]:
+        """
+        文本未变化时只重算数值特征部分（如新评价带来的评分、评论数变化）
+        
+        每条提供之前计算的文本向量 text_embeddings[i]，或文本 texts[i]（文本本身即缓存键，
+        从进程内缓存 / 持久化存储取向量）。只有两者都未命中的文本才会进入文本编码器。
+        
+        Args:
+            features_list: 特征字典列表
+            text_embeddings: 文本向量列表（元素可为 None），每个 (text_dim,)
+            texts: 文本列表（元素可为 None），用于 text_embeddings[i] 为空的条目
+            version: 模型版本
+            deadline: time.monotonic() 截止时间
+            priority: 请求优先级（仅影响需要重新编码的文本）
+        
+        Returns:
+            (嵌入向量数组 (N, dim), 重新编码的文本数)
+        """
+        n = len(features_list)
+        for name, values in (('text_embeddings', text_embeddings), ('texts', texts)):
+            if values is not None and len(values) != n:
+                raise ValueError(f"{name} and features_list must have same length")
+        
+        version = version or self.model_manager.default_version
+        model = self.model_manager.get_model(version)
+        dim = self.text_encoder.dimension
+        
+        text_embs = np.empty((n, dim), dtype=np.float32)
+        pending: List[int] = []
+        for i in range(n):
+            embedding = text_embeddings[i] if text_embeddings is not None else None
+            if embedding is not None:
+                embedding = np.asarray(embedding, dtype=np.float32)
+                if embedding.shape != (dim,):
+                    raise ValueError(f"Item {i}: text_embedding must have {dim} dimensions, got {embedding.shape}")
+                text_embs[i] = embedding
+            elif texts is not None and texts[i] is not None:
+                pending.append(i)
+            else:
+                raise ValueError(f"Item {i}: text_embedding or text is required")
+        
+        encoded = 0
+        if pending:
+            unique_texts, inverse = dedupe_texts([texts[i] for i in pending])
+            cached, misses = self._lookup_text_embeddings(unique_texts)
+            
+            # 缓存和持久化存储都未命中的文本只能重新编码（批量请求分块让出推理资源）
+            chunk_size = self.scheduler.chunk_size_for(priority, len(misses))
+            for start in range(0, len(misses), chunk_size):
+                chunk = misses[start:start + chunk_size]
+                with self.scheduler.slot(priority):
+                    check_deadline(deadline)
+                    miss_texts = [unique_texts[i] for i in chunk]
+                    with metrics.stage_timer(STAGE_TEXT_ENCODE, version, len(miss_texts)):
+                        vectors = self.text_encoder.encode(miss_texts)
+                    self._remember_text_embeddings(miss_texts, vectors)
+                cached.update(zip(chunk, vectors))
+            encoded = len(misses)
+            
+            unique_embs = np.stack([cached[i] for i in range(len(unique_texts))])
+            text_embs[pending] = unique_embs[inverse]
+        
+        check_deadline(deadline)
+        embeddings = np.empty((n, model.dimension), dtype=np.float32)
+        self._fuse({version: model}, torch.from_numpy(text_embs).to(self.device), features_list,
+                   {version: embeddings})
+        
+        metrics.record_items(version, priority, n)
+        return embeddings, encoded
+    
+    def fingerprints(self, texts: List[str], features_list: List[Dict], version: str = None,
+                     text_fallback: bool = False) -> List[str]:
+        """
+        计算嵌入指纹（不做推理，只需数值编码）
+        
+        Args:
+            texts: 实际参与编码的文本（降级截断后的文本），元素为 None 时该条目没有指纹
+            features_list: 特征字典列表
+            version: 实际使用的模型版本
+            text_fallback: 结果是否经过 text_fallback 降级（指纹按备用编码器标识，与正常结果不同）
+            
+        Returns:
+            指纹列表，见 services/fingerprint.py
+        """
+        version = version or self.model_manager.default_version
+        return self.fingerprints_multi(texts, features_list, [version], text_fallback)[version]
+    
+    def fingerprints_multi(self, texts: List[str], features_list: List[Dict], versions: List[str],
+                           text_fallback: bool = False) -> Dict[str, List[str]]:
+        """多个版本的嵌入指纹（数值编码只做一次）"""
+        if len(texts) != len(features_list):
+            raise ValueError("texts and features_list must have same length")
+        
+        text_encoder = self.fallback_text_encoder if text_fallback else self.text_encoder
         numeric_embs = self.numeric_encoder.encode(features_list)
+        return {
+            version: compute_fingerprints(
+                fingerprint_context(text_encoder.cache_key, version,
+                                    self.model_manager.get_weights_hash(version)),
+                texts, numeric_embs,
+            )
+            for version in versions
+        }
+    
+    def stale_ids(self,
+                  ids: List,
+                  fingerprints: List[str],
+                  texts: List[str],
+                  features_list: List[Dict],
+                  version: str = None) -> List:
+        """
+        找出需要重新计算嵌入的条目
         
-        # 3. 获取模型并生成嵌入
+        Args:
+            ids: 调用方的条目 ID
+            fingerprints: 调用方保存的指纹（None 或空表示没有旧嵌入）
+            texts: 当前文本
+            features_list: 当前特征
+            version: 模型版本
+            
+        Returns:
+            指纹与当前输入不一致的条目 ID（保持输入顺序）
+        """
+        if not (len(ids) == len(fingerprints) == len(texts) == len(features_list)):
+            raise ValueError("ids, fingerprints, texts and features_list must have same length")
+        
+        current = self.fingerprints(texts, features_list, version)
+        return [item_id for item_id, old, new in zip(ids, fingerprints, current) if old != new]
+    
+    def _lookup_text_embeddings(self, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """查进程内缓存，未命中的再查持久化存储（命中的写回进程内缓存）"""
+        cached, misses = self.text_cache.get_many(texts)
+        if misses and self.text_store is not None:
+            stored, still_missing = self.text_store.get_many([texts[i] for i in misses])
+            if stored:
+                self.text_cache.put_many([texts[misses[j]] for j in stored], np.stack(list(stored.values())))
+                for j, embedding in stored.items():
+                    cached[misses[j]] = embedding
+                misses = [misses[j] for j in still_missing]
+        return cached, misses
+    
+    def _remember_text_embeddings(self, texts: List[str], embeddings: np.ndarray):
+        """新编码的文本向量写入进程内缓存和持久化存储"""
+        self.text_cache.put_many(texts, embeddings)
+        if self.text_store is not None:
+            try:
+                self.text_store.put_many(texts, embeddings)
+            except OSError as e:
+                logger.warning(f"Failed to write text embedding store: {e}")
+    
+    @staticmethod
+    def _fill_text_embeddings(buffer: torch.Tensor, cached: Dict[int, np.ndarray]):
+        """把缓存命中的文本向量写入 buffer 的对应行"""
+        if not cached:
+            return
+        if buffer.device.type == 'cpu':
+            # CPU 张量与 numpy 共享内存，逐行直接写入
+            rows = buffer.numpy()
+            for i, embedding in cached.items():
+                rows[i] = embedding
+        else:
+            index = list(cached)
+            stacked = torch.from_numpy(np.stack([cached[i] for i in index]))
+            buffer.index_copy_(0, torch.tensor(index, device=buffer.device), stacked.to(buffer.device))
+    
+    def _fuse(self, models: Dict, text_embs: torch.Tensor, features_list: List[Dict], out: Dict[str, np.ndarray]):
+        """
+        编码数值特征（一次），再经各版本的模型生成最终嵌入
+        
+        Args:
+            models: {版本: 模型}
+            text_embs: 文本向量 (N, text_dim) float32，位于 self.device
+            features_list: 特征字典列表
+            out: {版本: 预分配的输出 (N, dim) float32}，CPU 上模型直接写入其内存
+        """
+        n = len(features_list)
+        
+        # 2. 批量编码数值特征
+        with metrics.stage_timer(STAGE_NUMERIC_ENCODE, _stage_label(models), n):
+            numeric_embs = torch.from_numpy(self.numeric_encoder.encode(features_list)).to(self.device)
+        
+        # 3. 生成嵌入
+        for version, model in models.items():
+            with metrics.stage_timer(STAGE_MODEL_FORWARD, version, n):
+                if text_embs.device.type == 'cpu':
+                    model.embed_into(text_embs, numeric_embs, torch.from_numpy(out[version]))
+                else:
+                    target = torch.empty(out[version].shape, dtype=torch.float32, device=self.device)
+                    model.embed_into(text_embs, numeric_embs, target)
+                    out[version][...] = target.cpu().numpy()
+    
+    def generate_embeddings_profiled(self,
+                                     texts: List[str],
+                                     features_list: List[Dict],
+                                     version: str = None,
+                                     deadline: float = None,
+                                     priority: str = PRIORITY_INTERACTIVE,
+                                     profile: RequestProfile = None) -> np.ndarray:
+        """
+        批量生成嵌入并记录分阶段耗时（性能分析用）
+        
+        整批作为一块执行，不走文本缓存，分词与文本模型各模块的前向分别计时。
+        
+        Args:
+            texts: 文本列表
+            features_list: 特征字典列表
+            version: 模型版本
+            deadline: time.monotonic() 截止时间
+            priority: 请求优先级
+            profile: 记录耗时的 RequestProfile
+            
+        Returns:
+            嵌入向量数组 (N, dim)
+        """
+        if len(texts) != len(features_list):
+            raise ValueError("texts and features_list must have same length")
+        
+        profile = profile or RequestProfile()
+        profile.attributes.update({'items': len(texts), 'version': version or self.model_manager.default_version})
         model = self.model_manager.get_model(version)
-        embeddings = model.generate_embedding(text_embs, numeric_embs)
+        
+        queued = time.perf_counter()
+        with self.scheduler.slot(priority):
+            profile.add('queue', time.perf_counter() - queued)
+            check_deadline(deadline)
+            
+            with profile.capture():
+                # 1. 文本编码：分词与各模块前向
+                text_embs, text_timings = self.text_encoder.encode_profiled(texts)
+                for name, seconds in text_timings.items():
+                    profile.add(f'text.{name}', seconds)
+                
+                # 2. 数值特征编码
+                with profile.stage('numeric_encode'):
+                    numeric_embs = self.numeric_encoder.encode(features_list)
+                
+                # 3. 模型融合
+                with profile.stage('model_forward'):
+                    embeddings = model.generate_embedding(text_embs, numeric_embs)
         
         return embeddings
     
+    def generate_embeddings_stream(self,
+                                   items: Iterable[Dict],
+                                   version: str = None,
+                                   chunk_size: int = 256,
+                                   deadline: float = None,
+                                   priority: str = PRIORITY_BULK) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        分块流式生成嵌入
+        
+        按需从 items 中读取条目，每凑满 chunk_size 条就推理一次并产出结果，
+        内存占用只与 chunk_size 有关，与输入总量无关。
+        
+        Args:
+            items: 条目迭代器，每项为 {"text": ..., "features": {...}}
+            version: 模型版本
+            chunk_size: 每块条数
+            deadline: time.monotonic() 截止时间，每块推理前检查
+            priority: 请求优先级，流式请求默认按批量刷新处理
+            
+        Yields:
+            (start_index, embeddings)，embeddings 形状为 (n, dim)
+        """
+        start_index = 0
+        texts, features_list = [], []
+        
+        for item in items:
+            texts.append(item.get('text', ''))
+            features_list.append(item.get('features', {}))
+            if len(texts) >= chunk_size:
+                yield start_index, self.generate_embeddings_batch(texts, features_list, version, deadline, priority)
+                start_index += len(texts)
+                texts, features_list = [], []
+        
+        if texts:
+            yield start_index, self.generate_embeddings_batch(texts, features_list, version, deadline, priority)
+    
     def convert_version(self,
                        text: str,
                        features: Dict,
                        from_version: str,
-                       to_version: str) -> np.ndarray:
+                       to_version: str,
+                       deadline: float = None) -> np.ndarray:
         """
         转换嵌入版本
         
@@ -106,6 +665,7 @@ class EmbeddingService:
             features: 数值特征
             from_version: 源版本（用于验证）
             to_version: 目标版本
+            deadline: time.monotonic() 截止时间
             
         Returns:
             新版本的嵌入向量
@@ -117,17 +677,37 @@ class EmbeddingService:
                 raise ValueError("Only upgrade is supported (v1->v2->v3)")
         
         # 直接生成目标版本的嵌入
-        return self.generate_embedding(text, features, to_version)
+        return self.generate_embedding(text, features, to_version, deadline)
+    
+    def queue_delay_ms(self) -> float:
+        """交互请求当前的排队延迟（毫秒），用于过载降级判断"""
+        delay = self.scheduler.queue_delay_ms(PRIORITY_INTERACTIVE)
+        if self.micro_batcher is not None:
+            delay = max(delay, self.micro_batcher.queue_delay_ms())
+        return delay
     
     def get_service_info(self) -> Dict:
         """获取服务信息"""
-        return {
+        info = {
             'text_encoder': self.text_encoder.get_info(),
             'numeric_encoder': self.numeric_encoder.get_info(),
             'supported_versions': self.model_manager.get_supported_versions(),
             'default_version': self.model_manager.default_version,
             'models': self.model_manager.get_model_info(),
         }
+        info['scheduler'] = self.scheduler.get_stats()
+        if self.text_cache.enabled:
+            info['text_cache'] = self.text_cache.get_stats()
+        if self.text_store is not None:
+            info['text_store'] = self.text_store.get_stats()
+        if self.fallback_text_encoder is not None:
+            info['text_fallback'] = {
+                'text_encoder': self.fallback_text_encoder.get_info(),
+                'text_cache': self.fallback_text_cache.get_stats(),
+            }
+        if self.micro_batcher is not None:
+            info['micro_batch'] = self.micro_batcher.get_stats()
+        return info
     
     def validate_version(self, version: str) -> bool:
         """验证版本"""
@@ -136,4 +716,45 @@ class EmbeddingService:
     def preload_models(self, versions: list = None):
         """预加载模型"""
         self.model_manager.preload_models(versions)
+    
+    def warmup(self, versions: list = None):
+        """
+        预热：对已加载的模型各执行一次推理
+        
+        首次推理会触发权重页加载、算子选择等一次性开销，预热完成后才报告就绪。
+        预热不经过调度器，也不计入 Prometheus 指标。
+        
+        Args:
+            versions: 要预热的版本，默认为预加载的版本
+        """
+        if versions is None:
+            versions = self.model_manager.expected_versions
+        if not versions:
+            return
+        
+        # 与 _generate_chunk 相同的张量路径
+        text_embs = self.text_encoder.encode_into(
+            ['warmup'], torch.empty((1, self.text_encoder.dimension), dtype=torch.float32, device=self.device))
+        numeric_embs = torch.from_numpy(self.numeric_encoder.encode([{}])).to(self.device)
+        for version in versions:
+            try:
+                model = self.model_manager.get_model(version)
+                model.embed_into(text_embs, numeric_embs,
+                                 torch.empty((1, model.dimension), dtype=torch.float32, device=self.device))
+                self._warm_versions.add(version)
+            except Exception as e:
+                logger.warning(f"Failed to warm up model {version}: {e}")
+        logger.info(f"Warmed up models: {sorted(self._warm_versions)}")
+    
+    def is_ready(self) -> bool:
+        """预加载的模型是否已全部加载并完成预热（只读状态，不加载模型也不推理）"""
+        return all(version in self._warm_versions for version in self.model_manager.expected_versions)
+    
+    def get_model_status(self) -> Dict:
+        """模型注册表状态，附带各版本是否已预热"""
+        status = self.model_manager.get_status()
+        for version, entry in status['versions'].items():
+            entry['warm'] = version in self._warm_versions
+        status['ready'] = self.is_ready()
+        return status
 
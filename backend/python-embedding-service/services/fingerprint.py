@@ -0,0 +1,58 @@
+"""
+嵌入指纹 - 判断一个条目的嵌入是否需要重新计算
+
+指纹覆盖决定嵌入结果的全部输入：
+- 归一化后的文本（与文本缓存的键一致）
+- 数值编码器的输出（而不是原始特征字典，不参与编码的字段变化不影响指纹）
+- 模型版本与模型权重摘要
+- 文本模型名称
+
+任一输入变化时指纹随之变化；指纹相同则重新计算得到的嵌入相同。
+"""
+
+import hashlib
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from services.text_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# 指纹算法版本，算法或归一化规则变化时递增，使旧指纹全部失效
+# 2: 数值编码器输出改为 float32（v2 输出随之变为 float32）
+FINGERPRINT_FORMAT = 2
+
+
+def fingerprint_context(text_model: str, version: str, weights_hash: str) -> bytes:
+    """同一模型配置下所有条目共享的指纹前缀"""
+    return f'{FINGERPRINT_FORMAT}\x00{text_model}\x00{version}\x00{weights_hash}\x00'.encode('utf-8')
+
+
+def compute_fingerprints(context: bytes, texts: List[Optional[str]], numeric_embs: np.ndarray) -> List[Optional[str]]:
+    """
+    批量计算指纹
+
+    Args:
+        context: fingerprint_context 的返回值
+        texts: 文本列表，元素为 None 时（如只提供了文本向量）该条目没有指纹
+        numeric_embs: 数值编码器输出 (N, numeric_dim)
+
+    Returns:
+        32 位十六进制指纹列表
+    """
+    base = hashlib.blake2b(context, digest_size=16)
+    numeric_embs = np.ascontiguousarray(numeric_embs, dtype='<f4')
+
+    fingerprints: List[Optional[str]] = []
+    for text, numeric in zip(texts, numeric_embs):
+        if text is None:
+            fingerprints.append(None)
+            continue
+        digest = base.copy()
+        digest.update(normalize_text(text).encode('utf-8'))
+        digest.update(b'\x00')
+        digest.update(numeric.tobytes())
+        fingerprints.append(digest.hexdigest())
+    return fingerprints
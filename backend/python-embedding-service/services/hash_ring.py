@@ -0,0 +1,121 @@
+"""
+一致性哈希环 - 按文本把请求固定分配到副本，使各副本的文本嵌入缓存互不重叠
+
+每个节点在环上放置 vnodes 个虚拟节点；键落在顺时针方向第一个虚拟节点所属的节点上。
+增删一个节点时只有约 1/N 的键改变归属，其余键仍命中原副本的缓存。
+"""
+
+import bisect
+import hashlib
+import threading
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from services.text_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(data: str) -> int:
+    return int.from_bytes(hashlib.blake2b(data.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def text_hash(text: str) -> int:
+    """文本在环上的位置（按归一化文本，与文本嵌入缓存的键一致）"""
+    return _hash(normalize_text(text or ''))
+
+
+class ConsistentHashRing:
+    """一致性哈希环（线程安全，节点为任意字符串，如副本 URL）"""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 160):
+        """
+        初始化哈希环
+
+        Args:
+            nodes: 初始节点
+            vnodes: 每个节点的虚拟节点数，越多分布越均匀
+        """
+        self.vnodes = max(1, vnodes)
+
+        self._lock = threading.Lock()
+        self._nodes: List[str] = []
+        self._points: List[int] = []
+        self._owners: List[str] = []
+
+        for node in nodes:
+            self.add(node)
+
+    def _rebuild(self):
+        # 调用方持有 self._lock
+        ring = sorted(
+            (_hash(f'{node}#{i}'), node)
+            for node in self._nodes
+            for i in range(self.vnodes)
+        )
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+
+    def add(self, node: str) -> bool:
+        """加入节点，已存在时返回 False"""
+        with self._lock:
+            if node in self._nodes:
+                return False
+            self._nodes.append(node)
+            self._rebuild()
+        logger.info(f"Hash ring: added {node} ({len(self._nodes)} nodes)")
+        return True
+
+    def remove(self, node: str) -> bool:
+        """移除节点，不存在时返回 False"""
+        with self._lock:
+            if node not in self._nodes:
+                return False
+            self._nodes.remove(node)
+            self._rebuild()
+        logger.info(f"Hash ring: removed {node} ({len(self._nodes)} nodes)")
+        return True
+
+    @property
+    def nodes(self) -> List[str]:
+        with self._lock:
+            return list(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._nodes
+
+    @staticmethod
+    def _owner(points: List[int], owners: List[str], position: int) -> str:
+        index = bisect.bisect_right(points, position)
+        return owners[index % len(owners)]
+
+    def node_for(self, text: str) -> Optional[str]:
+        """文本所属的节点，环为空时返回 None"""
+        with self._lock:
+            points, owners = self._points, self._owners
+        if not owners:
+            return None
+        return self._owner(points, owners, text_hash(text))
+
+    def assign(self, texts: List[str]) -> Dict[str, List[int]]:
+        """
+        按文本把一批条目分配到节点
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            {节点: 条目下标列表}（下标保持升序），环为空时返回空字典
+        """
+        with self._lock:
+            points, owners = self._points, self._owners
+        if not owners:
+            return {}
+
+        shards: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            shards.setdefault(self._owner(points, owners, text_hash(text)), []).append(i)
+        return shards
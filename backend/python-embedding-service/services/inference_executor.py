@@ -0,0 +1,125 @@
+"""
+推理执行器 - 供异步服务模式把阻塞的模型推理移出事件循环
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from services import metrics
+from services.priority_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceExecutor:
+    """
+    有界推理执行器
+
+    推理在固定大小的线程池中执行（PyTorch 计算期间会释放 GIL）。
+    同时提交到线程池的任务数不超过 max_workers，其余请求在事件循环中
+    以协程形式等待，不占用线程，客户端断开时可直接取消。
+
+    max_workers > 1 时批量任务最多占用 max_workers - 1 个线程，
+    保证交互请求总有线程可用。
+
+    过载降级（text_fallback）的任务经 run_fallback 在另一组线程中执行，不排在上述槽位之后。
+    """
+
+    def __init__(self, max_workers: int = 2):
+        """
+        初始化推理执行器
+
+        Args:
+            max_workers: 推理线程数
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be >= 1")
+
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='inference')
+        self._fallback_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fallback')
+        self._slots: asyncio.Semaphore = None
+        self._bulk_slots: asyncio.Semaphore = None
+        self._wait_starts = []
+        self._running = 0
+
+    async def run(self, fn: Callable, *args, priority: str = PRIORITY_INTERACTIVE) -> Any:
+        """
+        在推理线程池中执行阻塞函数
+
+        Args:
+            fn: 阻塞函数（如 EmbeddingService.generate_embeddings_batch）
+            *args: 函数参数
+            priority: 任务优先级
+
+        Returns:
+            函数返回值
+        """
+        if self._slots is None:
+            # 信号量需要绑定到运行中的事件循环，延迟创建
+            self._slots = asyncio.Semaphore(self.max_workers)
+            self._bulk_slots = asyncio.Semaphore(max(1, self.max_workers - 1))
+
+        loop = asyncio.get_running_loop()
+        bulk = priority == PRIORITY_BULK
+
+        start = time.monotonic()
+        self._wait_starts.append(start)
+        metrics.set_queue_depth('executor', len(self._wait_starts))
+        try:
+            if bulk:
+                await self._bulk_slots.acquire()
+            try:
+                await self._slots.acquire()
+            except BaseException:
+                if bulk:
+                    self._bulk_slots.release()
+                raise
+        finally:
+            self._wait_starts.remove(start)
+            metrics.set_queue_depth('executor', len(self._wait_starts))
+
+        self._running += 1
+        future = loop.run_in_executor(self._executor, functools.partial(fn, *args))
+        # 槽位在线程真正执行完后才释放：请求被取消时，线程中的推理仍会跑完
+        future.add_done_callback(functools.partial(self._release, bulk))
+        return await asyncio.shield(future)
+
+    async def run_fallback(self, fn: Callable, *args) -> Any:
+        """
+        在降级线程池中执行阻塞函数（不等待推理槽位，如 EmbeddingService.generate_embeddings_fallback）
+
+        Returns:
+            函数返回值
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._fallback_executor, functools.partial(fn, *args))
+
+    def _release(self, bulk: bool, _future):
+        self._running -= 1
+        self._slots.release()
+        if bulk:
+            self._bulk_slots.release()
+
+    def queue_delay_ms(self) -> float:
+        """等待线程的任务中最早一个已等待的时长（毫秒）"""
+        if not self._wait_starts:
+            return 0.0
+        return (time.monotonic() - self._wait_starts[0]) * 1000
+
+    def get_stats(self) -> Dict:
+        """获取执行器状态"""
+        return {
+            'max_workers': self.max_workers,
+            'running': self._running,
+            'waiting': len(self._wait_starts),
+        }
+
+    def shutdown(self):
+        """关闭线程池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._fallback_executor.shutdown(wait=False, cancel_futures=True)
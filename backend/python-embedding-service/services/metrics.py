@@ -0,0 +1,214 @@
+"""
+Prometheus 指标 - 分阶段延迟、吞吐、错误与资源占用
+
+gunicorn 多 worker 部署时设置 PROMETHEUS_MULTIPROC_DIR，各进程把指标写入该目录，
+/metrics 由任意一个 worker 汇总输出（配合 gunicorn.conf.py 中的 child_exit 钩子）。
+
+未安装 prometheus_client 时所有记录函数为空操作，/metrics 返回 503。
+"""
+
+import os
+import time
+import logging
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+except ImportError:  # pragma: no cover - 可选依赖
+    prometheus_client = None
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# 阶段名称
+STAGE_TEXT_ENCODE = 'text_encode'
+STAGE_NUMERIC_ENCODE = 'numeric_encode'
+STAGE_MODEL_FORWARD = 'model_forward'
+STAGE_SERIALIZE = 'serialize'
+
+# 批大小分桶（标签取值），避免按具体条数产生过多时间序列
+_BATCH_BUCKETS = ((1, '1'), (8, '2-8'), (32, '9-32'), (128, '33-128'), (512, '129-512'))
+_BATCH_BUCKET_OVERFLOW = '513+'
+
+# 各阶段耗时从亚毫秒到数秒不等
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+if prometheus_client is not None:
+    STAGE_LATENCY = Histogram(
+        'embedding_stage_duration_seconds',
+        'Time spent in each embedding pipeline stage',
+        ['stage', 'version', 'batch_bucket'],
+        buckets=_LATENCY_BUCKETS,
+    )
+    ITEMS = Counter(
+        'embedding_items_total',
+        'Number of items embedded',
+        ['version', 'priority'],
+    )
+    REQUESTS = Counter(
+        'embedding_requests_total',
+        'Number of HTTP requests by endpoint and status code',
+        ['endpoint', 'status'],
+    )
+    ERRORS = Counter(
+        'embedding_errors_total',
+        'Number of failed embedding computations',
+        ['stage'],
+    )
+    REJECTED = Counter(
+        'embedding_rejected_total',
+        'Number of requests rejected or dropped before inference',
+        ['reason'],
+    )
+    DEGRADATIONS = Counter(
+        'embedding_degradations_total',
+        'Number of requests served through each degradation step',
+        ['step'],
+    )
+    QUEUE_DEPTH = Gauge(
+        'embedding_queue_depth',
+        'Number of tasks waiting for inference',
+        ['queue'],
+        multiprocess_mode='livesum',
+    )
+    MODELS_LOADED = Gauge(
+        'embedding_models_loaded',
+        'Whether a model version is loaded in the worker (1 = loaded)',
+        ['version'],
+        multiprocess_mode='livemax',
+    )
+    PROCESS_RSS = Gauge(
+        'embedding_process_resident_memory_bytes',
+        'Resident memory of each worker process',
+        multiprocess_mode='liveall',
+    )
+
+
+def batch_bucket(size: int) -> str:
+    """批大小分桶标签"""
+    for upper, label in _BATCH_BUCKETS:
+        if size <= upper:
+            return label
+    return _BATCH_BUCKET_OVERFLOW
+
+
+def observe_stage(stage: str, version: str, batch_size: int, seconds: float):
+    """记录一个阶段的耗时"""
+    if prometheus_client is None:
+        return
+    STAGE_LATENCY.labels(stage, version, batch_bucket(batch_size)).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str, version: str, batch_size: int):
+    """
+    阶段计时上下文，阶段抛出异常时计入 embedding_errors_total
+
+    Args:
+        stage: 阶段名称
+        version: 模型版本
+        batch_size: 本次处理的条数
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record_error(stage)
+        raise
+    observe_stage(stage, version, batch_size, time.perf_counter() - start)
+
+
+def record_items(version: str, priority: str, count: int):
+    if prometheus_client is not None:
+        ITEMS.labels(version, priority).inc(count)
+
+
+def record_request(endpoint: str, status: int):
+    if prometheus_client is not None:
+        REQUESTS.labels(endpoint, str(status)).inc()
+
+
+def record_error(stage: str):
+    if prometheus_client is not None:
+        ERRORS.labels(stage).inc()
+
+
+def record_rejected(reason: str):
+    """reason: overloaded / deadline / too_large"""
+    if prometheus_client is not None:
+        REJECTED.labels(reason).inc()
+
+
+def record_degradation(step: str):
+    if prometheus_client is not None:
+        DEGRADATIONS.labels(step).inc()
+
+
+def set_queue_depth(queue: str, depth: int):
+    if prometheus_client is not None:
+        QUEUE_DEPTH.labels(queue).set(depth)
+
+
+def set_model_loaded(version: str, loaded: bool = True):
+    if prometheus_client is not None:
+        MODELS_LOADED.labels(version).set(1 if loaded else 0)
+
+
+def _resident_memory_bytes() -> Optional[int]:
+    """当前进程常驻内存（Linux 读 /proc，其他平台退化为峰值 RSS）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        # macOS 单位为字节，Linux 为 KB
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if os.uname().sysname == 'Darwin' else rss * 1024
+    return None
+
+
+def update_process_metrics():
+    """刷新进程级指标（每次推理后及抓取时调用）"""
+    if prometheus_client is None:
+        return
+    rss = _resident_memory_bytes()
+    if rss is not None:
+        PROCESS_RSS.set(rss)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    生成 Prometheus 文本格式输出
+
+    Returns:
+        (body, content_type)
+
+    Raises:
+        RuntimeError: 未安装 prometheus_client
+    """
+    if prometheus_client is None:
+        raise RuntimeError("prometheus_client is not installed")
+
+    update_process_metrics()
+
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """gunicorn worker 退出时清理其 live* 指标"""
+    if prometheus_client is not None and MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,212 @@
+"""
+动态微批调度器 - 将并发的单条嵌入请求合并为一次批量推理
+"""
+
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from services import metrics
+from services.admission import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingItem:
+    """队列中等待合批的单条请求"""
+
+    __slots__ = ('text', 'features', 'version', 'deadline', 'enqueued', 'future')
+
+    def __init__(self, text: str, features: Dict, version: Optional[str], deadline: Optional[float]):
+        self.text = text
+        self.features = features
+        self.version = version
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.future: Future = Future()
+
+
+class MicroBatcher:
+    """
+    微批调度器
+
+    调度线程每次取出队列中已有的请求（最多 max_batch_size 条），按版本分组后
+    调用一次批量推理函数，再把每一行结果路由回对应的调用方。
+
+    - max_wait_ms = 0: 贪心模式，空闲时单条请求立即执行，不增加延迟；
+      推理进行中到达的请求会在下一轮自动合并
+    - max_wait_ms > 0: 取到第一条请求后最多再等待该时长以凑满批次
+    """
+
+    def __init__(self,
+                 batch_fn: Callable[[List[str], List[Dict], Optional[str]], np.ndarray],
+                 max_batch_size: int = 64,
+                 max_wait_ms: float = 0.0):
+        """
+        初始化微批调度器
+
+        Args:
+            batch_fn: 批量推理函数，签名同 EmbeddingService.generate_embeddings_batch
+            max_batch_size: 单批最大条数
+            max_wait_ms: 凑批的最长等待时间（毫秒）
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: "queue.Queue[_PendingItem]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+        # 统计信息
+        self._batches = 0
+        self._items = 0
+
+    def submit(self, text: str, features: Dict, version: str = None, deadline: float = None) -> Future:
+        """
+        提交单条请求
+
+        Args:
+            text: 文本内容
+            features: 数值特征字典
+            version: 模型版本
+            deadline: time.monotonic() 截止时间，过期的请求在合批前被丢弃
+
+        Returns:
+            Future，结果为嵌入向量 (dim,)；调用方取消 Future 后请求不会再被执行
+        """
+        self._ensure_worker()
+        item = _PendingItem(text, features, version, deadline)
+        self._queue.put(item)
+        metrics.set_queue_depth('micro_batch', self._queue.qsize())
+        return item.future
+
+    def embed(self, text: str, features: Dict, version: str = None, deadline: float = None) -> np.ndarray:
+        """
+        提交单条请求并阻塞等待结果
+
+        Raises:
+            DeadlineExceeded: 截止时间前未完成
+        """
+        future = self.submit(text, features, version, deadline)
+        if deadline is None:
+            return future.result()
+
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            # 仍在队列中的请求直接取消，不再占用推理
+            future.cancel()
+            raise DeadlineExceeded()
+
+    def _ensure_worker(self):
+        """
+        按需启动调度线程
+
+        gunicorn --preload 会在主进程创建服务实例后 fork，线程不会被继承，
+        因此以 pid 判断当前进程是否已经拥有调度线程。
+        """
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                # fork 后继承的队列可能处于不一致状态，重新创建
+                self._queue = queue.Queue()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='embedding-micro-batcher', daemon=True)
+            self._thread.start()
+            logger.info(f"MicroBatcher started (max_batch_size: {self.max_batch_size}, "
+                        f"max_wait_ms: {self.max_wait * 1000:.1f}, pid: {pid})")
+
+    def _collect(self) -> List[_PendingItem]:
+        """阻塞等待第一条请求，然后收集同一批次的其余请求"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        """调度线程主循环"""
+        while True:
+            batch = self._collect()
+            metrics.set_queue_depth('micro_batch', self._queue.qsize())
+
+            # 不同版本不能共用一次模型调用，按版本分组
+            groups: Dict[Optional[str], List[_PendingItem]] = {}
+            now = time.monotonic()
+            for item in batch:
+                # 已取消（调用方放弃等待）的请求直接跳过
+                if not item.future.set_running_or_notify_cancel():
+                    continue
+                if item.deadline is not None and now >= item.deadline:
+                    item.future.set_exception(DeadlineExceeded())
+                    continue
+                groups.setdefault(item.version, []).append(item)
+
+            for version, items in groups.items():
+                self._execute(version, items)
+
+    def _execute(self, version: Optional[str], items: List[_PendingItem]):
+        """执行一个分组并分发结果"""
+        try:
+            embeddings = self.batch_fn(
+                [item.text for item in items],
+                [item.features for item in items],
+                version,
+            )
+        except Exception as e:
+            for item in items:
+                item.future.set_exception(e)
+            return
+
+        self._batches += 1
+        self._items += len(items)
+
+        for item, embedding in zip(items, embeddings):
+            item.future.set_result(embedding)
+
+    def queue_delay_ms(self) -> float:
+        """队列中最早一条请求已等待的时长（毫秒）"""
+        with self._queue.mutex:
+            oldest = self._queue.queue[0].enqueued if self._queue.queue else None
+        return 0.0 if oldest is None else (time.monotonic() - oldest) * 1000
+
+    def get_stats(self) -> Dict:
+        """获取调度统计"""
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self._queue.qsize(),
+            'batches': self._batches,
+            'items': self._items,
+            'avg_batch_size': round(self._items / self._batches, 2) if self._batches else 0.0,
+        }
@@ -3,21 +3,34 @@
 """
 
 import os
+import threading
+import time
 import torch
 import logging
-from typing import Dict, Optional
-from models import BaseEmbeddingModel, ConcatModel, FusionModel
+from typing import Dict, List, Optional
+from models import BaseEmbeddingModel, ConcatModel, FusionModel, PCAConcatModel, parse_precision
+from models.precision import PRECISION_FP32
+from models.artifact import artifact_path_for, matches_checkpoint, read_header, state_dict_digest
+from models.pca import projection_path_for
+from services import metrics
 
 logger = logging.getLogger(__name__)
 
 
+class ModelUnavailable(ValueError):
+    """版本已注册但缺少必需的检查点（如未拟合的 v2-pca 投影），按请求错误（HTTP 400）返回准备步骤"""
+
+
 class ModelManager:
     """模型管理器 - 负责加载、缓存和管理不同版本的模型"""
     
     def __init__(self, 
                  device: str = None,
                  model_dir: str = 'saved_models',
-                 default_version: str = 'v2'):
+                 default_version: str = 'v2',
+                 precision: str = 'fp32',
+                 pca_dims: List[int] = None,
+                 text_key: str = None):
         """
         初始化模型管理器
         
@@ -25,18 +38,31 @@ class ModelManager:
             device: 计算设备
             model_dir: 模型文件目录
             default_version: 默认版本
+            precision: 有网络权重的模型（v3）的推理精度，见 models/precision.py
+            pca_dims: 注册的 v2 降维版本（v2-pca{dim}），投影由 fit_pca.py 拟合
+            text_key: 服务文本编码器的 cache_key，降维投影必须由同一文本编码器的向量拟合，None 表示不检查
         """
         self.device = device if device else ('cuda' if torch.cuda.is_available() else 'cpu')
+        self.precision = parse_precision(precision)
         self.model_dir = model_dir
         self.default_version = default_version
+        self.pca_dims = list(pca_dims or [])
+        self.text_key = text_key
         self._models: Dict[str, BaseEmbeddingModel] = {}
         self._model_config = self._get_model_config()
         
-        logger.info(f"ModelManager initialized (device: {self.device}, default: {default_version})")
+        # 模型注册表：元数据在加载时计算一次，健康检查和 /models 只读缓存
+        self._lock = threading.Lock()
+        self._info: Dict[str, Dict] = {}
+        self._status: Dict[str, Dict] = {ver: {'status': 'not_loaded'} for ver in self._model_config}
+        self._expected: List[str] = []
+        
+        logger.info(f"ModelManager initialized (device: {self.device}, default: {default_version}, "
+                    f"precision: {self.precision})")
     
     def _get_model_config(self) -> Dict:
         """获取模型配置"""
-        return {
+        config = {
             'v2': {
                 'class': ConcatModel,
                 'params': {'text_dim': 768, 'numeric_dim': 20},
@@ -44,11 +70,25 @@ class ModelManager:
             },
             'v3': {
                 'class': FusionModel,
-                'params': {'text_dim': 768, 'numeric_dim': 20, 'output_dim': 256, 'device': self.device},
+                'params': {'text_dim': 768, 'numeric_dim': 20, 'output_dim': 256, 'device': self.device,
+                           'precision': self.precision},
                 'checkpoint': os.path.join(self.model_dir, 'fusion_v3.pt'),
+                'artifact': artifact_path_for(os.path.join(self.model_dir, 'fusion_v3.pt')),
             },
             # 未来可以添加更多版本
         }
+        
+        # v2 降维版本：没有投影文件时无法生成嵌入，加载失败而不是返回未投影的向量
+        for dim in self.pca_dims:
+            config[f'v2-pca{dim}'] = {
+                'class': PCAConcatModel,
+                'params': {'text_dim': 768, 'numeric_dim': 20, 'output_dim': dim, 'device': self.device,
+                           'text_key': self.text_key},
+                'checkpoint': projection_path_for(self.model_dir, dim),
+                'checkpoint_required': True,
+                'setup': f'python fit_pca.py --from-db --dim {dim}',
+            }
+        return config
     
     def get_model(self, version: str = None) -> BaseEmbeddingModel:
         """
@@ -64,13 +104,33 @@ class ModelManager:
             version = self.default_version
         
         # 检查缓存
-        if version in self._models:
-            return self._models[version]
+        model = self._models.get(version)
+        if model is not None:
+            return model
         
-        # 加载模型
-        model = self._load_model(version)
-        self._models[version] = model
+        with self._lock:
+            if version in self._models:
+                return self._models[version]
+            
+            # 加载模型
+            start = time.perf_counter()
+            try:
+                model = self._load_model(version)
+            except Exception as e:
+                if version in self._status:
+                    self._status[version] = {'status': 'failed', 'error': str(e)}
+                raise
+            
+            self._info[version] = model.get_info()
+            self._status[version].update({
+                'status': 'loaded',
+                'weights_hash': self._weights_hash(model),
+                'load_ms': round((time.perf_counter() - start) * 1000, 1),
+                'loaded_at': time.time(),
+            })
+            self._models[version] = model
         
+        metrics.set_model_loaded(version)
         return model
     
     def _load_model(self, version: str) -> BaseEmbeddingModel:
@@ -87,6 +147,10 @@ class ModelManager:
             raise ValueError(f"Unsupported version: {version}. Available: {list(self._model_config.keys())}")
         
         config = self._model_config[version]
+        checkpoint_path = config.get('checkpoint')
+        if config.get('checkpoint_required') and not os.path.exists(checkpoint_path):
+            raise ModelUnavailable(f"{version} is not available: {checkpoint_path} not found, "
+                                   f"run: {config['setup']}")
         
         logger.info(f"Loading model: {version}")
         
@@ -94,37 +158,150 @@ class ModelManager:
         model_class = config['class']
         model = model_class(**config['params'])
         
-        # 加载权重（如果有）
-        checkpoint_path = config.get('checkpoint')
-        if checkpoint_path and os.path.exists(checkpoint_path):
+        # 优先加载推理产物，其次是训练检查点
+        artifact_path = self._usable_artifact(config, model)
+        checkpoint_loaded = False
+        load_error = None
+        if artifact_path:
+            try:
+                model.load_artifact(artifact_path)
+                checkpoint_loaded = True
+                logger.info(f"✓ Loaded inference artifact: {artifact_path}")
+            except Exception as e:
+                artifact_path = None
+                logger.warning(f"Failed to load inference artifact, falling back to checkpoint: {e}")
+        
+        if checkpoint_loaded:
+            pass  # 已从推理产物加载
+        elif checkpoint_path and os.path.exists(checkpoint_path):
             if hasattr(model, 'load_weights'):
                 try:
                     model.load_weights(checkpoint_path)
+                    checkpoint_loaded = True
                     logger.info(f"✓ Loaded checkpoint: {checkpoint_path}")
                 except Exception as e:
+                    load_error = e
                     logger.warning(f"Failed to load checkpoint: {e}")
         elif checkpoint_path:
             logger.warning(f"Checkpoint not found: {checkpoint_path}")
         
+        if config.get('checkpoint_required') and not checkpoint_loaded:
+            raise ModelUnavailable(f"{version} is not available: failed to load {checkpoint_path}"
+                                   f"{f' ({load_error})' if load_error else ''}, run: {config['setup']}")
+        
+        self._status[version] = {
+            'status': 'loading',
+            'checkpoint': checkpoint_path,
+            'checkpoint_loaded': checkpoint_loaded,
+            'artifact': artifact_path,
+        }
+        
         logger.info(f"Model {version} ready: {model.get_info()}")
         
         return model
     
+    @staticmethod
+    def _usable_artifact(config: Dict, model: BaseEmbeddingModel) -> Optional[str]:
+        """
+        可用的推理产物路径
+        
+        产物只支持 fp32；检查点存在时，产物头部记录的来源检查点大小和 sha256 必须与磁盘上的检查点一致
+        （重新训练后未导出、或两个文件来自不同部署时不使用），以免加载过期权重。修改时间不可靠
+        （拷贝、解压、镜像构建都会改变），不作判断依据。
+        """
+        artifact_path = config.get('artifact')
+        if not artifact_path or not os.path.exists(artifact_path) or not hasattr(model, 'load_artifact'):
+            return None
+        if getattr(model, 'precision', PRECISION_FP32) != PRECISION_FP32:
+            logger.info(f"Skipping inference artifact {artifact_path}: precision is {model.precision}")
+            return None
+        checkpoint_path = config.get('checkpoint')
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            try:
+                exported_from_checkpoint = matches_checkpoint(read_header(artifact_path), checkpoint_path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to read inference artifact {artifact_path}, ignoring it: {e}")
+                return None
+            if not exported_from_checkpoint:
+                logger.warning(f"Inference artifact {artifact_path} was not exported from the current "
+                               f"{checkpoint_path}, ignoring it (re-export with: python train/train_fusion.py "
+                               f"--output {checkpoint_path} --export_only)")
+                return None
+        return artifact_path
+    
+    @staticmethod
+    def _weights_hash(model: BaseEmbeddingModel) -> str:
+        """
+        模型实际使用的权重的摘要（加载时计算一次）
+        
+        对网络参数而不是检查点文件取摘要：未找到检查点时随机初始化的权重同样会被区分，
+        同一检查点在不同精度下（bf16 / int8）的摘要也不同。推理产物的参数已折叠为常量，
+        使用头部记录的导出前 fp32 权重摘要（与 eager 加载同一检查点一致）。
+        无可学习参数的模型（如 v2 拼接）返回 'none'。
+        """
+        recorded = getattr(model, 'weights_sha256', None)
+        if recorded:
+            return recorded[:16]
+        module = getattr(model, 'model', None)
+        if not isinstance(module, torch.nn.Module):
+            return 'none'
+        return state_dict_digest(module.state_dict())[:16]
+    
+    def get_weights_hash(self, version: str = None) -> str:
+        """已加载模型的权重摘要（未加载时先加载）"""
+        version = version or self.default_version
+        self.get_model(version)
+        return self._status[version]['weights_hash']
+    
     def get_supported_versions(self) -> list:
         """获取支持的版本列表"""
         return list(self._model_config.keys())
     
     def get_model_info(self, version: str = None) -> Dict:
-        """获取模型信息"""
+        """
+        获取模型信息
+        
+        已加载的版本直接返回加载时缓存的元数据；未加载的版本只在首次查询时
+        构造一次模型读取元数据，之后同样走缓存。
+        """
         if version is None:
             # 返回所有版本信息
-            return {
-                ver: self._model_config[ver]['class'](**self._model_config[ver]['params']).get_info()
-                for ver in self._model_config.keys()
-            }
+            return {ver: self._get_cached_info(ver) for ver in self._model_config.keys()}
         else:
-            model = self.get_model(version)
-            return model.get_info()
+            self.get_model(version)
+            return self._info[version]
+    
+    def _get_cached_info(self, version: str) -> Dict:
+        info = self._info.get(version)
+        if info is None:
+            with self._lock:
+                info = self._info.get(version)
+                if info is None:
+                    config = self._model_config[version]
+                    info = self._info[version] = config['class'](**config['params']).get_info()
+        return info
+    
+    def get_status(self) -> Dict:
+        """
+        模型注册表状态（只读缓存，不加载模型）
+        
+        Returns:
+            {"ready": 预加载的模型是否全部加载完成, "expected": 预加载列表, "versions": {...}}
+        """
+        return {
+            'ready': self.is_ready(),
+            'expected': list(self._expected),
+            'versions': {ver: dict(status) for ver, status in self._status.items()},
+        }
+    
+    @property
+    def expected_versions(self) -> List[str]:
+        """preload_models 要求加载的版本"""
+        return self._expected
+    
+    def is_ready(self) -> bool:
+        """预加载的模型是否全部加载完成"""
+        return all(ver in self._models for ver in self._expected)
     
     def validate_version(self, version: str) -> bool:
         """验证版本是否支持"""
@@ -135,7 +312,8 @@ class ModelManager:
         if versions is None:
             versions = self.get_supported_versions()
         
-        for version in versions:
+        self._expected = [ver for ver in versions if ver]
+        for version in self._expected:
             try:
                 self.get_model(version)
             except Exception as e:
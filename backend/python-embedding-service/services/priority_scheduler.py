@@ -0,0 +1,177 @@
+"""
+优先级调度器 - 交互请求优先于批量刷新请求使用推理资源
+"""
+
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional
+
+import numpy as np
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BULK = 'bulk'
+
+# 按优先级从高到低排列
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+PRIORITY_HEADER = 'X-Embedding-Priority'
+
+
+def resolve_priority(value: Optional[str], item_count: int = 1, bulk_threshold: int = 32) -> str:
+    """
+    确定请求的优先级
+
+    显式指定时以指定值为准；未指定时条目数超过 bulk_threshold 的请求视为批量刷新。
+
+    Raises:
+        ValueError: 未知的优先级
+    """
+    if value:
+        value = value.lower()
+        if value not in PRIORITIES:
+            raise ValueError(f"Invalid priority: {value}. Available: {list(PRIORITIES)}")
+        return value
+    return PRIORITY_BULK if item_count > bulk_threshold else PRIORITY_INTERACTIVE
+
+
+class _ClassStats:
+    """单个优先级的排队统计"""
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def record(self, wait: float):
+        self.count += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent.append(wait)
+
+    def snapshot(self, waiting: int) -> Dict:
+        recent = np.array(self.recent) if self.recent else None
+        return {
+            'waiting': waiting,
+            'granted': self.count,
+            'avg_wait_ms': round(self.total_wait / self.count * 1000, 3) if self.count else 0.0,
+            'p50_wait_ms': round(float(np.percentile(recent, 50)) * 1000, 3) if recent is not None else 0.0,
+            'p95_wait_ms': round(float(np.percentile(recent, 95)) * 1000, 3) if recent is not None else 0.0,
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+        }
+
+
+class _Ticket:
+    """排队中的任务（以对象身份区分）"""
+
+    __slots__ = ('start',)
+
+    def __init__(self, start: float):
+        self.start = start
+
+
+class PriorityScheduler:
+    """
+    推理资源的优先级调度器
+
+    同一时刻最多 concurrency 个任务在推理。空出的名额总是先分给排队中
+    优先级最高的任务（同一优先级内先到先得）。批量任务由调用方拆成若干块，
+    每块单独申请名额，因此交互请求最多只需等待一个块的推理时间。
+    """
+
+    def __init__(self, concurrency: int = 1, bulk_chunk_size: int = 64):
+        """
+        初始化优先级调度器
+
+        Args:
+            concurrency: 同时推理的任务数
+            bulk_chunk_size: 批量请求每块条数（两块之间让出推理资源）
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be >= 1")
+
+        self.concurrency = concurrency
+        self.bulk_chunk_size = max(1, bulk_chunk_size)
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting: Dict[str, Deque[_Ticket]] = {p: deque() for p in PRIORITIES}
+        self._stats: Dict[str, _ClassStats] = {p: _ClassStats() for p in PRIORITIES}
+
+    def _is_next(self, priority: str, ticket: _Ticket) -> bool:
+        """ticket 是否为当前应获得名额的任务"""
+        if self._active >= self.concurrency:
+            return False
+        for p in PRIORITIES:
+            if self._waiting[p]:
+                return p == priority and self._waiting[p][0] is ticket
+        return False
+
+    @contextmanager
+    def slot(self, priority: str = PRIORITY_INTERACTIVE):
+        """
+        申请一个推理名额，阻塞直到轮到该任务
+
+        Args:
+            priority: 任务优先级
+        """
+        start = time.monotonic()
+        ticket = _Ticket(start)
+
+        with self._cond:
+            self._waiting[priority].append(ticket)
+            metrics.set_queue_depth(priority, len(self._waiting[priority]))
+            try:
+                self._cond.wait_for(lambda: self._is_next(priority, ticket))
+            finally:
+                self._waiting[priority].remove(ticket)
+                metrics.set_queue_depth(priority, len(self._waiting[priority]))
+            self._active += 1
+            self._stats[priority].record(time.monotonic() - start)
+            # 队首变化后其他等待者可能已满足条件
+            self._cond.notify_all()
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def chunk_size_for(self, priority: str, total: int) -> int:
+        """批量任务按块执行，交互任务一次完成"""
+        return self.bulk_chunk_size if priority == PRIORITY_BULK else max(1, total)
+
+    def queue_delay_ms(self, priority: str = PRIORITY_INTERACTIVE) -> float:
+        """
+        当前排队延迟：优先级不低于 priority 的排队任务中最早一个已等待的时长（毫秒）
+
+        低优先级任务不会挡住高优先级任务，因此不计入。
+        """
+        now = time.monotonic()
+        oldest = now
+        with self._cond:
+            for p in PRIORITIES[:PRIORITIES.index(priority) + 1]:
+                if self._waiting[p]:
+                    oldest = min(oldest, self._waiting[p][0].start)
+        return (now - oldest) * 1000
+
+    def get_stats(self) -> Dict:
+        """获取各优先级的排队延迟统计"""
+        with self._cond:
+            return {
+                'concurrency': self.concurrency,
+                'active': self._active,
+                'bulk_chunk_size': self.bulk_chunk_size,
+                'classes': {
+                    p: self._stats[p].snapshot(len(self._waiting[p]))
+                    for p in PRIORITIES
+                },
+            }
@@ -0,0 +1,157 @@
+"""
+按请求的性能分析 - 分阶段耗时与可选的 torch.profiler / cProfile 采集
+
+仅在请求同时携带 X-Embedding-Profile 头和正确的 X-Admin-Token 时启用：
+- timing: 只返回分阶段耗时（Server-Timing 响应头）
+- torch: 额外用 torch.profiler 采集 Chrome trace，写入分析目录
+- cprofile: 额外用 cProfile 采集 Python 调用栈，写入分析目录
+"""
+
+import cProfile
+import hmac
+import json
+import os
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Embedding-Profile'
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+
+CAPTURE_TIMING = 'timing'
+CAPTURE_TORCH = 'torch'
+CAPTURE_CPROFILE = 'cprofile'
+CAPTURE_MODES = (CAPTURE_TIMING, CAPTURE_TORCH, CAPTURE_CPROFILE)
+
+
+class ProfileDenied(Exception):
+    """请求了性能分析但未通过鉴权（HTTP 403）"""
+
+
+def resolve_profile_mode(headers, admin_token: Optional[str]) -> Optional[str]:
+    """
+    解析性能分析请求
+
+    Args:
+        headers: 请求头
+        admin_token: 配置的管理员令牌，未配置时性能分析不可用
+
+    Returns:
+        采集模式，未请求性能分析时返回 None
+
+    Raises:
+        ProfileDenied: 未配置令牌或令牌不匹配
+        ValueError: 未知的采集模式
+    """
+    mode = headers.get(PROFILE_HEADER)
+    if not mode:
+        return None
+
+    token = headers.get(ADMIN_TOKEN_HEADER) or ''
+    if not admin_token or not hmac.compare_digest(token.encode(), admin_token.encode()):
+        raise ProfileDenied('Profiling requires a valid admin token')
+
+    mode = mode.lower()
+    if mode in ('1', 'true'):
+        return CAPTURE_TIMING
+    if mode not in CAPTURE_MODES:
+        raise ValueError(f"Invalid {PROFILE_HEADER}: {mode}. Available: {list(CAPTURE_MODES)}")
+    return mode
+
+
+class RequestProfile:
+    """单个请求的性能分析记录"""
+
+    def __init__(self, mode: str = CAPTURE_TIMING, output_dir: str = 'profiles'):
+        """
+        Args:
+            mode: 采集模式，见 CAPTURE_MODES
+            output_dir: trace / 摘要文件的输出目录
+        """
+        self.mode = mode
+        self.output_dir = output_dir
+        self.profile_id = uuid.uuid4().hex[:12]
+        self.stages: "OrderedDict[str, float]" = OrderedDict()
+        self.attributes: Dict = {}
+        self.trace_path: Optional[str] = None
+
+    def add(self, stage: str, seconds: float):
+        """累加一个阶段的耗时"""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        """阶段计时上下文"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    @contextmanager
+    def capture(self):
+        """按采集模式包裹推理过程，结束后把 trace 写入输出目录"""
+        if self.mode == CAPTURE_TORCH:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            with torch.profiler.profile(activities=activities, record_shapes=True) as prof:
+                yield
+            self.trace_path = self._output_path('trace.json')
+            prof.export_chrome_trace(self.trace_path)
+        elif self.mode == CAPTURE_CPROFILE:
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                yield
+            finally:
+                prof.disable()
+            self.trace_path = self._output_path('prof')
+            prof.dump_stats(self.trace_path)
+        else:
+            yield
+
+    def _output_path(self, suffix: str) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, f'{self.profile_id}.{suffix}')
+
+    def summary(self) -> Dict:
+        """分阶段耗时摘要（毫秒）"""
+        return {
+            'id': self.profile_id,
+            'mode': self.mode,
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            'trace': self.trace_path,
+            **self.attributes,
+        }
+
+    def save_summary(self) -> Optional[str]:
+        """采集了 trace 时，把摘要写到 trace 旁边便于离线对照"""
+        if self.trace_path is None:
+            return None
+        path = self._output_path('summary.json')
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        logger.info(f"Profile {self.profile_id} saved: {self.trace_path}")
+        return path
+
+    def response_headers(self) -> Dict[str, str]:
+        """
+        性能分析结果的响应头
+
+        Server-Timing 可直接在浏览器开发者工具中查看，各阶段单位为毫秒。
+        """
+        timing = ', '.join(
+            f'{name.replace(".", "-")};dur={seconds * 1000:.3f}' for name, seconds in self.stages.items()
+        )
+        headers = {'Server-Timing': timing, 'X-Embedding-Profile-Id': self.profile_id}
+        if self.trace_path:
+            headers['X-Embedding-Profile-Trace'] = os.path.basename(self.trace_path)
+        return headers
@@ -0,0 +1,81 @@
+"""
+紧凑输出格式 - float16 与逐向量 int8 量化
+
+在 L2 归一化之后对最终嵌入做表示转换，用于缩小响应体和下游存储（如 pgvector）：
+- float32: 默认，不转换
+- float16: 每维 2 字节，归一化向量的分量在 [-1, 1]，相对误差约 1e-3
+- int8: 每维 1 字节，逐向量非对称量化，q = round(x / scale) + zero_point，
+        反量化 x ≈ (q - zero_point) * scale；scale 与 zero_point 随向量一起返回
+
+排序几乎不受影响：余弦相似度由所有维度累加得到，单维的舍入误差相互抵消。
+"""
+
+import logging
+from typing import Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FLOAT32 = 'float32'
+OUTPUT_FLOAT16 = 'float16'
+OUTPUT_INT8 = 'int8'
+OUTPUT_FORMATS = (OUTPUT_FLOAT32, OUTPUT_FLOAT16, OUTPUT_INT8)
+
+_INT8_MIN, _INT8_MAX = -128, 127
+
+
+def parse_output_format(value) -> str:
+    """
+    解析 output_format 请求参数（None 表示 float32）
+
+    Raises:
+        ValueError: 不支持的格式
+    """
+    if value is None:
+        return OUTPUT_FLOAT32
+    output_format = str(value).strip().lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output_format: {value}. Available: {list(OUTPUT_FORMATS)}")
+    return output_format
+
+
+def quantize_int8(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    逐向量 int8 量化（每个向量的最小值、最大值映射到 -128、127）
+
+    Args:
+        embeddings: (dim,) 或 (N, dim)
+
+    Returns:
+        (int8 向量, scale float32, zero_point int32)，scale 与 zero_point 为标量（单个向量）或 (N,)
+    """
+    single = embeddings.ndim == 1
+    x = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+
+    low = x.min(axis=1)
+    high = x.max(axis=1)
+    # 值域扩展到包含 0，保证 zero_point 落在 int8 范围内（正负分量都有的向量不受影响）
+    low = np.minimum(low, 0.0)
+    high = np.maximum(high, 0.0)
+    scale = (high - low) / (_INT8_MAX - _INT8_MIN)
+    scale[scale == 0] = 1.0
+    zero_point = np.clip(np.round(_INT8_MIN - low / scale), _INT8_MIN, _INT8_MAX).astype(np.int32)
+
+    q = np.round(x / scale[:, None]) + zero_point[:, None]
+    q = np.clip(q, _INT8_MIN, _INT8_MAX).astype(np.int8)
+    scale = scale.astype(np.float32)
+
+    if single:
+        return q[0], scale[0], zero_point[0]
+    return q, scale, zero_point
+
+
+def dequantize_int8(q: np.ndarray, scale, zero_point) -> np.ndarray:
+    """quantize_int8 的逆变换，返回 float32"""
+    q = np.asarray(q, dtype=np.float32)
+    scale = np.asarray(scale, dtype=np.float32)
+    zero_point = np.asarray(zero_point, dtype=np.float32)
+    if q.ndim == 2:
+        scale, zero_point = scale[:, None], zero_point[:, None]
+    return (q - zero_point) * scale
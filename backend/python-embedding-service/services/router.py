@@ -0,0 +1,481 @@
+"""
+多副本路由 - 按文本一致性哈希把批量请求拆分到各副本并行执行，再按原顺序合并
+
+同一文本总是落在同一副本上，各副本的文本嵌入缓存互不重叠，整体命中率随副本数增加而不下降。
+副本不可用（连接失败、503 未就绪、502）时立即移出哈希环，其分片按新的哈希环重新分配；
+后台健康检查恢复后再加入，只有约 1/N 的文本改变归属。
+"""
+
+import http.client
+import itertools
+import json
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from services.admission import DeadlineExceeded, TIMEOUT_HEADER
+from services.degradation import DEGRADE_HEADER, MODE_ANY, MODE_AUTO, NOT_DEGRADED, STEPS
+from services.hash_ring import ConsistentHashRing
+from services.priority_scheduler import PRIORITY_HEADER
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# 转发给副本的客户端请求头（截止时间按剩余时间重新计算，优先级和降级程度由路由统一决定）
+_PASSTHROUGH_HEADERS = ('Accept', 'X-Embedding-Dtype', DEGRADE_HEADER, PRIORITY_HEADER)
+
+# 副本返回这些状态码时视为不可用，分片改发其他副本
+_UNAVAILABLE_STATUS = (502, 503)
+
+
+class ReplicaUnavailable(Exception):
+    """副本无法处理请求（连接失败或未就绪）"""
+
+
+class UpstreamError(Exception):
+    """副本返回的错误响应，原样转发给客户端"""
+
+    def __init__(self, status: int, body: bytes, content_type: str = 'application/json', headers: Dict = None):
+        super().__init__(f'Upstream returned {status}')
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+    @classmethod
+    def from_message(cls, status: int, message: str) -> 'UpstreamError':
+        return cls(status, json.dumps({'error': message}).encode('utf-8'))
+
+
+class Replica:
+    """一个嵌入服务副本（HTTP）"""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url if '://' in url else f'http://{url}')
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported replica URL: {url}")
+        self.url = f'{parts.scheme}://{parts.netloc}'
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+
+        self.healthy = False
+        self.requests = 0
+        self.items = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def connect(self, timeout: float) -> http.client.HTTPConnection:
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=timeout)
+
+    def get_stats(self) -> Dict:
+        return {
+            'healthy': self.healthy,
+            'requests': self.requests,
+            'items': self.items,
+            'failures': self.failures,
+            'last_error': self.last_error,
+        }
+
+
+class EmbeddingRouter:
+    """
+    一致性哈希路由（阻塞接口，由 router_app.py 在线程池中调用）
+
+    副本连接按线程复用（keep-alive），并发请求副本的线程数由 max_connections 限制。
+    """
+
+    def __init__(self,
+                 replicas: List[str],
+                 vnodes: int = 160,
+                 timeout: float = 30.0,
+                 max_connections: int = 32):
+        """
+        初始化路由
+
+        Args:
+            replicas: 副本地址列表，如 http://embedding-1:5001
+            vnodes: 每个副本的虚拟节点数
+            timeout: 请求副本的超时（秒），请求带截止时间时取两者中较小者
+            max_connections: 并发请求副本的线程数
+        """
+        if not replicas:
+            raise ValueError("At least one replica is required")
+
+        self.replicas: Dict[str, Replica] = {}
+        for url in replicas:
+            replica = Replica(url)
+            self.replicas[replica.url] = replica
+        self.timeout = timeout
+
+        # 只包含健康的副本，首次健康检查前为空
+        self.ring = ConsistentHashRing(vnodes=vnodes)
+
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_connections), thread_name_prefix='router')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+
+    # ------------------------------------------------------------------
+    # 副本成员管理
+    # ------------------------------------------------------------------
+
+    def mark_up(self, url: str):
+        replica = self.replicas[url]
+        replica.healthy = True
+        self.ring.add(url)
+
+    def mark_down(self, url: str, reason: str):
+        replica = self.replicas[url]
+        with self._lock:
+            replica.failures += 1
+            replica.last_error = reason
+        if replica.healthy:
+            logger.warning(f"Replica {url} unavailable: {reason}")
+        replica.healthy = False
+        self.ring.remove(url)
+
+    def check_health(self):
+        """检查全部副本的就绪状态并更新哈希环（并行执行）"""
+        def probe(replica: Replica):
+            try:
+                status, _, body = self._request(replica, 'GET', '/health/ready', timeout=min(self.timeout, 5.0))
+            except ReplicaUnavailable as e:
+                return replica, str(e)
+            if status != 200:
+                return replica, f'/health/ready returned {status}'
+            return replica, None
+
+        for replica, error in self._pool.map(probe, list(self.replicas.values())):
+            if error is None:
+                if not replica.healthy:
+                    logger.info(f"Replica {replica.url} is ready")
+                self.mark_up(replica.url)
+            else:
+                self.mark_down(replica.url, error)
+
+    def is_ready(self) -> bool:
+        return len(self.ring) > 0
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    def _connection(self, replica: Replica, timeout: float) -> http.client.HTTPConnection:
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get(replica.url)
+        if conn is None:
+            conn = connections[replica.url] = replica.connect(timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def _drop_connection(self, replica: Replica):
+        conn = self._local.connections.pop(replica.url, None)
+        if conn is not None:
+            conn.close()
+
+    def _request(self,
+                 replica: Replica,
+                 method: str,
+                 path: str,
+                 body: bytes = None,
+                 headers: Dict[str, str] = None,
+                 timeout: float = None) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        向副本发送请求（复用本线程的连接，连接被对端关闭时重连一次）
+
+        Raises:
+            ReplicaUnavailable: 连接失败、超时或 502/503
+        """
+        timeout = timeout or self.timeout
+        for attempt in (0, 1):
+            conn = self._connection(replica, timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                # keep-alive 连接已被对端关闭：重连重试一次（请求无副作用，可安全重发）
+                self._drop_connection(replica)
+                if attempt == 0:
+                    continue
+                raise ReplicaUnavailable(f'{type(e).__name__}: {e}')
+            except (OSError, http.client.HTTPException) as e:
+                self._drop_connection(replica)
+                raise ReplicaUnavailable(f'{type(e).__name__}: {e}')
+
+            if response.will_close:
+                self._drop_connection(replica)
+            if response.status in _UNAVAILABLE_STATUS:
+                raise ReplicaUnavailable(f'HTTP {response.status}')
+            return response.status, {k.lower(): v for k, v in response.getheaders()}, data
+
+        raise AssertionError('unreachable')
+
+    # ------------------------------------------------------------------
+    # 路由
+    # ------------------------------------------------------------------
+
+    def _request_timeout(self, deadline: Optional[float]) -> float:
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return min(self.timeout, remaining)
+
+    @staticmethod
+    def _forward_headers(headers, deadline: Optional[float]) -> Dict[str, str]:
+        forwarded = {name: headers[name] for name in _PASSTHROUGH_HEADERS if headers.get(name)}
+        if deadline is not None:
+            forwarded[TIMEOUT_HEADER] = f'{max(0.0, deadline - time.monotonic()) * 1000:.0f}'
+        return forwarded
+
+    def forward(self,
+                method: str,
+                path: str,
+                body: bytes,
+                headers,
+                key: Optional[str] = None,
+                deadline: Optional[float] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        把整个请求转发给一个副本（响应原样返回）
+
+        Args:
+            key: 路由键（文本），为 None 时在健康副本间轮询
+            deadline: 截止时间（time.monotonic() 时间轴）
+
+        Raises:
+            UpstreamError: 没有可用副本
+        """
+        forwarded = self._forward_headers(headers, deadline)
+        if body is not None:
+            forwarded['Content-Type'] = 'application/json'
+
+        for _ in range(len(self.replicas)):
+            if key is not None:
+                url = self.ring.node_for(key)
+            else:
+                nodes = self.ring.nodes
+                url = nodes[next(self._round_robin) % len(nodes)] if nodes else None
+            if url is None:
+                break
+
+            replica = self.replicas[url]
+            try:
+                result = self._request(replica, method, path, body, forwarded, self._request_timeout(deadline))
+            except ReplicaUnavailable as e:
+                self.mark_down(url, str(e))
+                continue
+            with self._lock:
+                replica.requests += 1
+            return result
+
+        raise UpstreamError.from_message(503, 'No embedding replica available')
+
+    def _post_shard(self,
+                    replica: Replica,
+                    path: str,
+                    payload: Dict,
+                    headers: Dict[str, str],
+                    deadline: Optional[float]) -> Dict:
+        """发送一个分片，返回解码后的响应（embeddings 为 float32 数组）"""
+        headers = dict(headers)
+        headers['Content-Type'] = 'application/json'
+        headers['Accept'] = 'application/msgpack' if msgpack is not None else 'application/json'
+        headers.pop('X-Embedding-Dtype', None)
+        if deadline is not None:
+            headers[TIMEOUT_HEADER] = f'{max(0.0, deadline - time.monotonic()) * 1000:.0f}'
+
+        status, response_headers, data = self._request(
+            replica, 'POST', path, json.dumps(payload, ensure_ascii=False).encode('utf-8'), headers,
+            self._request_timeout(deadline),
+        )
+        with self._lock:
+            replica.requests += 1
+            replica.items += len(payload['items'])
+        if status != 200:
+            passthrough = {k: v for k, v in response_headers.items() if k == 'retry-after'}
+            raise UpstreamError(status, data, response_headers.get('content-type', 'application/json'), passthrough)
+
+        if response_headers.get('content-type', '').startswith('application/msgpack'):
+            result = msgpack.unpackb(data, raw=False)
+            dtype = np.dtype(result.get('dtype', 'float32')).newbyteorder('<')
+
+            def decode(buffer, shape):
+                return np.frombuffer(buffer, dtype=dtype).reshape(shape).astype(np.float32, copy=False)
+
+            if isinstance(result['embeddings'], dict):
+                # /embed_multi：{版本: 字节}，形状在 shapes 中
+                result['embeddings'] = {
+                    version: decode(buffer, result['shapes'][version])
+                    for version, buffer in result['embeddings'].items()
+                }
+            else:
+                result['embeddings'] = decode(result['embeddings'], result['shape'])
+        else:
+            result = json.loads(data)
+            if isinstance(result['embeddings'], dict):
+                result['embeddings'] = {
+                    version: np.asarray(array, dtype=np.float32) for version, array in result['embeddings'].items()
+                }
+            else:
+                result['embeddings'] = np.asarray(result['embeddings'], dtype=np.float32)
+        return result
+
+    def fan_out(self,
+                path: str,
+                items: List[Dict],
+                body: Dict,
+                headers,
+                priority: str,
+                deadline: Optional[float] = None) -> Tuple[Union[np.ndarray, Dict[str, np.ndarray]], Dict]:
+        """
+        按条目文本分片并行请求各副本，按原顺序合并
+
+        Args:
+            path: /embed_batch、/embed_features 或 /embed_multi
+            items: 请求的条目列表
+            body: 请求体中 items 之外的字段（如 version）
+            headers: 客户端请求头
+            priority: 按整批条数解析出的优先级（各分片条数较少，不能让副本自行判断）
+            deadline: 截止时间（time.monotonic() 时间轴）
+
+        Returns:
+            (嵌入数组 (N, dim)，/embed_multi 为 {版本: 嵌入数组}; 元数据)
+
+        Raises:
+            UpstreamError: 副本返回错误，或没有可用副本
+            DeadlineExceeded: 已超过截止时间
+        """
+        forwarded = self._forward_headers(headers, None)
+        forwarded[PRIORITY_HEADER] = priority
+        # 各分片可能在不同副本上触发 version_fallback，合并后维度不一致，拆分时只允许不改变向量空间的步骤
+        if forwarded.get(DEGRADE_HEADER, '').lower() == MODE_ANY:
+            forwarded[DEGRADE_HEADER] = MODE_AUTO
+
+        texts = [item.get('text') or '' for item in items]
+        pending = list(range(len(items)))
+        parts: List[Tuple[List[int], Dict]] = []
+
+        for _ in range(len(self.replicas) + 1):
+            shards = self.ring.assign([texts[i] for i in pending])
+            if not shards:
+                break
+
+            futures = {
+                url: (
+                    [pending[j] for j in positions],
+                    self._pool.submit(
+                        self._post_shard, self.replicas[url], path,
+                        {**body, 'items': [items[pending[j]] for j in positions]},
+                        forwarded, deadline,
+                    ),
+                )
+                for url, positions in shards.items()
+            }
+
+            failed: List[int] = []
+            error: Optional[Exception] = None
+            for url, (indices, future) in futures.items():
+                try:
+                    parts.append((indices, future.result()))
+                except ReplicaUnavailable as e:
+                    self.mark_down(url, str(e))
+                    failed.extend(indices)
+                except (UpstreamError, DeadlineExceeded) as e:
+                    error = error or e
+            if error is not None:
+                raise error
+
+            pending = sorted(failed)
+            if not pending:
+                if isinstance(parts[0][1]['embeddings'], dict):
+                    return self._merge_multi(len(items), parts)
+                return self._merge(len(items), parts)
+
+        raise UpstreamError.from_message(503, 'No embedding replica available')
+
+    @staticmethod
+    def _merge(count: int, parts: List[Tuple[List[int], Dict]]) -> Tuple[np.ndarray, Dict]:
+        versions = {result.get('version') for _, result in parts}
+        dimensions = {result['embeddings'].shape[1] for _, result in parts}
+        if len(versions) > 1 or len(dimensions) > 1:
+            raise UpstreamError.from_message(
+                502, f'Replicas returned inconsistent results (versions: {sorted(map(str, versions))})'
+            )
+
+        embeddings = np.empty((count, dimensions.pop()), dtype=np.float32)
+        fingerprints: List[Optional[str]] = [None] * count
+        steps = set()
+        text_encoded = 0
+        for indices, result in parts:
+            embeddings[indices] = result['embeddings']
+            for i, fingerprint in zip(indices, result.get('fingerprints') or []):
+                fingerprints[i] = fingerprint
+            label = result.get('degradation', NOT_DEGRADED)
+            if label != NOT_DEGRADED:
+                steps.update(label.split(','))
+            text_encoded += result.get('text_encoded', 0)
+
+        metadata = {
+            'count': count,
+            'dimension': embeddings.shape[1],
+            'version': versions.pop(),
+        }
+        if any('degradation' in result for _, result in parts):
+            metadata['degradation'] = ','.join(step for step in STEPS if step in steps) or NOT_DEGRADED
+        if any('text_encoded' in result for _, result in parts):
+            metadata['text_encoded'] = text_encoded
+        metadata['fingerprints'] = fingerprints
+        metadata['shards'] = len(parts)
+        return embeddings, metadata
+
+    @staticmethod
+    def _merge_multi(count: int, parts: List[Tuple[List[int], Dict]]) -> Tuple[Dict[str, np.ndarray], Dict]:
+        versions = list(parts[0][1]['embeddings'])
+        embeddings: Dict[str, np.ndarray] = {}
+        fingerprints: Dict[str, List[Optional[str]]] = {}
+        for version in versions:
+            dimensions = {result['embeddings'][version].shape[1] for _, result in parts}
+            if len(dimensions) > 1:
+                raise UpstreamError.from_message(502, f'Replicas returned inconsistent dimensions for {version}')
+            merged = embeddings[version] = np.empty((count, dimensions.pop()), dtype=np.float32)
+            fingerprints[version] = [None] * count
+            for indices, result in parts:
+                merged[indices] = result['embeddings'][version]
+                for i, fingerprint in zip(indices, (result.get('fingerprints') or {}).get(version) or []):
+                    fingerprints[version][i] = fingerprint
+
+        return embeddings, {
+            'count': count,
+            'dimensions': {version: array.shape[1] for version, array in embeddings.items()},
+            'versions': versions,
+            'fingerprints': fingerprints,
+            'shards': len(parts),
+        }
+
+    def get_stats(self) -> Dict:
+        """获取路由统计"""
+        with self._lock:
+            return {
+                'ring_size': len(self.ring),
+                'replicas': {url: replica.get_stats() for url, replica in self.replicas.items()},
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
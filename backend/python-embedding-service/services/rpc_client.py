@@ -0,0 +1,210 @@
+"""
+二进制 RPC 客户端 - 协议见 services/rpc_protocol.py
+"""
+
+import itertools
+import socket
+import threading
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.rpc_protocol import (
+    METHOD_CHECK_STALE, METHOD_EMBED_BATCH, METHOD_EMBED_FEATURES, METHOD_EMBED_MULTI, METHOD_HEALTH, METHOD_MODELS, RPCError,
+    decode_payload, decode_tensor, encode_frame, encode_tensor, recv_frame,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingRPCClient:
+    """
+    同步 RPC 客户端（单连接，线程安全，调用串行执行）
+
+    Args:
+        socket_path: Unix socket 路径；为空时使用 host/port 连接 TCP
+        host: TCP 主机
+        port: TCP 端口
+        timeout: 套接字超时（秒）
+    """
+
+    def __init__(self,
+                 socket_path: Optional[str] = None,
+                 host: str = '127.0.0.1',
+                 port: int = 5002,
+                 timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _connect(self) -> socket.socket:
+        if self.socket_path:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        else:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def call(self, method: str, params: Dict = None) -> Dict:
+        """
+        发起一次调用
+
+        Raises:
+            RPCError: 服务端返回错误
+            ConnectionError: 连接异常（连接会被关闭，下次调用时重连）
+        """
+        request_id = next(self._ids)
+        frame = encode_frame({'id': request_id, 'method': method, 'params': params or {}})
+
+        with self._lock:
+            if self._sock is None:
+                self._sock = self._connect()
+            try:
+                self._sock.sendall(frame)
+                response = decode_payload(recv_frame(self._sock))
+            except (OSError, ConnectionError):
+                self.close()
+                raise
+
+        if response.get('id') != request_id:
+            self.close()
+            raise ConnectionError(f"Unexpected response id: {response.get('id')} (expected {request_id})")
+
+        error = response.get('error')
+        if error:
+            error = dict(error)
+            raise RPCError(error.pop('code', 500), error.pop('message', 'RPC error'), **error)
+        return response['result']
+
+    def embed_batch(self,
+                    texts: List[str],
+                    features_list: List[Dict] = None,
+                    version: str = None,
+                    priority: str = None,
+                    timeout_ms: float = None) -> np.ndarray:
+        """
+        批量生成嵌入，参数含义同 /embed_batch
+
+        Returns:
+            嵌入向量数组 (N, dim)，float32
+        """
+        params = {'texts': list(texts)}
+        if features_list is not None:
+            params['features'] = list(features_list)
+        if version:
+            params['version'] = version
+        if priority:
+            params['priority'] = priority
+        if timeout_ms is not None:
+            params['timeout_ms'] = timeout_ms
+
+        result = self.call(METHOD_EMBED_BATCH, params)
+        return decode_tensor(result['embeddings'], result['shape'])
+
+    def embed_features(self,
+                       features_list: List[Dict],
+                       text_embeddings: np.ndarray = None,
+                       texts: List[Optional[str]] = None,
+                       version: str = None,
+                       priority: str = None,
+                       timeout_ms: float = None) -> np.ndarray:
+        """
+        只更新数值特征的批量刷新，参数含义同 /embed_features
+
+        Args:
+            text_embeddings: 之前计算的文本向量 (N, text_dim)
+            texts: 文本列表，从服务端文本缓存 / 持久化存储取向量（与 text_embeddings 至少提供一个）
+
+        Returns:
+            嵌入向量数组 (N, dim)，float32
+        """
+        params = {'features': list(features_list)}
+        if text_embeddings is not None:
+            params['text_embeddings'], params['shape'] = encode_tensor(np.asarray(text_embeddings))
+        if texts is not None:
+            params['texts'] = list(texts)
+        if version:
+            params['version'] = version
+        if priority:
+            params['priority'] = priority
+        if timeout_ms is not None:
+            params['timeout_ms'] = timeout_ms
+
+        result = self.call(METHOD_EMBED_FEATURES, params)
+        return decode_tensor(result['embeddings'], result['shape'])
+
+    def embed_multi(self,
+                    texts: List[str],
+                    features_list: List[Dict],
+                    versions: List[str],
+                    priority: str = None,
+                    timeout_ms: float = None) -> Dict[str, np.ndarray]:
+        """
+        同一批输入同时生成多个版本的嵌入，参数含义同 /embed_multi
+
+        Returns:
+            {版本: 嵌入向量数组 (N, dim)}，float32
+        """
+        params = {'texts': list(texts), 'features': list(features_list), 'versions': list(versions)}
+        if priority:
+            params['priority'] = priority
+        if timeout_ms is not None:
+            params['timeout_ms'] = timeout_ms
+
+        result = self.call(METHOD_EMBED_MULTI, params)
+        return {
+            version: decode_tensor(data, result['shapes'][version])
+            for version, data in result['embeddings'].items()
+        }
+
+    def check_stale(self,
+                    ids: List,
+                    fingerprints: List[Optional[str]],
+                    texts: List[str],
+                    features_list: List[Dict],
+                    version: str = None) -> List:
+        """
+        批量判断哪些条目需要重新计算嵌入，参数含义同 /check_stale
+
+        Returns:
+            嵌入会发生变化的条目 ID
+        """
+        params = {
+            'ids': list(ids),
+            'fingerprints': list(fingerprints),
+            'texts': list(texts),
+            'features': list(features_list),
+        }
+        if version:
+            params['version'] = version
+        return self.call(METHOD_CHECK_STALE, params)['stale']
+
+    def models(self) -> Dict:
+        """获取模型信息，同 /models"""
+        return self.call(METHOD_MODELS)
+
+    def health(self) -> Dict:
+        """健康检查"""
+        return self.call(METHOD_HEALTH)
+
+    def close(self):
+        """关闭连接"""
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,123 @@
+"""
+二进制 RPC 协议 - 同机部署时替代 HTTP+JSON 的低开销传输
+
+帧格式：
+    <length:uint32 BE><msgpack payload>
+
+请求：
+    {"id": 1, "method": "embed_batch", "params": {...}}
+
+响应：
+    {"id": 1, "result": {...}}
+    {"id": 1, "error": {"code": 429, "message": "...", "retry_after": 1}}
+
+错误码沿用 HTTP 状态码语义（400 / 413 / 429 / 500 / 503 / 504），便于调用方
+复用现有的重试逻辑。同一连接上可以连续发送多个请求（流水线），响应可能乱序，
+调用方按 id 匹配。
+
+嵌入向量以小端 float32 原始字节传输（"embeddings" 字段），形状在 "shape" 字段。
+"""
+
+import asyncio
+import socket
+import struct
+import logging
+from typing import Dict, Tuple
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('>I')
+
+METHOD_EMBED_BATCH = 'embed_batch'
+METHOD_EMBED_FEATURES = 'embed_features'
+METHOD_EMBED_MULTI = 'embed_multi'
+METHOD_CHECK_STALE = 'check_stale'
+METHOD_MODELS = 'models'
+METHOD_HEALTH = 'health'
+
+TENSOR_DTYPE = np.dtype('<f4')
+
+
+class RPCError(Exception):
+    """RPC 调用失败，code 与 HTTP 状态码含义相同"""
+
+    def __init__(self, code: int, message: str, **details):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.details = details
+
+    def to_dict(self) -> Dict:
+        return {'code': self.code, 'message': self.message, **self.details}
+
+
+def _require_msgpack():
+    if msgpack is None:
+        raise RuntimeError("msgpack is required for the RPC transport")
+
+
+def encode_frame(payload: Dict) -> bytes:
+    """将消息编码为带长度前缀的帧"""
+    _require_msgpack()
+    body = msgpack.packb(payload, use_bin_type=True)
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def decode_payload(body: bytes) -> Dict:
+    """解码帧内容"""
+    _require_msgpack()
+    payload = msgpack.unpackb(body, raw=False)
+    if not isinstance(payload, dict):
+        raise RPCError(400, 'Frame payload must be a map')
+    return payload
+
+
+def encode_tensor(array: np.ndarray) -> Tuple[bytes, list]:
+    """将嵌入数组编码为 (小端 float32 字节, 形状)"""
+    out = np.ascontiguousarray(array, dtype=TENSOR_DTYPE)
+    return out.tobytes(), list(out.shape)
+
+
+def decode_tensor(data: bytes, shape: list) -> np.ndarray:
+    """从原始字节恢复嵌入数组（零拷贝，只读）"""
+    return np.frombuffer(data, dtype=TENSOR_DTYPE).reshape(shape)
+
+
+async def read_frame(reader: asyncio.StreamReader, max_bytes: int) -> bytes:
+    """
+    读取一帧
+
+    Raises:
+        asyncio.IncompleteReadError: 连接在帧中途关闭（或在帧之间正常关闭）
+        RPCError: 帧超过大小上限（413）
+    """
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > max_bytes:
+        raise RPCError(413, f'Frame too large: {length} bytes', max_body_bytes=max_bytes)
+    return await reader.readexactly(length)
+
+
+def recv_frame(sock: socket.socket) -> bytes:
+    """阻塞读取一帧（客户端使用）"""
+    (length,) = FRAME_HEADER.unpack(_recv_exactly(sock, FRAME_HEADER.size))
+    return _recv_exactly(sock, length)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError('Connection closed by server')
+        received += n
+    return bytes(buffer)
@@ -0,0 +1,393 @@
+"""
+响应序列化 - 基于 Accept 头的内容协商
+
+支持的响应格式：
+- application/json: 默认格式，优先使用 orjson 直接序列化 NumPy 数组
+- application/octet-stream: 原始小端 float32/float16 缓冲区，形状和类型放在响应头
+- application/x-npy: NumPy .npy 格式
+- application/msgpack: msgpack 编码，向量以二进制缓冲区传输
+
+/embed 与 /embed_batch 的 output_format 参数（见 services/quantization.py）在编码前转换向量：
+float16 适用于所有格式；int8 附带 scale / zero_point（批量时为逐条列表，只能放在 JSON / msgpack 中）。
+
+流式接口（/embed_stream）支持：
+- application/x-ndjson: 每行一个 {"index": i, "embedding": [...]}
+- application/octet-stream: 二进制帧序列，每帧为 <rows:uint32><dim:uint32> 头 + 行优先数据
+
+两种格式都以结束记录收尾（成功和失败时都发送），客户端据此区分完整的流与中途断开的流：
+- NDJSON: 最后一行为 {"done": true, "count": n}，出错时为 {"error": "...", "count": n}
+- 二进制: rows=0 的结束帧，dim 为其后 UTF-8 JSON 载荷的字节数，载荷同 NDJSON 的结束行
+n 为结束前已返回的条数；没有结束记录的流视为不完整。
+"""
+
+import io
+import json
+import logging
+import struct
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+from flask import Response
+from werkzeug.datastructures import MIMEAccept
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+from services import metrics
+from services.metrics import STAGE_SERIALIZE
+from services.quantization import OUTPUT_FLOAT16, OUTPUT_FLOAT32, OUTPUT_INT8, parse_output_format, quantize_int8
+
+logger = logging.getLogger(__name__)
+
+FORMAT_JSON = 'application/json'
+FORMAT_BINARY = 'application/octet-stream'
+FORMAT_NPY = 'application/x-npy'
+FORMAT_MSGPACK = 'application/msgpack'
+FORMAT_NDJSON = 'application/x-ndjson'
+
+# msgpack 常见的两种 MIME 写法都接受
+_MSGPACK_ALIASES = ('application/msgpack', 'application/x-msgpack')
+
+# 二进制格式支持的输出类型（统一小端序）
+SUPPORTED_DTYPES = {
+    'float32': np.dtype('<f4'),
+    'float16': np.dtype('<f2'),
+}
+
+# output_format 产生的类型（int8 需附带 scale / zero_point，不能通过 X-Embedding-Dtype 直接请求）
+_OUTPUT_DTYPES = {**SUPPORTED_DTYPES, 'int8': np.dtype('i1')}
+
+DTYPE_HEADER = 'X-Embedding-Dtype'
+
+# 流式二进制帧头：行数、维度（小端 uint32）；rows=0 为结束帧，dim 为结束载荷的字节数
+STREAM_FRAME_HEADER = struct.Struct('<II')
+
+
+def get_supported_formats() -> list:
+    """获取当前环境可用的响应格式"""
+    formats = [FORMAT_JSON, FORMAT_BINARY, FORMAT_NPY]
+    if msgpack is not None:
+        formats.extend(_MSGPACK_ALIASES)
+    return formats
+
+
+def negotiate_format(accept_mimetypes) -> str:
+    """
+    根据 Accept 头选择响应格式
+
+    Args:
+        accept_mimetypes: werkzeug 的 MIMEAccept 对象（request.accept_mimetypes）
+
+    Returns:
+        选定的格式，无法匹配时回退到 JSON
+    """
+    # 未指定或接受任意类型时保持原有 JSON 行为
+    if not accept_mimetypes or accept_mimetypes.best == '*/*':
+        return FORMAT_JSON
+
+    # 去掉 dtype 等媒体类型参数后再匹配，参数由 resolve_dtype 处理
+    accept_mimetypes = MIMEAccept([(value.split(';')[0].strip(), quality) for value, quality in accept_mimetypes])
+    best = accept_mimetypes.best_match(get_supported_formats(), default=FORMAT_JSON)
+    if best in _MSGPACK_ALIASES:
+        return FORMAT_MSGPACK
+    return best
+
+
+def negotiate_stream_format(accept_mimetypes) -> str:
+    """根据 Accept 头选择流式响应格式（NDJSON 或二进制帧），默认 NDJSON"""
+    if not accept_mimetypes or accept_mimetypes.best == '*/*':
+        return FORMAT_NDJSON
+
+    accept_mimetypes = MIMEAccept([(value.split(';')[0].strip(), quality) for value, quality in accept_mimetypes])
+    return accept_mimetypes.best_match([FORMAT_NDJSON, FORMAT_BINARY], default=FORMAT_NDJSON)
+
+
+def resolve_dtype(headers) -> str:
+    """
+    解析二进制格式的输出类型
+
+    优先读取 X-Embedding-Dtype 头，其次读取 Accept 中的 dtype 参数，
+    例如 `Accept: application/octet-stream; dtype=float16`。
+
+    Raises:
+        ValueError: 不支持的类型
+    """
+    dtype = headers.get(DTYPE_HEADER)
+    if not dtype:
+        for part in headers.get('Accept', '').split(';')[1:]:
+            key, _, value = part.strip().partition('=')
+            if key == 'dtype':
+                dtype = value.split(',')[0].strip()
+                break
+
+    dtype = (dtype or 'float32').lower()
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype: {dtype}. Available: {list(SUPPORTED_DTYPES.keys())}")
+    return dtype
+
+
+def resolve_output_format(value, fmt: str, batch: bool) -> str:
+    """
+    解析 output_format 请求参数并检查与响应格式的组合
+
+    Raises:
+        ValueError: 不支持的格式；批量 int8 请求了 octet-stream / x-npy（逐条 scale 无处存放）
+    """
+    output_format = parse_output_format(value)
+    if output_format == OUTPUT_INT8 and batch and fmt in (FORMAT_BINARY, FORMAT_NPY):
+        raise ValueError("output_format int8 for batches requires a JSON or msgpack response (per-vector scales)")
+    return output_format
+
+
+def apply_output_format(array: np.ndarray, metadata: Dict, output_format: str) -> Tuple[np.ndarray, Dict]:
+    """
+    按 output_format 转换嵌入（L2 归一化之后），int8 的 scale / zero_point 加入元数据
+
+    单个向量的元数据为 scale、zero_point，批量为 scales、zero_points 列表。
+    """
+    if output_format == OUTPUT_FLOAT32:
+        return array, metadata
+    metadata = {**metadata, 'output_format': output_format}
+    if output_format == OUTPUT_FLOAT16:
+        return array.astype(np.float16), metadata
+
+    q, scale, zero_point = quantize_int8(array)
+    if array.ndim == 1:
+        metadata.update({'scale': float(scale), 'zero_point': int(zero_point)})
+    else:
+        metadata.update({'scales': scale.tolist(), 'zero_points': zero_point.tolist()})
+    return q, metadata
+
+
+def encode_embeddings(array: np.ndarray,
+                      field: str,
+                      metadata: Dict,
+                      fmt: str = FORMAT_JSON,
+                      dtype: Optional[str] = None,
+                      output_format: str = OUTPUT_FLOAT32) -> Tuple[bytes, str, Dict[str, str]]:
+    """
+    将嵌入数组编码为响应体（与 Web 框架无关）
+
+    Args:
+        array: 嵌入向量 (dim,) 或 (N, dim)
+        field: JSON/msgpack 中存放向量的字段名（embedding 或 embeddings）
+        metadata: 附加的元数据（dimension、version 等）
+        fmt: 响应格式，见 negotiate_format
+        dtype: 二进制格式的输出类型（float32/float16），output_format 不是 float32 时以其为准
+        output_format: 向量表示（float32/float16/int8），见 resolve_output_format
+
+    Returns:
+        (body, mimetype, headers)
+    """
+    rows = 1 if array.ndim == 1 else len(array)
+    with metrics.stage_timer(STAGE_SERIALIZE, str(metadata.get('version', 'unknown')), rows):
+        array, metadata = apply_output_format(array, metadata, output_format)
+        if output_format != OUTPUT_FLOAT32:
+            dtype = output_format
+        return _encode_embeddings(array, field, metadata, fmt, dtype)
+
+
+def _encode_embeddings(array: np.ndarray,
+                       field: str,
+                       metadata: Dict,
+                       fmt: str,
+                       dtype: Optional[str]) -> Tuple[bytes, str, Dict[str, str]]:
+    if fmt == FORMAT_JSON:
+        return _dumps_json({field: array, **metadata}), FORMAT_JSON, {}
+
+    dtype_name = dtype or 'float32'
+    out = np.ascontiguousarray(array, dtype=_OUTPUT_DTYPES[dtype_name])
+
+    if fmt == FORMAT_MSGPACK:
+        payload = {
+            field: out.tobytes(),
+            'shape': list(out.shape),
+            'dtype': dtype_name,
+            **metadata,
+        }
+        return msgpack.packb(payload, use_bin_type=True), FORMAT_MSGPACK, {}
+
+    if fmt == FORMAT_NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, out, allow_pickle=False)
+        body = buffer.getvalue()
+    else:
+        body = out.tobytes()
+
+    headers = {
+        'X-Embedding-Shape': ','.join(str(s) for s in out.shape),
+        DTYPE_HEADER: dtype_name,
+    }
+    for key, value in metadata.items():
+        # 逐条目的元数据（如 fingerprints）放不进响应头，需要时请使用 JSON / msgpack
+        if isinstance(value, (list, tuple)):
+            continue
+        headers[f"X-Embedding-{key.replace('_', '-').title()}"] = str(value)
+    return body, fmt, headers
+
+
+def encode_multi_embeddings(arrays: Dict[str, np.ndarray],
+                            metadata: Dict,
+                            fmt: str = FORMAT_JSON,
+                            dtype: Optional[str] = None) -> Tuple[bytes, str, Dict[str, str]]:
+    """
+    将多个版本的嵌入编码为响应体（/embed_multi）
+
+    只支持 JSON 和 msgpack（octet-stream / x-npy 没有放多个数组的位置，退回 JSON）：
+    - JSON: {"embeddings": {"v2": [[...]], "v3": [[...]]}, ...}
+    - msgpack: {"embeddings": {"v2": <bytes>, ...}, "shapes": {"v2": [N, dim], ...}, "dtype": "float32", ...}
+
+    Args:
+        arrays: {版本: 嵌入向量 (N, dim)}
+        metadata: 附加的元数据
+        fmt: 响应格式，见 negotiate_format
+        dtype: msgpack 的输出类型（float32/float16）
+
+    Returns:
+        (body, mimetype, headers)
+    """
+    rows = len(next(iter(arrays.values()))) if arrays else 0
+    with metrics.stage_timer(STAGE_SERIALIZE, '+'.join(arrays), rows):
+        if fmt != FORMAT_MSGPACK:
+            return _dumps_json({'embeddings': arrays, **metadata}), FORMAT_JSON, {}
+
+        dtype_name = dtype or 'float32'
+        outs = {version: np.ascontiguousarray(array, dtype=SUPPORTED_DTYPES[dtype_name])
+                for version, array in arrays.items()}
+        payload = {
+            'embeddings': {version: out.tobytes() for version, out in outs.items()},
+            'shapes': {version: list(out.shape) for version, out in outs.items()},
+            'dtype': dtype_name,
+            **metadata,
+        }
+        return msgpack.packb(payload, use_bin_type=True), FORMAT_MSGPACK, {}
+
+
+def build_embedding_response(array: np.ndarray,
+                             field: str,
+                             metadata: Dict,
+                             fmt: str = FORMAT_JSON,
+                             dtype: Optional[str] = None,
+                             status: int = 200,
+                             output_format: str = OUTPUT_FLOAT32) -> Response:
+    """
+    将嵌入数组序列化为 Flask 响应
+
+    Args:
+        array: 嵌入向量 (dim,) 或 (N, dim)
+        field: JSON/msgpack 中存放向量的字段名（embedding 或 embeddings）
+        metadata: 附加的元数据（dimension、version 等）
+        fmt: 响应格式，见 negotiate_format
+        dtype: 二进制格式的输出类型（float32/float16）
+        status: HTTP 状态码
+        output_format: 向量表示（float32/float16/int8）
+
+    Returns:
+        Flask Response
+    """
+    body, mimetype, headers = encode_embeddings(array, field, metadata, fmt=fmt, dtype=dtype,
+                                                output_format=output_format)
+    return Response(body, status=status, mimetype=mimetype, headers=headers)
+
+
+def iter_ndjson(lines: Iterable[bytes]) -> Iterator[Dict]:
+    """
+    逐行解析 NDJSON 输入，跳过空行
+
+    Raises:
+        ValueError: 某一行不是 JSON 对象
+    """
+    for line_no, line in enumerate(lines, start=1):
+        item = parse_ndjson_line(line, line_no)
+        if item is not None:
+            yield item
+
+
+def parse_ndjson_line(line: bytes, line_no: int) -> Optional[Dict]:
+    """解析单行 NDJSON，空行返回 None"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        item = json.loads(line)
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON on line {line_no}: {e}")
+    if not isinstance(item, dict):
+        raise ValueError(f"Line {line_no} must be a JSON object")
+    return item
+
+
+def encode_stream_chunk(start_index: int,
+                        embeddings: np.ndarray,
+                        fmt: str = FORMAT_NDJSON,
+                        dtype: Optional[str] = None,
+                        version: str = 'unknown') -> bytes:
+    """
+    编码流式响应中的一个分块
+
+    Args:
+        start_index: 分块第一条在整个输入流中的序号
+        embeddings: 分块的嵌入 (n, dim)
+        fmt: FORMAT_NDJSON 或 FORMAT_BINARY
+        dtype: 二进制帧的输出类型
+        version: 模型版本（仅用于指标标签）
+
+    Returns:
+        可直接写入响应的字节串
+    """
+    with metrics.stage_timer(STAGE_SERIALIZE, version, len(embeddings)):
+        return _encode_stream_chunk(start_index, embeddings, fmt, dtype)
+
+
+def _encode_stream_chunk(start_index: int, embeddings: np.ndarray, fmt: str, dtype: Optional[str]) -> bytes:
+    if fmt == FORMAT_BINARY:
+        out = np.ascontiguousarray(embeddings, dtype=SUPPORTED_DTYPES[dtype or 'float32'])
+        return STREAM_FRAME_HEADER.pack(*out.shape) + out.tobytes()
+
+    return b''.join(
+        _dumps_json({'index': start_index + i, 'embedding': row}) + b'\n'
+        for i, row in enumerate(embeddings)
+    )
+
+
+def encode_stream_end(count: int, fmt: str = FORMAT_NDJSON, error: Optional[str] = None) -> bytes:
+    """
+    编码流的结束记录（NDJSON 结束行或二进制结束帧）
+
+    Args:
+        count: 已返回的条数
+        fmt: FORMAT_NDJSON 或 FORMAT_BINARY
+        error: 中途出错时的错误信息，None 表示全部处理完成
+    """
+    payload = {'error': error, 'count': count} if error is not None else {'done': True, 'count': count}
+    body = _dumps_json(payload)
+    if fmt == FORMAT_BINARY:
+        return STREAM_FRAME_HEADER.pack(0, len(body)) + body
+    return body + b'\n'
+
+
+def _dumps_json(payload: Dict) -> bytes:
+    """JSON 序列化：orjson 可直接处理 NumPy 数组，避免 tolist() 产生大量 Python 对象"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            # 非连续数组或不支持的 dtype，退回标准库路径
+            logger.debug("orjson could not serialize payload directly, falling back")
+
+    return json.dumps(_to_builtin(payload), ensure_ascii=False).encode('utf-8')
+
+
+def _to_builtin(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {k: _to_builtin(v) for k, v in value.items()}
+    return value
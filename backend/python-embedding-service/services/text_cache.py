@@ -0,0 +1,170 @@
+"""
+文本嵌入缓存 - 按文本内容缓存文本编码器的输出
+"""
+
+import re
+import threading
+import unicodedata
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 每个条目除向量和键之外的估算开销（ndarray 对象头、键字符串对象头、OrderedDict 槽位）
+_ENTRY_OVERHEAD_BYTES = 256
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    缓存键使用的文本归一化：NFKC + 合并连续空白 + 去除首尾空白
+
+    文本模型的 SentencePiece 分词本身按 NFKC 归一化并合并空白，
+    因此归一化后相同的文本编码结果相同（如全角/半角、多余空格）。
+    """
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def dedupe_texts(texts: List[str]) -> Tuple[List[str], List[int]]:
+    """
+    批内去重（按归一化后的文本）
+
+    Args:
+        texts: 文本列表
+
+    Returns:
+        (去重后的文本列表（保留首次出现的原文）, 每条原文在去重列表中的下标)
+    """
+    unique: List[str] = []
+    positions: Dict[str, int] = {}
+    inverse: List[int] = []
+    for text in texts:
+        key = normalize_text(text)
+        index = positions.get(key)
+        if index is None:
+            index = positions[key] = len(unique)
+            unique.append(text)
+        inverse.append(index)
+    return unique, inverse
+
+
+class TextEmbeddingCache:
+    """
+    LRU 文本嵌入缓存（按内存占用限额）
+
+    键为 文本模型名称 + 归一化文本，值为文本编码器输出的向量（只读副本）。
+    同一文本的编码结果是确定的，因此命中缓存不影响嵌入质量。
+    """
+
+    def __init__(self, max_mb: float = 64, model_name: str = ''):
+        """
+        初始化缓存
+
+        Args:
+            max_mb: 内存上限（MB，按向量字节数加条目开销估算），<= 0 表示禁用
+            model_name: 文本模型名称，作为键的一部分，切换模型后旧条目不会被命中
+        """
+        self.max_bytes = int(max(0.0, max_mb) * 1024 * 1024)
+        self.model_name = model_name
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _key(self, text: str) -> str:
+        return f'{self.model_name}\x00{normalize_text(text)}'
+
+    @staticmethod
+    def _entry_bytes(key: str, embedding: np.ndarray) -> int:
+        return embedding.nbytes + len(key) * 4 + _ENTRY_OVERHEAD_BYTES
+
+    def get_many(self, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        批量查找
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            (命中的 {下标: 向量}, 未命中的下标列表)
+        """
+        if not self.enabled:
+            return {}, list(range(len(texts)))
+
+        keys = [self._key(text) for text in texts]
+        hits: Dict[int, np.ndarray] = {}
+        misses: List[int] = []
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                embedding = self._entries.get(key)
+                if embedding is None:
+                    misses.append(i)
+                    continue
+                self._entries.move_to_end(key)
+                hits[i] = embedding
+            self._hits += len(hits)
+            self._misses += len(misses)
+
+        return hits, misses
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray):
+        """
+        批量写入
+
+        Args:
+            texts: 文本列表
+            embeddings: 对应的文本向量 (N, dim)
+        """
+        if not self.enabled:
+            return
+
+        entries = []
+        for text, embedding in zip(texts, embeddings):
+            embedding = np.array(embedding)
+            embedding.flags.writeable = False
+            entries.append((self._key(text), embedding))
+
+        with self._lock:
+            for key, embedding in entries:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._bytes -= self._entry_bytes(key, previous)
+                self._entries[key] = embedding
+                self._bytes += self._entry_bytes(key, embedding)
+            while self._bytes > self.max_bytes and self._entries:
+                key, embedding = self._entries.popitem(last=False)
+                self._bytes -= self._entry_bytes(key, embedding)
+                self._evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'model_name': self.model_name,
+                'max_mb': round(self.max_bytes / (1024 * 1024), 3),
+                'used_mb': round(self._bytes / (1024 * 1024), 3),
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,434 @@
+"""
+持久化文本嵌入存储 - 跨 worker 共享、跨重启复用的文本编码器输出
+
+目录结构（每个文本模型一个子目录，更换模型后旧数据不会被读取）：
+
+    <root>/<模型名>-<模型名哈希>/
+        meta.json     模型名称、维度、格式版本
+        vectors.f32   追加写入的 float32 向量，每行 dimension 个
+        keys.idx      追加写入的键（归一化文本的 16 字节 blake2b 摘要），第 i 个键对应第 i 行向量
+        keys.hash     键 -> 行号的开放寻址哈希表（由 keys.idx 派生，缺失或损坏时重建）
+
+读取通过只读内存映射完成，各 worker 共享页缓存，哈希表也不在进程内另建副本；写入时持有文件锁，
+先写向量再写键，最后登记到哈希表。键文件是提交标记，进程在两次写入之间崩溃时多出的半截向量
+会在下次写入前截掉；已提交但未登记的行在下次写入（或打开存储）时补登记。
+
+keys.hash 布局（小端）：
+
+    0    8 字节魔数 b'TSHASH01'
+    8    uint64 槽位数（2 的幂）
+    16   uint64 已登记的行数
+    64   uint32 槽位数组，取值为 行号 + 1，0 表示空槽
+
+键本身是均匀的摘要，取前 8 字节作哈希值，线性探测；负载因子超过 _MAX_LOAD 时写入方按两倍容量
+重建到临时文件后替换，读取方在未命中时发现文件已被替换（inode 变化）再重新映射。
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.text_cache import normalize_text
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT = 1
+
+_KEY_BYTES = 16
+_META_FILE = 'meta.json'
+_VECTORS_FILE = 'vectors.f32'
+_KEYS_FILE = 'keys.idx'
+_TABLE_FILE = 'keys.hash'
+_LOCK_FILE = '.lock'
+
+_TABLE_MAGIC = b'TSHASH01'
+_TABLE_HEADER = 64
+_MAX_LOAD = 0.5
+_MIN_CAPACITY = 1 << 16
+
+
+def text_key(text: str) -> bytes:
+    """存储键：归一化文本的 16 字节摘要"""
+    return hashlib.blake2b(normalize_text(text).encode('utf-8'), digest_size=_KEY_BYTES).digest()
+
+
+def store_path(root_dir: str, model_name: str) -> str:
+    """文本模型对应的存储目录"""
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '_', model_name).strip('_')[-64:]
+    digest = hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(root_dir, f'{slug}-{digest}')
+
+
+def _table_capacity(rows: int) -> int:
+    """容纳 rows 行（负载因子不超过 _MAX_LOAD）的槽位数"""
+    capacity = _MIN_CAPACITY
+    while rows > capacity * _MAX_LOAD:
+        capacity *= 2
+    return capacity
+
+
+class _KeyTable:
+    """keys.hash 的内存映射视图（写入方以可写方式映射，调用方持有文件锁）"""
+
+    def __init__(self, path: str, writable: bool = False):
+        """
+        Raises:
+            OSError: 文件不存在
+            ValueError: 文件头或大小不合法
+        """
+        with open(path, 'r+b' if writable else 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            size = os.fstat(f.fileno()).st_size
+            if size < _TABLE_HEADER:
+                raise ValueError(f"Text store hash table {path} is truncated")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+
+        magic, self.capacity = struct.unpack_from('<8sQ', self._mm, 0)
+        if (magic != _TABLE_MAGIC or self.capacity < 1 or self.capacity & (self.capacity - 1)
+                or size != _TABLE_HEADER + self.capacity * 4):
+            raise ValueError(f"Text store hash table {path} is corrupted")
+        self._mask = self.capacity - 1
+        self._slots = memoryview(self._mm)[_TABLE_HEADER:].cast('I')
+
+    @classmethod
+    def create(cls, path: str, capacity: int) -> '_KeyTable':
+        """创建空表（槽位区为稀疏文件，未写入的页不占磁盘）"""
+        with open(path, 'wb') as f:
+            f.write(struct.pack('<8sQQ', _TABLE_MAGIC, capacity, 0))
+            f.truncate(_TABLE_HEADER + capacity * 4)
+        return cls(path, writable=True)
+
+    @property
+    def indexed(self) -> int:
+        """已登记的行数"""
+        return struct.unpack_from('<Q', self._mm, 16)[0]
+
+    def set_indexed(self, rows: int):
+        struct.pack_into('<Q', self._mm, 16, rows)
+
+    def find(self, key: bytes, keys: mmap.mmap, key_rows: int) -> Optional[int]:
+        """
+        查找键对应的行号
+
+        Args:
+            key: 存储键
+            keys: keys.idx 的映射
+            key_rows: keys 映射覆盖的行数
+
+        Returns:
+            行号；不存在时为 None；槽位指向映射范围之外的新行时为 -1（调用方重新映射后重试）
+        """
+        pos = int.from_bytes(key[:8], 'little') & self._mask
+        while True:
+            slot = self._slots[pos]
+            if slot == 0:
+                return None
+            row = slot - 1
+            if row >= key_rows:
+                return -1
+            if keys[row * _KEY_BYTES:(row + 1) * _KEY_BYTES] == key:
+                return row
+            pos = (pos + 1) & self._mask
+
+    def insert(self, key: bytes, row: int, keys: mmap.mmap):
+        """登记 键 -> 行号（键已登记时跳过，崩溃后补登记是幂等的）"""
+        pos = int.from_bytes(key[:8], 'little') & self._mask
+        while True:
+            slot = self._slots[pos]
+            if slot == 0:
+                self._slots[pos] = row + 1
+                return
+            existing = slot - 1
+            if keys[existing * _KEY_BYTES:(existing + 1) * _KEY_BYTES] == key:
+                return
+            pos = (pos + 1) & self._mask
+
+
+class TextEmbeddingStore:
+    """
+    内容寻址的文本嵌入存储（只追加）
+
+    键 -> 行号的索引是所有 worker 共享映射的磁盘哈希表（keys.hash），每个进程只多占打开文件的少量开销，
+    条目数增长不会让每个 worker 各自的内存随之增长。
+    """
+
+    def __init__(self, root_dir: str, model_name: str, dimension: int, max_mb: float = 2048):
+        """
+        打开（或创建）存储
+
+        Args:
+            root_dir: 存储根目录
+            model_name: 文本模型名称，决定子目录
+            dimension: 文本向量维度
+            max_mb: 向量文件大小上限（MB），达到后不再追加，<= 0 表示不限制
+
+        Raises:
+            ValueError: 目录中已有数据的维度或格式与当前不一致
+        """
+        self.model_name = model_name
+        self.dimension = dimension
+        self.path = store_path(root_dir, model_name)
+        self.max_rows = int(max_mb * 1024 * 1024) // (dimension * 4) if max_mb > 0 else None
+
+        self._vectors_path = os.path.join(self.path, _VECTORS_FILE)
+        self._keys_path = os.path.join(self.path, _KEYS_FILE)
+        self._table_path = os.path.join(self.path, _TABLE_FILE)
+        self._row_bytes = dimension * 4
+
+        self._lock = threading.Lock()
+        self._table: Optional[_KeyTable] = None
+        self._keys: Optional[mmap.mmap] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._rows = 0
+        self._lock_file = None
+        self._pid: Optional[int] = None
+        self._full_logged = False
+
+        # 统计信息（进程内）
+        self._hits = 0
+        self._misses = 0
+        self._appended = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        self._check_meta()
+        with self._lock:
+            # 旧版存储没有哈希表，或上次写入在登记前崩溃：在文件锁内补齐
+            with self._file_lock():
+                self._index_rows(self._disk_rows())
+            self._refresh()
+
+        logger.info(f"Text embedding store opened: {self.path} ({self._rows} entries)")
+
+    def _check_meta(self):
+        meta_path = os.path.join(self.path, _META_FILE)
+        meta = {'format': STORE_FORMAT, 'model_name': self.model_name,
+                'dimension': self.dimension, 'dtype': 'float32'}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                existing = json.load(f)
+            if existing != meta:
+                raise ValueError(f"Text embedding store {self.path} does not match current model: {existing}")
+            return
+        tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def _disk_rows(self) -> int:
+        """磁盘上已提交的行数（键和向量都完整的行）"""
+        try:
+            keys = os.path.getsize(self._keys_path) // _KEY_BYTES
+            vectors = os.path.getsize(self._vectors_path) // self._row_bytes
+        except OSError:
+            return 0
+        return min(keys, vectors)
+
+    def _table_replaced(self) -> bool:
+        """哈希表文件是否已被其他进程重建替换"""
+        try:
+            return self._table is None or os.stat(self._table_path).st_ino != self._table.inode
+        except OSError:
+            return True
+
+    def _refresh(self):
+        """重新映射其他进程追加后的键、向量文件和重建后的哈希表（调用方持有 self._lock）"""
+        if self._table_replaced():
+            try:
+                self._table = _KeyTable(self._table_path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Text embedding store index unavailable: {e}")
+                self._table = None
+
+        rows = self._disk_rows()
+        if rows <= self._rows:
+            return
+        with open(self._keys_path, 'rb') as f:
+            self._keys = mmap.mmap(f.fileno(), rows * _KEY_BYTES, access=mmap.ACCESS_READ)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dimension))
+        self._rows = rows
+
+    def _find_rows(self, keys: List[bytes]) -> List[Optional[int]]:
+        """批量查找行号（调用方持有 self._lock），未命中时重新映射一次再查"""
+        rows = self._lookup(keys)
+        if any(row is None or row < 0 for row in rows):
+            self._refresh()
+            rows = self._lookup(keys)
+        return [row if row is not None and row >= 0 else None for row in rows]
+
+    def _lookup(self, keys: List[bytes]) -> List[Optional[int]]:
+        if self._table is None or self._keys is None:
+            return [None] * len(keys)
+        return [self._table.find(key, self._keys, self._rows) for key in keys]
+
+    def get_many(self, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        批量查找
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            (命中的 {下标: 向量}, 未命中的下标列表)
+        """
+        keys = [text_key(text) for text in texts]
+
+        with self._lock:
+            rows = self._find_rows(keys)
+            vectors = self._vectors
+
+        hit_positions = [i for i, row in enumerate(rows) if row is not None]
+        misses = [i for i, row in enumerate(rows) if row is None]
+        hits: Dict[int, np.ndarray] = {}
+        if hit_positions:
+            found = np.array(vectors[[rows[i] for i in hit_positions]])
+            hits = dict(zip(hit_positions, found))
+
+        with self._lock:
+            self._hits += len(hits)
+            self._misses += len(misses)
+        return hits, misses
+
+    def _file_lock(self):
+        # 锁与打开的文件描述绑定，fork 出的 worker 需要各自重新打开
+        if self._pid != os.getpid():
+            self._lock_file = open(os.path.join(self.path, _LOCK_FILE), 'a')
+            self._pid = os.getpid()
+        return _FileLock(self._lock_file)
+
+    def _index_rows(self, rows: int):
+        """
+        把 keys.idx 的前 rows 行登记到哈希表（调用方持有文件锁）
+
+        表不存在、损坏或负载因子将超过 _MAX_LOAD 时，按新容量重建到临时文件后替换。
+        """
+        try:
+            table = _KeyTable(self._table_path, writable=True)
+        except (OSError, ValueError):
+            table = None
+
+        capacity = _table_capacity(max(rows, self.max_rows or 0))
+        if table is None or rows > table.capacity * _MAX_LOAD:
+            tmp_path = f'{self._table_path}.{os.getpid()}.tmp'
+            table = _KeyTable.create(tmp_path, capacity if table is None else _table_capacity(rows * 2))
+            start = 0
+        else:
+            tmp_path = None
+            start = table.indexed
+        if start >= rows and tmp_path is None:
+            return
+
+        if rows > start:
+            with open(self._keys_path, 'rb') as f:
+                keys = mmap.mmap(f.fileno(), rows * _KEY_BYTES, access=mmap.ACCESS_READ)
+            for row in range(start, rows):
+                table.insert(keys[row * _KEY_BYTES:(row + 1) * _KEY_BYTES], row, keys)
+        table.set_indexed(rows)
+
+        if tmp_path is not None:
+            os.replace(tmp_path, self._table_path)
+            logger.info(f"Text embedding store index rebuilt: {rows} entries, {table.capacity} slots")
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray) -> int:
+        """
+        批量追加（已存在的文本跳过）
+
+        Args:
+            texts: 文本列表
+            embeddings: 对应的文本向量 (N, dimension)
+
+        Returns:
+            实际追加的条数
+        """
+        if not texts:
+            return 0
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), self.dimension)
+        keys = [text_key(text) for text in texts]
+
+        with self._lock, self._file_lock():
+            committed = self._disk_rows()
+            self._index_rows(committed)
+            self._refresh()
+
+            pending: Dict[bytes, int] = {}
+            for i, (key, row) in enumerate(zip(keys, self._find_rows(keys))):
+                if row is None and key not in pending:
+                    pending[key] = i
+            if self.max_rows is not None:
+                room = max(0, self.max_rows - committed)
+                if len(pending) > room:
+                    if not self._full_logged:
+                        logger.warning(f"Text embedding store is full ({committed} entries), skipping writes")
+                        self._full_logged = True
+                    pending = dict(list(pending.items())[:room])
+            if not pending:
+                return 0
+
+            # 截掉上次崩溃遗留的未提交数据，保证第 i 个键对应第 i 行
+            with open(self._vectors_path, 'ab') as vectors_file, open(self._keys_path, 'ab') as keys_file:
+                if vectors_file.tell() != committed * self._row_bytes:
+                    vectors_file.truncate(committed * self._row_bytes)
+                if keys_file.tell() != committed * _KEY_BYTES:
+                    keys_file.truncate(committed * _KEY_BYTES)
+                vectors_file.write(embeddings[list(pending.values())].tobytes())
+                vectors_file.flush()
+                keys_file.write(b''.join(pending.keys()))
+
+            self._index_rows(committed + len(pending))
+            self._refresh()
+            self._appended += len(pending)
+            return len(pending)
+
+    def contains_many(self, texts: List[str]) -> List[bool]:
+        """判断文本是否已在存储中（不计入命中统计）"""
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            return [row is not None for row in self._find_rows(keys)]
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def get_stats(self) -> Dict:
+        """获取存储统计"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'path': self.path,
+                'model_name': self.model_name,
+                'entries': self._rows,
+                'size_mb': round(self._rows * self._row_bytes / (1024 * 1024), 3),
+                'index_slots': self._table.capacity if self._table is not None else 0,
+                'max_entries': self.max_rows,
+                'hits': self._hits,
+                'misses': self._misses,
+                'appended': self._appended,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class _FileLock:
+    """fcntl 排他锁的上下文管理器（没有 fcntl 的平台上为空操作）"""
+
+    def __init__(self, lock_file):
+        self._lock_file = lock_file
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,11 @@
+"""
+单元测试公共配置：把服务目录加入 sys.path（与在服务目录下运行脚本时的导入方式一致）
+
+运行：
+    python -m pytest tests -q
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
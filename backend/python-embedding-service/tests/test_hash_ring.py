@@ -0,0 +1,74 @@
+"""一致性哈希环：分配完整、按归一化文本稳定，增删节点只移动约 1/N 的键"""
+
+from services.hash_ring import ConsistentHashRing
+
+TEXTS = [f'菜品 {i}' for i in range(20000)]
+
+
+def _owners(ring: ConsistentHashRing):
+    return [ring.node_for(text) for text in TEXTS]
+
+
+def test_empty_ring():
+    ring = ConsistentHashRing()
+    assert ring.node_for('宫保鸡丁') is None
+    assert ring.assign(['宫保鸡丁']) == {}
+
+
+def test_assign_covers_every_item_in_order():
+    ring = ConsistentHashRing([f'node-{i}' for i in range(4)])
+    shards = ring.assign(TEXTS[:1000])
+
+    indices = sorted(i for positions in shards.values() for i in positions)
+    assert indices == list(range(1000))
+    for node, positions in shards.items():
+        assert positions == sorted(positions)
+        assert all(ring.node_for(TEXTS[i]) == node for i in positions)
+
+
+def test_same_normalized_text_same_node():
+    ring = ConsistentHashRing([f'node-{i}' for i in range(4)])
+    assert ring.node_for('  宫保鸡丁 ') == ring.node_for('宫保鸡丁')
+
+
+def test_distribution_is_balanced():
+    ring = ConsistentHashRing([f'node-{i}' for i in range(4)])
+    counts = {}
+    for owner in _owners(ring):
+        counts[owner] = counts.get(owner, 0) + 1
+    assert len(counts) == 4
+    assert max(counts.values()) < 1.3 * len(TEXTS) / 4
+
+
+def test_adding_node_moves_about_one_nth_to_it():
+    ring = ConsistentHashRing([f'node-{i}' for i in range(4)])
+    before = _owners(ring)
+    ring.add('node-4')
+    after = _owners(ring)
+
+    moved = [(old, new) for old, new in zip(before, after) if old != new]
+    # 5 个节点时新节点应分到约 1/5 的键，且只有移到新节点的键改变归属
+    assert 0.12 < len(moved) / len(TEXTS) < 0.28
+    assert all(new == 'node-4' for _, new in moved)
+
+
+def test_removing_node_only_moves_its_keys():
+    ring = ConsistentHashRing([f'node-{i}' for i in range(5)])
+    before = _owners(ring)
+    ring.remove('node-2')
+    after = _owners(ring)
+
+    for old, new in zip(before, after):
+        if old != 'node-2':
+            assert new == old
+        else:
+            assert new != 'node-2'
+    assert 0.12 < before.count('node-2') / len(TEXTS) < 0.28
+
+
+def test_add_and_remove_are_idempotent():
+    ring = ConsistentHashRing(['a'])
+    assert not ring.add('a')
+    assert ring.remove('a')
+    assert not ring.remove('a')
+    assert len(ring) == 0
@@ -0,0 +1,54 @@
+"""紧凑输出格式：int8 逐向量量化的往返误差与边界情况"""
+
+import numpy as np
+import pytest
+
+from services.quantization import dequantize_int8, parse_output_format, quantize_int8
+
+
+def _normalized(n: int, dim: int = 256, seed: int = 0) -> np.ndarray:
+    x = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_round_trip_error_within_half_step():
+    x = _normalized(64)
+    q, scale, zero_point = quantize_int8(x)
+
+    assert q.dtype == np.int8 and q.shape == x.shape
+    assert scale.shape == (64,) and zero_point.shape == (64,)
+    restored = dequantize_int8(q, scale, zero_point)
+    assert restored.dtype == np.float32
+    assert np.all(np.abs(restored - x) <= scale[:, None] / 2 + 1e-6)
+
+
+def test_round_trip_preserves_cosine():
+    x = _normalized(64, seed=1)
+    restored = dequantize_int8(*quantize_int8(x))
+    cosine = np.sum(x * restored, axis=1) / np.linalg.norm(restored, axis=1)
+    assert cosine.min() > 0.9999
+
+
+def test_single_vector():
+    x = _normalized(1, seed=2)[0]
+    q, scale, zero_point = quantize_int8(x)
+    assert q.shape == x.shape and np.ndim(scale) == 0 and np.ndim(zero_point) == 0
+    assert np.allclose(dequantize_int8(q, scale, zero_point), x, atol=float(scale))
+
+
+@pytest.mark.parametrize('vector', [
+    np.zeros(8, dtype=np.float32),
+    np.full(8, 0.5, dtype=np.float32),
+    np.full(8, -0.5, dtype=np.float32),
+])
+def test_degenerate_vectors(vector):
+    q, scale, zero_point = quantize_int8(vector)
+    assert -128 <= int(zero_point) <= 127
+    assert np.allclose(dequantize_int8(q, scale, zero_point), vector, atol=float(scale))
+
+
+def test_parse_output_format():
+    assert parse_output_format(None) == 'float32'
+    assert parse_output_format(' INT8 ') == 'int8'
+    with pytest.raises(ValueError):
+        parse_output_format('int4')
@@ -0,0 +1,138 @@
+"""路由：按一致性哈希分片、副本失败后重新分发，以及按原顺序合并"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from services.router import EmbeddingRouter, ReplicaUnavailable, UpstreamError
+
+URLS = ['http://r1:5001', 'http://r2:5001', 'http://r3:5001']
+
+
+@pytest.fixture
+def router():
+    router = EmbeddingRouter(URLS, max_connections=4)
+    for url in URLS:
+        router.mark_up(url)
+    yield router
+    router._pool.shutdown(wait=True)
+
+
+def _items(n: int):
+    return [{'text': f'菜品 {i}'} for i in range(n)]
+
+
+def _fake_replicas(router, down=(), version='v2', degradation='none'):
+    """替换 _post_shard：每条返回 [菜品编号, 0]，down 中的副本不可用；返回每个副本收到的文本"""
+    received = {url: [] for url in URLS}
+    lock = threading.Lock()
+
+    def post_shard(replica, path, payload, headers, deadline):
+        texts = [item['text'] for item in payload['items']]
+        with lock:
+            received[replica.url].append(texts)
+        if replica.url in down:
+            raise ReplicaUnavailable(f'{replica.url} refused connection')
+        numbers = [float(text.split()[-1]) for text in texts]
+        return {
+            'embeddings': np.array([[n, 0.0] for n in numbers], dtype=np.float32),
+            'version': version,
+            'degradation': degradation,
+            'fingerprints': [f'fp-{int(n)}' for n in numbers],
+        }
+
+    router._post_shard = post_shard
+    return received
+
+
+def test_fan_out_merges_in_original_order(router):
+    received = _fake_replicas(router)
+    embeddings, metadata = router.fan_out('/embed_batch', _items(300), {'version': 'v2'}, {}, 'batch')
+
+    assert embeddings.shape == (300, 2)
+    assert embeddings[:, 0].tolist() == list(range(300))
+    assert metadata['fingerprints'] == [f'fp-{i}' for i in range(300)]
+    assert metadata['count'] == 300 and metadata['version'] == 'v2'
+    assert metadata['shards'] == 3
+    assert all(len(batches) == 1 for batches in received.values())
+
+
+def test_fan_out_redispatches_failed_shard(router):
+    received = _fake_replicas(router, down={'http://r2:5001'})
+    items = _items(300)
+    embeddings, metadata = router.fan_out('/embed_batch', items, {'version': 'v2'}, {}, 'batch')
+
+    # r2 的分片被标记下线并重新分发给其余副本，结果仍完整且有序
+    assert embeddings[:, 0].tolist() == list(range(300))
+    assert 'http://r2:5001' not in router.ring.nodes
+    assert not router.replicas['http://r2:5001'].healthy
+    assert metadata['shards'] == 4
+
+    failed = set(received['http://r2:5001'][0])
+    redispatched = set(received['http://r1:5001'][-1]) | set(received['http://r3:5001'][-1])
+    assert failed and failed <= redispatched
+    assert len(received['http://r2:5001']) == 1
+
+
+def test_fan_out_without_replicas(router):
+    _fake_replicas(router, down=set(URLS))
+    with pytest.raises(UpstreamError) as excinfo:
+        router.fan_out('/embed_batch', _items(10), {}, {}, 'batch')
+    assert excinfo.value.status == 503
+    assert router.ring.nodes == []
+
+
+def test_fan_out_downgrades_any_to_auto(router):
+    seen = []
+
+    def post_shard(replica, path, payload, headers, deadline):
+        seen.append(headers.get('X-Embedding-Degrade'))
+        return {'embeddings': np.zeros((len(payload['items']), 2), dtype=np.float32), 'version': 'v3'}
+
+    router._post_shard = post_shard
+    router.fan_out('/embed_batch', _items(50), {}, {'X-Embedding-Degrade': 'any'}, 'batch')
+    assert seen and set(seen) == {'auto'}
+
+
+def test_merge_orders_results_and_degradation():
+    parts = [
+        ([1, 3], {'embeddings': np.array([[1.0], [3.0]], dtype=np.float32), 'version': 'v2',
+                  'degradation': 'version_fallback', 'text_encoded': 1, 'fingerprints': ['b', 'd']}),
+        ([2, 0], {'embeddings': np.array([[2.0], [0.0]], dtype=np.float32), 'version': 'v2',
+                  'degradation': 'text_fallback,truncate', 'text_encoded': 2, 'fingerprints': ['c', 'a']}),
+    ]
+    embeddings, metadata = EmbeddingRouter._merge(4, parts)
+
+    assert embeddings[:, 0].tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert metadata['fingerprints'] == ['a', 'b', 'c', 'd']
+    assert metadata['degradation'] == 'truncate,text_fallback,version_fallback'
+    assert metadata['text_encoded'] == 3
+    assert metadata['dimension'] == 1 and metadata['shards'] == 2
+
+
+def test_merge_rejects_inconsistent_versions():
+    parts = [
+        ([0], {'embeddings': np.zeros((1, 4), dtype=np.float32), 'version': 'v3'}),
+        ([1], {'embeddings': np.zeros((1, 4), dtype=np.float32), 'version': 'v2'}),
+    ]
+    with pytest.raises(UpstreamError) as excinfo:
+        EmbeddingRouter._merge(2, parts)
+    assert excinfo.value.status == 502
+
+
+def test_merge_multi_orders_each_version():
+    parts = [
+        ([1], {'embeddings': {'v2': np.array([[1.0]], dtype=np.float32),
+                              'v3': np.array([[10.0, 1.0]], dtype=np.float32)},
+               'fingerprints': {'v2': ['b2'], 'v3': ['b3']}}),
+        ([0], {'embeddings': {'v2': np.array([[0.0]], dtype=np.float32),
+                              'v3': np.array([[10.0, 0.0]], dtype=np.float32)},
+               'fingerprints': {'v2': ['a2'], 'v3': ['a3']}}),
+    ]
+    embeddings, metadata = EmbeddingRouter._merge_multi(2, parts)
+
+    assert embeddings['v2'][:, 0].tolist() == [0.0, 1.0]
+    assert embeddings['v3'][:, 1].tolist() == [0.0, 1.0]
+    assert metadata['dimensions'] == {'v2': 1, 'v3': 2}
+    assert metadata['fingerprints'] == {'v2': ['a2', 'b2'], 'v3': ['a3', 'b3']}
@@ -0,0 +1,111 @@
+"""文本嵌入存储：追加与查找、崩溃后截掉未提交的尾部、补登记和重建哈希表"""
+
+import os
+
+import numpy as np
+import pytest
+
+from services import text_store
+from services.text_store import TextEmbeddingStore
+
+DIM = 4
+
+
+def _open(root) -> TextEmbeddingStore:
+    return TextEmbeddingStore(str(root), 'test-model', DIM, max_mb=0)
+
+
+def _vectors(n: int, start: int = 0) -> np.ndarray:
+    return np.arange(start * DIM, (start + n) * DIM, dtype=np.float32).reshape(n, DIM)
+
+
+def _texts(n: int, start: int = 0):
+    return [f'菜品 {i}' for i in range(start, start + n)]
+
+
+def _assert_rows(store: TextEmbeddingStore, n: int):
+    hits, misses = store.get_many(_texts(n))
+    assert misses == []
+    for i in range(n):
+        np.testing.assert_array_equal(hits[i], _vectors(1, i)[0])
+
+
+def test_put_and_get(tmp_path):
+    store = _open(tmp_path)
+    assert store.put_many(_texts(10), _vectors(10)) == 10
+    assert store.put_many(_texts(12), _vectors(12)) == 2
+    assert len(store) == 12
+    _assert_rows(store, 12)
+
+    hits, misses = store.get_many(['不存在'])
+    assert hits == {} and misses == [0]
+    assert store.contains_many(['菜品 3', '不存在']) == [True, False]
+
+
+def test_other_instance_sees_appends(tmp_path):
+    writer, reader = _open(tmp_path), _open(tmp_path)
+    writer.put_many(_texts(5), _vectors(5))
+    _assert_rows(reader, 5)
+
+
+def test_truncates_uncommitted_tail_after_crash(tmp_path):
+    store = _open(tmp_path)
+    store.put_many(_texts(5), _vectors(5))
+
+    # 模拟写入中途崩溃：向量写了一行半、键写了半个
+    with open(store._vectors_path, 'ab') as f:
+        f.write(b'\x7f' * (DIM * 4 + 6))
+    with open(store._keys_path, 'ab') as f:
+        f.write(b'\x01' * 7)
+
+    reopened = _open(tmp_path)
+    assert len(reopened) == 5
+    assert reopened.put_many(_texts(3, 5), _vectors(3, 5)) == 3
+
+    assert os.path.getsize(store._vectors_path) == 8 * DIM * 4
+    assert os.path.getsize(store._keys_path) == 8 * text_store._KEY_BYTES
+    _assert_rows(reopened, 8)
+    _assert_rows(_open(tmp_path), 8)
+
+
+def test_recovers_committed_rows_missing_from_index(tmp_path):
+    store = _open(tmp_path)
+    store.put_many(_texts(5), _vectors(5))
+
+    # 模拟键和向量已写完但未登记到哈希表就崩溃
+    with open(store._vectors_path, 'ab') as f:
+        f.write(_vectors(2, 5).tobytes())
+    with open(store._keys_path, 'ab') as f:
+        f.write(b''.join(text_store.text_key(text) for text in _texts(2, 5)))
+
+    _assert_rows(_open(tmp_path), 7)
+
+
+def test_rebuilds_missing_index(tmp_path):
+    store = _open(tmp_path)
+    store.put_many(_texts(20), _vectors(20))
+    os.remove(store._table_path)
+
+    reopened = _open(tmp_path)
+    assert os.path.exists(store._table_path)
+    _assert_rows(reopened, 20)
+
+
+def test_grows_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_store, '_MIN_CAPACITY', 8)
+    store = _open(tmp_path)
+    reader = _open(tmp_path)
+    initial = store.get_stats()['index_slots']
+
+    for start in range(0, 200, 25):
+        store.put_many(_texts(25, start), _vectors(25, start))
+
+    assert store.get_stats()['index_slots'] > initial
+    _assert_rows(store, 200)
+    _assert_rows(reader, 200)
+
+
+def test_rejects_dimension_change(tmp_path):
+    _open(tmp_path).put_many(_texts(1), _vectors(1))
+    with pytest.raises(ValueError):
+        TextEmbeddingStore(str(tmp_path), 'test-model', DIM * 2, max_mb=0)
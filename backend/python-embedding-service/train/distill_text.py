@@ -0,0 +1,249 @@
+"""
+蒸馏文本编码器（学生模型）
+让更小的多语言模型在菜品名称和描述上复现 mpnet（教师）的 768 维句向量，
+v2 拼接和 v3 融合网络无需改动即可使用（PYTHON_EMBEDDING_TEXT_STUDENT_DIR）
+
+学生模型两种来源：
+- 默认：复制教师并只保留均匀间隔的 --layers 层 Transformer（同宽度，初始化即接近教师）
+- --student_model：更窄的预训练多语言模型（如 paraphrase-multilingual-MiniLM-L12-v2），
+  维度不同时追加线性层映射到教师维度
+
+损失为学生与教师句向量的 MSE。留出集上报告教师-学生余弦一致性、top-k 近邻重合率以及吞吐加速比，
+结果随模型写入输出目录的 distill.json。
+
+用法：
+    python train/distill_text.py --layers 4
+    python train/distill_text.py --catalog catalog.jsonl --student_model sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import shutil
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+from sentence_transformers import SentenceTransformer
+from sentence_transformers import models as st_models
+from sentence_transformers.util import batch_to_device
+from tqdm import tqdm
+
+from config import Config
+from encoders.text_encoder import STUDENT_INFO
+from models.artifact import state_dict_digest
+from models.precision import module_size_mb
+from precision_report import agreement, load_corpus
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def transformer_layers(model: SentenceTransformer) -> nn.ModuleList:
+    """SentenceTransformer 第一个模块（HuggingFace Transformer）的编码器层"""
+    return model[0].auto_model.encoder.layer
+
+
+def select_layers(num_layers: int, keep: int) -> List[int]:
+    """均匀间隔地选取 keep 层（包含第一层和最后一层）"""
+    if not 0 < keep <= num_layers:
+        raise ValueError(f"--layers must be in [1, {num_layers}], got {keep}")
+    return sorted(set(np.linspace(0, num_layers - 1, keep).round().astype(int).tolist()))
+
+
+def build_student(teacher_name: str,
+                  teacher_dim: int,
+                  layers: int,
+                  student_model: str = None) -> Tuple[SentenceTransformer, Dict]:
+    """
+    构造学生模型
+    
+    Returns:
+        (学生模型, 结构信息)
+    """
+    if student_model:
+        base = SentenceTransformer(student_model)
+        modules = list(base)
+        dim = base.get_sentence_embedding_dimension()
+        if dim != teacher_dim:
+            modules.append(st_models.Dense(dim, teacher_dim, bias=True, activation_function=nn.Identity()))
+        student = SentenceTransformer(modules=modules)
+        structure = {'base': student_model, 'layers': len(transformer_layers(student)), 'projection': dim != teacher_dim}
+        return student, structure
+    
+    student = SentenceTransformer(teacher_name)
+    all_layers = transformer_layers(student)
+    kept = select_layers(len(all_layers), layers)
+    student[0].auto_model.encoder.layer = nn.ModuleList([all_layers[i] for i in kept])
+    student[0].auto_model.config.num_hidden_layers = len(kept)
+    return student, {'base': teacher_name, 'layers': len(kept), 'teacher_layers_kept': kept, 'projection': False}
+
+
+def embed(model: SentenceTransformer, texts: List[str], device: str) -> torch.Tensor:
+    """前向得到句向量（保留梯度）"""
+    features = batch_to_device(model.tokenize(texts), device)
+    return model(features)['sentence_embedding']
+
+
+def train_epoch(student: SentenceTransformer,
+                texts: List[str],
+                targets: torch.Tensor,
+                optimizer: torch.optim.Optimizer,
+                batch_size: int,
+                device: str) -> float:
+    """训练一轮，返回平均 MSE"""
+    student.train()
+    criterion = nn.MSELoss()
+    order = np.random.permutation(len(texts))
+    total_loss = 0.0
+    
+    for start in tqdm(range(0, len(texts), batch_size), desc='Distilling'):
+        index = order[start:start + batch_size]
+        outputs = embed(student, [texts[i] for i in index], device)
+        loss = criterion(outputs, targets[index])
+        
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        
+        total_loss += loss.item() * len(index)
+    
+    return total_loss / len(texts)
+
+
+def throughput(model: SentenceTransformer, texts: List[str], batch_size: int) -> float:
+    """推理吞吐（条/秒，先用一批预热）"""
+    model.eval()
+    with torch.no_grad():
+        model.encode(texts[:batch_size], batch_size=batch_size)
+        start = time.perf_counter()
+        model.encode(texts, batch_size=batch_size)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distill a smaller text encoder from the teacher')
+    parser.add_argument('--catalog', type=str, default=None,
+                        help='Corpus export (JSON / JSONL); default: dishes from the database')
+    parser.add_argument('--teacher', type=str, default=Config.TEXT_MODEL,
+                        help='Teacher model name')
+    parser.add_argument('--layers', type=int, default=4,
+                        help='Transformer layers kept from the teacher')
+    parser.add_argument('--student_model', type=str, default=None,
+                        help='Narrower pretrained model to start from instead of teacher layers')
+    parser.add_argument('--output', type=str, default=os.path.join(Config.MODEL_DIR, 'text_student'),
+                        help='Output directory')
+    parser.add_argument('--epochs', type=int, default=10,
+                        help='Number of training epochs')
+    parser.add_argument('--batch_size', type=int, default=64,
+                        help='Batch size')
+    parser.add_argument('--lr', type=float, default=5e-5,
+                        help='Learning rate')
+    parser.add_argument('--holdout', type=float, default=0.1,
+                        help='Fraction of texts held out for evaluation')
+    parser.add_argument('--limit', type=int, default=200000,
+                        help='Max corpus size')
+    parser.add_argument('--top_k', type=int, default=10,
+                        help='Neighbours compared per item in the report')
+    parser.add_argument('--device', type=str, default=None,
+                        help='Device (cuda/cpu), None for auto')
+    
+    args = parser.parse_args()
+    
+    device = args.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    logger.info(f"Using device: {device}")
+    
+    # 1. 语料（去重）
+    source, texts, _ = load_corpus(args.catalog, from_db=not args.catalog, limit=args.limit)
+    texts = list(dict.fromkeys(texts))
+    if len(texts) < 100:
+        logger.error(f"Too few texts: {len(texts)}. Need at least 100.")
+        return
+    
+    order = np.random.default_rng(0).permutation(len(texts))
+    n_holdout = max(int(len(texts) * args.holdout), args.top_k + 1)
+    eval_texts = [texts[i] for i in order[:n_holdout]]
+    train_texts = [texts[i] for i in order[n_holdout:]]
+    logger.info(f"Corpus: {source} ({len(train_texts)} train, {len(eval_texts)} holdout)")
+    
+    # 2. 教师向量（只算一次）
+    teacher = SentenceTransformer(args.teacher).to(device).eval()
+    teacher_dim = teacher.get_sentence_embedding_dimension()
+    with torch.no_grad():
+        train_targets = teacher.encode(train_texts, batch_size=args.batch_size, convert_to_tensor=True,
+                                       device=device).float()
+        eval_targets = teacher.encode(eval_texts, batch_size=args.batch_size, convert_to_numpy=True, device=device)
+    
+    # 3. 学生模型
+    student, structure = build_student(args.teacher, teacher_dim, args.layers, args.student_model)
+    student.to(device)
+    logger.info(f"Student: {structure} ({sum(p.numel() for p in student.parameters())} parameters, "
+                f"teacher {sum(p.numel() for p in teacher.parameters())})")
+    
+    # 4. 训练，保留留出集余弦最高的权重
+    optimizer = torch.optim.AdamW(student.parameters(), lr=args.lr)
+    best_cosine, best_state = -1.0, None
+    
+    for epoch in range(args.epochs):
+        train_loss = train_epoch(student, train_texts, train_targets, optimizer, args.batch_size, device)
+        
+        student.eval()
+        with torch.no_grad():
+            eval_outputs = student.encode(eval_texts, batch_size=args.batch_size, convert_to_numpy=True, device=device)
+        cosine = agreement(eval_targets, eval_outputs, k=0)['cosine_mean']
+        logger.info(f"Epoch {epoch + 1}/{args.epochs} - train MSE: {train_loss:.6f}, holdout cosine: {cosine:.4f}")
+        
+        if cosine > best_cosine:
+            best_cosine = cosine
+            best_state = {name: tensor.detach().clone() for name, tensor in student.state_dict().items()}
+    
+    student.load_state_dict(best_state)
+    student.eval()
+    
+    # 5. 报告：一致性与加速比
+    with torch.no_grad():
+        eval_outputs = student.encode(eval_texts, batch_size=args.batch_size, convert_to_numpy=True, device=device)
+    teacher_tps = throughput(teacher, eval_texts, args.batch_size)
+    student_tps = throughput(student, eval_texts, args.batch_size)
+    report = {
+        'teacher': args.teacher,
+        'student': structure,
+        'dimension': teacher_dim,
+        'corpus': {'source': source, 'train': len(train_texts), 'holdout': len(eval_texts)},
+        'epochs': args.epochs,
+        'holdout': agreement(eval_targets, eval_outputs, args.top_k),
+        'teacher_texts_per_second': round(teacher_tps, 1),
+        'student_texts_per_second': round(student_tps, 1),
+        'speedup': round(student_tps / teacher_tps, 2),
+        'teacher_size_mb': round(module_size_mb(teacher), 1),
+        'student_size_mb': round(module_size_mb(student), 1),
+        'device': device,
+        'weights_sha256': state_dict_digest(student.state_dict()),
+        'trained_at': time.time(),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    
+    # 6. 保存（先写临时目录再替换，服务不会读到一半的模型）
+    work_dir = f'{args.output}.tmp'
+    shutil.rmtree(work_dir, ignore_errors=True)
+    student.save(work_dir)
+    with open(os.path.join(work_dir, STUDENT_INFO), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(args.output, ignore_errors=True)
+    os.replace(work_dir, args.output)
+    
+    logger.info(f"✓ Saved student to {args.output} (PYTHON_EMBEDDING_TEXT_STUDENT_DIR={args.output})")
+    logger.info(f"  Holdout cosine: {report['holdout']['cosine_mean']:.4f}, speedup: {report['speedup']}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -19,8 +19,8 @@ import argparse
 from datetime import datetime
 
 from encoders import TextEncoder, NumericEncoder
+from models.artifact import artifact_path_for, export_checkpoint
 from models.fusion import FeatureFusionMLP
-from train.dataset import DishDataset, get_db_config_from_env
 
 logging.basicConfig(
     level=logging.INFO,
@@ -218,9 +218,20 @@ def main():
                         help='Minimum interactions for a dish')
     parser.add_argument('--device', type=str, default=None,
                         help='Device (cuda/cpu), None for auto')
+    parser.add_argument('--no_export', action='store_true',
+                        help='Do not export the inference artifact after training')
+    parser.add_argument('--export_only', action='store_true',
+                        help='Only export the inference artifact from an existing --output checkpoint')
     
     args = parser.parse_args()
     
+    if args.export_only:
+        header = export_checkpoint(args.output)
+        logger.info(f"✓ Exported {artifact_path_for(args.output)} (weights sha256: {header['weights_sha256'][:16]})")
+        return
+    
+    from train.dataset import DishDataset, get_db_config_from_env
+    
     # 设备
     if args.device:
         device = args.device
@@ -341,6 +352,11 @@ def main():
     logger.info(f"Best Test Loss: {best_loss:.4f}")
     logger.info(f"Best Test Accuracy: {best_accuracy:.4f}")
     logger.info(f"Model saved to: {args.output}")
+    
+    # 9. 导出推理产物（最佳检查点，TorchScript）
+    if not args.no_export and os.path.exists(args.output):
+        export_checkpoint(args.output)
+        logger.info(f"Inference artifact saved to: {artifact_path_for(args.output)}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,122 @@
+"""
+TasteInsight 嵌入服务 - 持久化文本嵌入存储预热
+
+从菜品目录导出文件（或数据库）批量编码文本并写入持久化存储，
+部署新版本或更换文本模型后运行一次，服务启动后即可直接命中。
+
+目录导出文件格式（JSON 数组或每行一个 JSON 的 JSONL）：
+    {"text": "宫保鸡丁 麻辣鲜香"}
+    {"name": "宫保鸡丁", "description": "麻辣鲜香"}
+    "宫保鸡丁 麻辣鲜香"
+
+用法：
+    python warm_text_store.py catalog.jsonl
+    python warm_text_store.py --from-db
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Iterable, List
+
+from config import Config
+from encoders import TextEncoder
+from services.text_cache import dedupe_texts
+from services.text_store import TextEmbeddingStore
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def item_text(item) -> str:
+    """目录条目 -> 文本（与训练数据集的 name + description 拼接方式一致）"""
+    if isinstance(item, str):
+        return item
+    if 'text' in item:
+        return item['text'] or ''
+    return f"{item.get('name') or ''} {item.get('description') or ''}".strip()
+
+
+def load_catalog(path: str) -> List[str]:
+    """读取目录导出文件（JSON 数组或 JSONL，'-' 表示标准输入）"""
+    return [item_text(item) for item in load_catalog_items(path)]
+
+
+def load_catalog_items(path: str) -> list:
+    """读取目录导出文件的原始条目"""
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        content = f.read()
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    stripped = content.lstrip()
+    if stripped.startswith('['):
+        return json.loads(stripped)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def load_from_db() -> List[str]:
+    """从数据库读取全部菜品文本（数据库配置同训练脚本）"""
+    from train.dataset import DishDataset, get_db_config_from_env
+
+    dataset = DishDataset(db_config=get_db_config_from_env(), min_interactions=0)
+    return [dish['text'] for dish in dataset.load_dishes()]
+
+
+def warm(texts: Iterable[str], store: TextEmbeddingStore, encoder: TextEncoder, batch_size: int = 256) -> int:
+    """
+    编码存储中缺失的文本并写入
+
+    Returns:
+        新写入的条数
+    """
+    unique, _ = dedupe_texts([text for text in texts if text])
+    missing = [text for text, present in zip(unique, store.contains_many(unique)) if not present]
+    logger.info(f"{len(unique)} unique texts, {len(missing)} not in store")
+
+    written = 0
+    start = time.perf_counter()
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i:i + batch_size]
+        written += store.put_many(batch, encoder.encode(batch, batch_size=min(batch_size, 64)))
+        logger.info(f"  {min(i + batch_size, len(missing))}/{len(missing)} "
+                    f"({time.perf_counter() - start:.1f}s)")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm up the persistent text embedding store')
+    parser.add_argument('catalog', nargs='?', help="Catalog export (JSON / JSONL), '-' for stdin")
+    parser.add_argument('--from-db', action='store_true', help='Read dish texts from the database')
+    parser.add_argument('--store-dir', default=Config.TEXT_STORE_DIR, help='Store root directory')
+    parser.add_argument('--batch-size', type=int, default=256, help='Texts per encode/write batch')
+    parser.add_argument('--device', default=Config.DEVICE, help='Device (cuda/cpu), None for auto')
+    args = parser.parse_args()
+
+    if not args.catalog and not args.from_db:
+        parser.error('either a catalog file or --from-db is required')
+    if not args.store_dir:
+        parser.error('text store is disabled (PYTHON_EMBEDDING_TEXT_STORE_DIR is empty)')
+
+    texts = load_from_db() if args.from_db else load_catalog(args.catalog)
+
+    encoder = TextEncoder(model_name=Config.TEXT_MODEL, device=args.device, precision=Config.TEXT_PRECISION,
+                          backend=Config.TEXT_BACKEND, onnx_dir=Config.ONNX_DIR,
+                          student_dir=Config.TEXT_STUDENT_DIR or None,
+                          fast_layers=Config.TEXT_FAST_LAYERS, fast_adapter_dir=Config.MODEL_DIR)
+    store = TextEmbeddingStore(args.store_dir, encoder.cache_key, encoder.dimension,
+                               max_mb=Config.TEXT_STORE_MAX_MB)
+
+    written = warm(texts, store, encoder, args.batch_size)
+    logger.info(f"✓ Wrote {written} entries, store now has {len(store)} entries: {store.path}")
+
+
+if __name__ == '__main__':
+    main()